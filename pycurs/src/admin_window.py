@@ -1,10 +1,19 @@
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                           QLabel, QTextEdit, QPushButton, QListWidget, QTabWidget,
+                           QLabel, QTextEdit, QPushButton, QListView, QListWidget, QTabWidget,
                            QLineEdit, QMessageBox, QSpinBox, QFileDialog, QComboBox, QGroupBox,
                            QDialog, QDialogButtonBox, QCheckBox, QListWidgetItem)
 from PyQt6.QtCore import Qt
 import markdown
 from utils import export_to_pdf, export_to_html, export_to_markdown
+from background import BackgroundLoader
+from events import (BulkInserted, ChangesLost, DocumentAdded, DocumentDeleted,
+                    DocumentsRestored, DocumentUpdated, DocumentVersionDeleted, FaqAdded,
+                    FaqDeleted, FaqUpdated, GlossaryAdded, GlossaryDeleted, GlossaryUpdated,
+                    QuestionAnswered, QuestionAsked, QuestionDeleted, RatingAdded,
+                    SystemVersionChanged, SystemVersionCreated, SystemVersionDeleted, UserAdded,
+                    UserDeleted)
+from qt_events import QtEventBridge
+from list_models import ListRow, PagedListModel, current_id
 import os
 import shutil
 
@@ -14,7 +23,37 @@ class AdminWindow(QMainWindow):
         self.db = db
         self.user_id = user_id
         self.main_window = main_window
+        # Списки вкладок загружаются в потоках пула, см. load_data
+        self.loader = BackgroundLoader(self)
+        self.create_models()
         self.init_ui()
+        # Изменения данных обновляют только затронутые строки списков
+        self.events = QtEventBridge(db.events, self)
+        self.events.received.connect(self.on_db_event)
+        self.event_handlers = {
+            DocumentAdded: self.on_document_changed,
+            DocumentUpdated: self.on_document_changed,
+            DocumentDeleted: lambda event: self.models['documents'].remove(event.id),
+            DocumentVersionDeleted: self.on_document_version_deleted,
+            DocumentsRestored: self.on_documents_restored,
+            GlossaryAdded: self.on_glossary_changed,
+            GlossaryUpdated: self.on_glossary_changed,
+            GlossaryDeleted: lambda event: self.models['glossary'].remove(event.id),
+            FaqAdded: self.on_faq_changed,
+            FaqUpdated: self.on_faq_changed,
+            FaqDeleted: lambda event: self.models['faq'].remove(event.id),
+            QuestionAsked: self.on_question_changed,
+            QuestionAnswered: self.on_question_changed,
+            QuestionDeleted: lambda event: self.models['questions'].remove(event.id),
+            RatingAdded: self.on_rating_added,
+            UserAdded: self.on_user_added,
+            UserDeleted: self.on_user_deleted,
+            SystemVersionCreated: self.on_system_version_created,
+            SystemVersionChanged: self.on_system_version_changed,
+            SystemVersionDeleted: lambda event: self.models['versions'].remove(event.id),
+            BulkInserted: self.on_bulk_inserted,
+            ChangesLost: lambda event: self.load_data(),
+        }
 
     def init_ui(self):
         central_widget = QWidget()
@@ -25,8 +64,8 @@ class AdminWindow(QMainWindow):
         left_layout = QVBoxLayout()
         
         sections_label = QLabel('Разделы документации')
-        self.sections_list = QListWidget()
-        self.sections_list.itemClicked.connect(self.load_document)
+        self.sections_list = self.list_view('documents')
+        self.sections_list.clicked.connect(self.load_document)
         
         buttons_layout = QHBoxLayout()
         add_section_btn = QPushButton('Добавить раздел')
@@ -77,8 +116,8 @@ class AdminWindow(QMainWindow):
         # Добавляем список версий документа
         versions_group = QGroupBox('Версии документа')
         versions_layout = QVBoxLayout()
-        self.doc_versions_list = QListWidget()
-        self.doc_versions_list.itemDoubleClicked.connect(self.restore_doc_version)
+        self.doc_versions_list = self.list_view('doc_versions')
+        self.doc_versions_list.doubleClicked.connect(lambda index: self.restore_doc_version())
         
         # Кнопки управления версиями документа
         doc_versions_buttons = QHBoxLayout()
@@ -101,7 +140,10 @@ class AdminWindow(QMainWindow):
         # Добавляем группу для отображения оценок
         ratings_group = QGroupBox('Оценки пользователей')
         ratings_layout = QVBoxLayout()
+        # Средняя оценка и распределение оценок из сводки document_rating_stats
+        self.rating_summary = QLabel()
         self.ratings_list = QListWidget()
+        ratings_layout.addWidget(self.rating_summary)
         ratings_layout.addWidget(self.ratings_list)
         ratings_group.setLayout(ratings_layout)
         
@@ -129,7 +171,7 @@ class AdminWindow(QMainWindow):
         # Список пользователей
         users_group = QGroupBox('Пользователи')
         users_list_layout = QVBoxLayout()
-        self.users_list = QListWidget()
+        self.users_list = self.list_view('users')
         
         users_buttons_layout = QHBoxLayout()
         add_user_btn = QPushButton('Добавить пользователя')
@@ -187,8 +229,8 @@ class AdminWindow(QMainWindow):
         # Список FAQ
         faq_list_group = QGroupBox('Список FAQ')
         faq_list_layout = QVBoxLayout()
-        self.faq_list = QListWidget()
-        self.faq_list.itemClicked.connect(self.show_faq)
+        self.faq_list = self.list_view('faq')
+        self.faq_list.clicked.connect(self.show_faq)
         faq_list_layout.addWidget(self.faq_list)
         faq_list_group.setLayout(faq_list_layout)
         
@@ -203,8 +245,8 @@ class AdminWindow(QMainWindow):
         # Список вопросов
         questions_group = QGroupBox('Вопросы пользователей')
         questions_list_layout = QVBoxLayout()
-        self.questions_list = QListWidget()
-        self.questions_list.itemClicked.connect(self.show_question_details)
+        self.questions_list = self.list_view('questions')
+        self.questions_list.clicked.connect(self.show_question_details)
         
         # Поле для ответа
         answer_group = QGroupBox('Ответ на вопрос')
@@ -239,8 +281,8 @@ class AdminWindow(QMainWindow):
         # Список версий
         versions_group = QGroupBox('Версии системы')
         versions_list_layout = QVBoxLayout()
-        self.versions_list = QListWidget()
-        self.versions_list.itemClicked.connect(self.show_version_details)
+        self.versions_list = self.list_view('versions')
+        self.versions_list.clicked.connect(self.show_version_details)
         
         # Кнопки управления версиями системы
         versions_buttons = QHBoxLayout()
@@ -291,73 +333,238 @@ class AdminWindow(QMainWindow):
         # Загружаем данные
         self.load_data()
 
+    def create_models(self):
+        """Создает модели списков; строки читаются из базы страницами, см. list_models.py."""
+        records = self.db.records
+        # Подстрока фильтра глоссария: ищется в базе в термине или определении
+        self.glossary_text = ''
+
+        def model(fetch, describe, descending=False):
+            return PagedListModel(fetch, describe, descending, parent=self)
+
+        self.models = {
+            # Список документов без текстов
+            'documents': model(
+                lambda after, limit: records.documents(
+                    columns=('id', 'title'), after=after, limit=limit),
+                lambda doc: ListRow(doc.id, doc.title, (doc.title, doc.id))
+            ),
+            'glossary': model(
+                lambda after, limit: records.glossary_terms(
+                    columns=('id', 'term', 'definition'), text=self.glossary_text,
+                    after=after, limit=limit),
+                lambda term: ListRow(term.id, f"{term.term}: {term.definition}",
+                                     (term.term, term.id))
+            ),
+            'faq': model(
+                lambda after, limit: records.faqs(
+                    columns=('id', 'question', 'answer'), after=after, limit=limit),
+                lambda faq: ListRow(faq.id, f"Q: {faq.question}\nA: {faq.answer}",
+                                    (faq.question, faq.id))
+            ),
+            # Вопросы пользователей от новых к старым
+            'questions': model(
+                lambda after, limit: records.questions(
+                    columns=self.QUESTION_COLUMNS, after=after, limit=limit),
+                self.describe_question, descending=True
+            ),
+            'users': model(
+                lambda after, limit: records.users(
+                    columns=('id', 'username', 'is_admin'), after=after, limit=limit),
+                lambda user: ListRow(
+                    user.id,
+                    f"{user.username} ({'Админ' if user.is_admin else 'Пользователь'})",
+                    (user.id,)
+                )
+            ),
+            # Заголовки версий с числом изменений; сами изменения - в show_version_details
+            'versions': model(
+                lambda after, limit: records.system_versions(
+                    columns=self.VERSION_COLUMNS, after=after, limit=limit),
+                self.describe_version, descending=True
+            ),
+            # Запрос версий документа задает load_document_details
+            'doc_versions': model(
+                lambda after, limit: [],
+                lambda version: ListRow(
+                    version.id,
+                    f"Версия {version.version} ({version.username}) - {version.created_at}",
+                    (version.version,)
+                ),
+                descending=True
+            ),
+        }
+
+    # Колонки строки списка вопросов, включая ключ сортировки
+    QUESTION_COLUMNS = ('id', 'status', 'username', 'question', 'created_at')
+
+    # Колонки строки списка версий системы
+    VERSION_COLUMNS = ('id', 'version_number', 'username', 'change_count')
+
+    @staticmethod
+    def describe_version(version):
+        return ListRow(
+            version.id,
+            f"Версия {version.version_number} ({version.username or 'пользователь удален'}), "
+            f"изменений: {version.change_count}",
+            (version.id,)
+        )
+
+    @staticmethod
+    def describe_question(q):
+        status = '[Отвечен]' if q.status == 'answered' else '[Новый]'
+        return ListRow(q.id, f"{status} От {q.username}: {q.question}", (q.created_at, q.id))
+
+    def list_view(self, section, model=None):
+        """Создает представление списка раздела."""
+        view = QListView()
+        view.setModel(model or self.models[section])
+        # Строки одной высоты: представлению не нужно измерять каждую
+        view.setUniformItemSizes(True)
+        return view
+
     def load_data(self):
-        # Загружаем документы
-        documents = self.db.get_all_documents()
-        self.sections_list.clear()
-        for doc in documents:
-            self.sections_list.addItem(doc[1])  # doc[1] - title
-            
-        # Загружаем термины глоссария
-        terms = self.db.get_all_glossary_terms()
-        self.glossary_list.clear()
-        for term in terms:
-            self.glossary_list.addItem(f"{term[1]}: {term[2]}")  # term[1] - term name, term[2] - definition
-            
-        # Загружаем FAQ
-        faqs = self.db.get_all_faq()
-        self.faq_list.clear()
-        for faq in faqs:
-            item = QListWidgetItem(f"Q: {faq[1]}\nA: {faq[2]}")  # faq[1] - question, faq[2] - answer
-            item.setData(Qt.ItemDataRole.UserRole, faq[0])  # faq[0] - id
-            self.faq_list.addItem(item)
+        """Загружает первые страницы списков всех вкладок в фоновых потоках.
+
+        Пока данные вкладки не пришли, в ее списке показывается заглушка.
+        Результаты более раннего вызова, пришедшие после нового, отбрасываются.
+        """
+        for section in ('documents', 'glossary', 'faq', 'questions', 'users', 'versions'):
+            self.load_section(section)
+
+        # Версии и оценки документа, если выбран документ
+        if hasattr(self, 'current_doc_id'):
+            self.load_document_details(self.current_doc_id)
+
+    def load_section(self, section):
+        """Показывает заглушку в списке раздела и читает в фоне его первую страницу."""
+        model = self.models[section]
+        model.show_placeholder('Загрузка...')
+        fetch = model.fetch
+        self.loader.load(
+            section, lambda: fetch(None, model.page_size), model.set_first_page,
+            lambda error: model.show_placeholder(f'Ошибка загрузки: {error}')
+        )
+
+    def can_patch(self, section):
+        """Можно ли менять строки раздела по событию, не загружая его заново.
+
+        Пока раздел загружается или в нем показана ошибка, строки менять нельзя:
+        вместо этого раздел загружается заново и получит изменение из базы.
+        Так же и при фильтре глоссария: подходит ли запись, решает запрос к базе.
+        """
+        if (self.loader.is_loading(section) or self.models[section].placeholder is not None
+                or section == 'glossary' and self.glossary_text):
+            self.load_section(section)
+            return False
+        return True
+
+    def put_row(self, section, record, item_id):
+        """Обновляет по событию строку записи item_id; record=None - запись удалена."""
+        if not self.can_patch(section):
+            return
+        if record is None:
+            self.models[section].remove(item_id)
+        else:
+            self.models[section].put(record)
+
+    def show_placeholder(self, list_widget, text):
+        """Заменяет содержимое списка строкой-заглушкой, которую нельзя выбрать."""
+        list_widget.clear()
+        item = QListWidgetItem(text)
+        item.setFlags(Qt.ItemFlag.NoItemFlags)
+        list_widget.addItem(item)
+
+    def fill_ratings(self, result):
+        summary, ratings = result
+        if summary and summary[0]:
+            count, _, average, stars, _ = summary
+            histogram = ', '.join(f'{n}: {stars[n - 1]}' for n in range(5, 0, -1))
+            self.rating_summary.setText(
+                f'Средняя оценка {average:.1f} из {count} ({histogram})'
+            )
+        else:
+            self.rating_summary.clear()
+        self.ratings_list.clear()
+        if not ratings:
+            self.ratings_list.addItem("Нет оценок")
+            return
             
-        # Загружаем вопросы пользователей с ответами
-        questions = self.db.get_user_questions_with_answers()
-        self.questions_list.clear()
-        for q in questions:
-            status = '[Отвечен]' if q[3] == 'answered' else '[Новый]'
-            self.questions_list.addItem(f"{status} От {q[5]}: {q[2]}")  # q[5] - username, q[2] - question
-
-        # Загружаем список пользователей
-        try:
-            users = self.db.get_all_users()
-            self.users_list.clear()
-            for user in users:
-                # Проверяем, является ли пользователь админом
-                is_admin = bool(user[3])  # Преобразуем в булево значение
-                item = QListWidgetItem(f"{user[1]} ({'Админ' if is_admin else 'Пользователь'})")
-                item.setData(Qt.ItemDataRole.UserRole, user[0])  # Сохраняем ID пользователя
-                self.users_list.addItem(item)
-        except Exception as e:
-            QMessageBox.warning(self, 'Ошибка', f'Ошибка при загрузке пользователей: {str(e)}')
+        for rating in ratings:
+            comment = f" - {rating.comment}" if rating.comment else ""
+            self.ratings_list.addItem(f"{rating.username}: {rating.rating}/5{comment}")
 
-        # Загружаем версии системы
-        try:
-            versions = self.db.get_all_versions()
-            self.versions_list.clear()
-            for version in versions:
-                item = QListWidgetItem(f"Версия {version[1]} ({version[6]})")  # version[1] - number, version[6] - username
-                item.setData(Qt.ItemDataRole.UserRole, version[0])  # version[0] - id
-                self.versions_list.addItem(item)
-        except Exception as e:
-            QMessageBox.warning(self, 'Ошибка', f'Ошибка при загрузке версий: {str(e)}')
+    def on_db_event(self, event):
+        """Обновляет строки списков, затронутые изменением в базе."""
+        handler = self.event_handlers.get(type(event))
+        if handler is not None:
+            handler(event)
 
-        # Загружаем версии документа, если выбран документ
+    def on_document_changed(self, event):
+        records = self.db.records
+        self.put_row('documents', records.document(event.id, columns=('id', 'title')), event.id)
+        if getattr(self, 'current_doc_id', None) == event.id:
+            # Новая версия документа
+            self.load_document_details(event.id)
+
+    def on_document_version_deleted(self, event):
+        if getattr(self, 'current_doc_id', None) == event.document_id:
+            self.models['doc_versions'].remove(event.version_id)
+
+    def on_documents_restored(self, event):
+        # Восстановление могло изменить любые документы
+        self.load_section('documents')
         if hasattr(self, 'current_doc_id'):
-            try:
-                doc_versions = self.db.get_document_versions(self.current_doc_id)
-                self.doc_versions_list.clear()
-                for version in doc_versions:
-                    item = QListWidgetItem(f"Версия {version[3]} ({version[6]}) - {version[4]}")  # version[3] - version, version[6] - username, version[4] - date
-                    item.setData(Qt.ItemDataRole.UserRole, version[0])  # version[0] - id
-                    self.doc_versions_list.addItem(item)
-                
-                # Загружаем оценки документа
-                self.load_document_ratings(self.current_doc_id)
-                
-            except Exception as e:
-                QMessageBox.warning(self, 'Ошибка', f'Ошибка при загрузке версий документа: {str(e)}')
+            self.load_document_details(self.current_doc_id)
+
+    def on_glossary_changed(self, event):
+        term = self.db.records.glossary_term(event.id, columns=('id', 'term', 'definition'))
+        self.put_row('glossary', term, event.id)
+
+    def on_faq_changed(self, event):
+        faq = self.db.records.faq(event.id, columns=('id', 'question', 'answer'))
+        self.put_row('faq', faq, event.id)
+
+    def on_question_changed(self, event):
+        q = self.db.records.question(event.id, columns=self.QUESTION_COLUMNS)
+        self.put_row('questions', q, event.id)
+
+    def on_rating_added(self, event):
+        if getattr(self, 'current_doc_id', None) == event.document_id:
+            self.load_document_ratings(event.document_id)
+
+    def on_user_added(self, event):
+        user = self.db.records.user(event.id, columns=('id', 'username', 'is_admin'))
+        self.put_row('users', user, event.id)
+
+    def on_user_deleted(self, event):
+        self.models['users'].remove(event.id)
+        # Версии показываются вместе с автором и без него не выбираются
+        self.load_section('versions')
+
+    def on_system_version_created(self, event):
+        version = self.db.records.system_version(event.id, columns=self.VERSION_COLUMNS)
+        self.put_row('versions', version, event.id)
+
+    def on_system_version_changed(self, event):
+        # Число изменений в строке версии выросло
+        self.on_system_version_created(event)
+        # Если открыты детали этой версии, показываем новые записи об изменениях
+        index = self.versions_list.currentIndex()
+        if index.isValid() and index.data(Qt.ItemDataRole.UserRole) == event.id:
+            self.show_version_details(index)
+
+    def on_bulk_inserted(self, event):
+        if event.entity in ('documents', 'glossary', 'faq'):
+            self.load_section(event.entity)
+        elif event.entity == 'ratings' and hasattr(self, 'current_doc_id'):
+            self.load_document_ratings(self.current_doc_id)
+        elif event.entity == 'version_changes':
+            self.load_section('versions')
+
+    def closeEvent(self, event):
+        self.events.close()
+        super().closeEvent(event)
 
     def add_section(self):
         if not self.doc_title.text():
@@ -368,23 +575,19 @@ class AdminWindow(QMainWindow):
             # Определяем тип документации
             doc_type = 'admin' if self.doc_type_combo.currentText() == 'Руководство администратора' else 'user'
             
-            doc_id = self.db.add_document(
-                self.doc_title.text(),
-                self.doc_content.toPlainText(),
-                self.user_id,
-                doc_type
-            )
-            self.sections_list.addItem(self.doc_title.text())
-            
-            # Создаем новую версию системы
-            version_id = self.create_new_version(
-                f"Добавлен новый раздел: {self.doc_title.text()}",
-                f"Добавлен новый раздел документации типа {self.doc_type_combo.currentText()}"
-            )
-            
-            if version_id:
-                self.db.add_version_change(
-                    version_id,
+            # Документ и версия системы фиксируются вместе
+            with self.db.transaction():
+                doc_id = self.db.add_document(
+                    self.doc_title.text(),
+                    self.doc_content.toPlainText(),
+                    self.user_id,
+                    doc_type
+                )
+                
+                # Создаем новую версию системы с записью об изменении
+                self.record_change(
+                    f"Добавлен новый раздел: {self.doc_title.text()}",
+                    f"Добавлен новый раздел документации типа {self.doc_type_combo.currentText()}",
                     'add',
                     'document',
                     doc_id,
@@ -398,7 +601,11 @@ class AdminWindow(QMainWindow):
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при добавлении раздела: {str(e)}')
 
     def save_document(self):
-        """Сохраняет документ."""
+        """Сохраняет документ.
+
+        Документ, версия системы и запись об изменении сохраняются одной
+        транзакцией: при ошибке на любом шаге откатывается все сохранение.
+        """
         if not self.doc_title.text():
             QMessageBox.warning(self, 'Ошибка', 'Введите заголовок раздела')
             return
@@ -408,27 +615,19 @@ class AdminWindow(QMainWindow):
             doc_type = 'admin' if self.doc_type_combo.currentText() == 'Руководство администратора' else 'user'
             
             if hasattr(self, 'current_doc_id'):
-                # Обновляем существующий документ
-                self.db.update_document(
-                    self.current_doc_id,
-                    self.doc_content.toPlainText(),
-                    self.user_id,
-                    self.doc_title.text()  # Передаем заголовок
-                )
-                # Обновляем заголовок в списке
-                current_item = self.sections_list.currentItem()
-                if current_item:
-                    current_item.setText(self.doc_title.text())
-                
-                # Создаем новую версию системы
-                version_id = self.create_new_version(
-                    f"Обновлен раздел: {self.doc_title.text()}",
-                    f"Обновлено содержание раздела документации"
-                )
-                
-                if version_id:
-                    self.db.add_version_change(
-                        version_id,
+                with self.db.transaction():
+                    # Обновляем существующий документ
+                    self.db.update_document(
+                        self.current_doc_id,
+                        self.doc_content.toPlainText(),
+                        self.user_id,
+                        self.doc_title.text()  # Передаем заголовок
+                    )
+                    
+                    # Создаем новую версию системы с записью об изменении
+                    self.record_change(
+                        f"Обновлен раздел: {self.doc_title.text()}",
+                        f"Обновлено содержание раздела документации",
                         'update',
                         'document',
                         self.current_doc_id,
@@ -437,35 +636,29 @@ class AdminWindow(QMainWindow):
                 
                 QMessageBox.information(self, 'Успех', 'Изменения сохранены')
             else:
-                # Создаем новый документ
-                doc_id = self.db.add_document(
-                    self.doc_title.text(),
-                    self.doc_content.toPlainText(),
-                    self.user_id,
-                    doc_type
-                )
-                self.current_doc_id = doc_id
-                self.sections_list.addItem(self.doc_title.text())
-                
-                # Создаем новую версию системы
-                version_id = self.create_new_version(
-                    f"Добавлен новый раздел: {self.doc_title.text()}",
-                    f"Добавлен новый раздел документации типа {self.doc_type_combo.currentText()}"
-                )
-                
-                if version_id:
-                    self.db.add_version_change(
-                        version_id,
+                with self.db.transaction():
+                    # Создаем новый документ
+                    doc_id = self.db.add_document(
+                        self.doc_title.text(),
+                        self.doc_content.toPlainText(),
+                        self.user_id,
+                        doc_type
+                    )
+                    
+                    # Создаем новую версию системы с записью об изменении
+                    self.record_change(
+                        f"Добавлен новый раздел: {self.doc_title.text()}",
+                        f"Добавлен новый раздел документации типа {self.doc_type_combo.currentText()}",
                         'add',
                         'document',
                         doc_id,
                         f"Добавлен раздел '{self.doc_title.text()}'"
                     )
+                # ID запоминаем только после фиксации: при откате документа нет
+                self.current_doc_id = doc_id
+                self.load_document_details(doc_id)
                 
                 QMessageBox.information(self, 'Успех', 'Документ создан')
-            
-            # Обновляем список документов
-            self.load_data()
         except Exception as e:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при сохранении: {str(e)}')
 
@@ -505,22 +698,17 @@ class AdminWindow(QMainWindow):
             return
             
         try:
-            term_id = self.db.add_glossary_term(
-                self.term_input.text(),
-                self.definition_input.toPlainText(),
-                self.user_id
-            )
-            self.glossary_list.addItem(f"{self.term_input.text()}: {self.definition_input.toPlainText()}")
-            
-            # Создаем новую версию системы
-            version_id = self.create_new_version(
-                f"Добавлен новый термин: {self.term_input.text()}",
-                f"Добавлен новый термин в глоссарий"
-            )
-            
-            if version_id:
-                self.db.add_version_change(
-                    version_id,
+            with self.db.transaction():
+                term_id = self.db.add_glossary_term(
+                    self.term_input.text(),
+                    self.definition_input.toPlainText(),
+                    self.user_id
+                )
+                
+                # Создаем новую версию системы с записью об изменении
+                self.record_change(
+                    f"Добавлен новый термин: {self.term_input.text()}",
+                    f"Добавлен новый термин в глоссарий",
                     'add',
                     'glossary',
                     term_id,
@@ -547,27 +735,18 @@ class AdminWindow(QMainWindow):
                     QMessageBox.warning(self, 'Ошибка', 'Такой вопрос уже существует')
                     return
             
-            # Добавляем новый FAQ
-            faq_id = self.db.add_faq(
-                self.question_input.text(),
-                self.answer_input.toPlainText(),
-                self.user_id
-            )
-            
-            # Добавляем в список
-            item = QListWidgetItem(f"Q: {self.question_input.text()}\nA: {self.answer_input.toPlainText()}")
-            item.setData(Qt.ItemDataRole.UserRole, faq_id)
-            self.faq_list.addItem(item)
-            
-            # Создаем новую версию системы
-            version_id = self.create_new_version(
-                f"Добавлен новый FAQ: {self.question_input.text()}",
-                f"Добавлен новый вопрос-ответ в FAQ"
-            )
-            
-            if version_id:
-                self.db.add_version_change(
-                    version_id,
+            with self.db.transaction():
+                # Добавляем новый FAQ
+                faq_id = self.db.add_faq(
+                    self.question_input.text(),
+                    self.answer_input.toPlainText(),
+                    self.user_id
+                )
+                
+                # Создаем новую версию системы с записью об изменении
+                self.record_change(
+                    f"Добавлен новый FAQ: {self.question_input.text()}",
+                    f"Добавлен новый вопрос-ответ в FAQ",
                     'add',
                     'faq',
                     faq_id,
@@ -587,8 +766,8 @@ class AdminWindow(QMainWindow):
             self.main_window.logout()
 
     def delete_section(self):
-        current_item = self.sections_list.currentItem()
-        if not current_item:
+        current_index = self.sections_list.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, 'Ошибка', 'Выберите раздел для удаления')
             return
             
@@ -601,17 +780,10 @@ class AdminWindow(QMainWindow):
         
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                # Находим ID документа
-                documents = self.db.get_all_documents()
-                doc_id = None
-                for doc in documents:
-                    if doc[1] == current_item.text():  # doc[1] - title
-                        doc_id = doc[0]
-                        break
+                doc_id = current_index.data(Qt.ItemDataRole.UserRole)
                 
                 if doc_id:
                     self.db.delete_document(doc_id)
-                    self.sections_list.takeItem(self.sections_list.row(current_item))
                     self.doc_title.clear()
                     self.doc_content.clear()
                     QMessageBox.information(self, 'Успех', 'Раздел успешно удален')
@@ -620,8 +792,8 @@ class AdminWindow(QMainWindow):
 
     def delete_glossary_term(self):
         """Удаляет выбранный термин глоссария."""
-        current_item = self.glossary_list.currentItem()
-        if not current_item:
+        current_index = self.glossary_list.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, 'Ошибка', 'Выберите термин для удаления')
             return
             
@@ -634,48 +806,33 @@ class AdminWindow(QMainWindow):
         
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                # Находим ID термина
-                terms = self.db.get_all_glossary_terms()
-                term_id = None
-                term_name = None
-                for term in terms:
-                    if f"{term[1]}: {term[2]}" == current_item.text():  # term[1] - term name, term[2] - definition
-                        term_id = term[0]
-                        term_name = term[1]
-                        break
+                # ID термина хранится в элементе списка
+                term_id = current_index.data(Qt.ItemDataRole.UserRole)
+                term = self.db.get_glossary_term(term_id) if term_id is not None else None
                 
-                if term_id:
-                    # Сохраняем индекс элемента перед удалением
-                    row = self.glossary_list.row(current_item)
-                    
-                    # Удаляем термин из базы данных
-                    self.db.delete_glossary_term(term_id)
-                    
-                    # Создаем новую версию системы
-                    version_id = self.create_new_version(
-                        f"Удален термин: {term_name}",
-                        f"Удален термин из глоссария"
-                    )
-                    
-                    if version_id:
-                        self.db.add_version_change(
-                            version_id,
+                if term:
+                    term_name = term[1]
+                    with self.db.transaction():
+                        # Удаляем термин из базы данных
+                        self.db.delete_glossary_term(term_id)
+                        
+                        # Создаем новую версию системы с записью об изменении
+                        self.record_change(
+                            f"Удален термин: {term_name}",
+                            f"Удален термин из глоссария",
                             'delete',
                             'glossary',
                             term_id,
                             f"Удален термин '{term_name}'"
                         )
-                    
-                    # Удаляем элемент из списка
-                    self.glossary_list.takeItem(row)
                     QMessageBox.information(self, 'Успех', 'Термин успешно удален')
             except Exception as e:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при удалении термина: {str(e)}')
 
     def delete_faq(self):
         """Удаляет выбранный FAQ."""
-        current_item = self.faq_list.currentItem()
-        if not current_item:
+        current_index = self.faq_list.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, 'Ошибка', 'Выберите вопрос для удаления')
             return
             
@@ -689,34 +846,26 @@ class AdminWindow(QMainWindow):
         if reply == QMessageBox.StandardButton.Yes:
             try:
                 # Получаем ID FAQ из пользовательских данных элемента
-                faq_id = current_item.data(Qt.ItemDataRole.UserRole)
-                row = self.faq_list.row(current_item)
+                faq_id = current_index.data(Qt.ItemDataRole.UserRole)
                 
                 if faq_id is not None:
                     # Получаем текст вопроса для записи в историю версий
                     faq = self.db.get_faq(faq_id)
                     faq_question = faq[1] if faq else "Неизвестный вопрос"
                     
-                    # Удаляем FAQ из базы данных
-                    self.db.delete_faq(faq_id)
-                    
-                    # Создаем новую версию системы
-                    version_id = self.create_new_version(
-                        f"Удален FAQ: {faq_question}",
-                        f"Удален вопрос-ответ из FAQ"
-                    )
-                    
-                    if version_id:
-                        self.db.add_version_change(
-                            version_id,
+                    with self.db.transaction():
+                        # Удаляем FAQ из базы данных
+                        self.db.delete_faq(faq_id)
+                        
+                        # Создаем новую версию системы с записью об изменении
+                        self.record_change(
+                            f"Удален FAQ: {faq_question}",
+                            f"Удален вопрос-ответ из FAQ",
                             'delete',
                             'faq',
                             faq_id,
                             f"Удален FAQ '{faq_question}'"
                         )
-                    
-                    # Удаляем элемент из списка
-                    self.faq_list.takeItem(row)
                     QMessageBox.information(self, 'Успех', 'Вопрос успешно удален')
                 else:
                     QMessageBox.warning(self, 'Ошибка', 'Не удалось получить ID вопроса')
@@ -725,8 +874,8 @@ class AdminWindow(QMainWindow):
 
     def delete_user_question(self):
         """Удаляет выбранный вопрос пользователя."""
-        current_item = self.questions_list.currentItem()
-        if not current_item:
+        current_index = self.questions_list.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, 'Ошибка', 'Выберите вопрос для удаления')
             return
             
@@ -739,79 +888,57 @@ class AdminWindow(QMainWindow):
         
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                # Получаем текст элемента и удаляем статус из начала строки
-                item_text = current_item.text()
-                if '[Отвечен]' in item_text:
-                    item_text = item_text.replace('[Отвечен]', '').strip()
-                elif '[Новый]' in item_text:
-                    item_text = item_text.replace('[Новый]', '').strip()
-                
-                # Находим ID вопроса
-                questions = self.db.get_user_questions_with_answers()  # Используем метод с ответами
-                question_id = None
-                
-                for q in questions:
-                    # Проверяем совпадение текста вопроса
-                    if f"От {q[5]}: {q[2]}" == item_text:  # q[5] - username, q[2] - question
-                        question_id = q[0]
-                        break
+                # ID вопроса хранится в элементе списка
+                question_id = current_index.data(Qt.ItemDataRole.UserRole)
                 
                 if question_id:
-                    # Сохраняем индекс элемента перед удалением
-                    row = self.questions_list.row(current_item)
-                    
                     # Удаляем вопрос из базы данных
                     self.db.delete_user_question(question_id)
-                    
-                    # Удаляем элемент из списка
-                    self.questions_list.takeItem(row)
                     QMessageBox.information(self, 'Успех', 'Вопрос успешно удален')
                 else:
                     QMessageBox.warning(self, 'Ошибка', 'Не удалось найти вопрос в базе данных')
             except Exception as e:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при удалении вопроса: {str(e)}')
 
-    def load_document(self, item):
+    def load_document(self, index):
         """Загружает выбранный документ для редактирования."""
         try:
-            documents = self.db.get_all_documents()
-            for doc in documents:
-                if doc[1] == item.text():  # doc[1] - title
-                    self.current_doc_id = doc[0]
-                    self.doc_title.setText(doc[1])
-                    self.doc_content.setPlainText(doc[2])  # doc[2] - content
-                    
-                    # Загружаем версии документа
-                    doc_versions = self.db.get_document_versions(self.current_doc_id)
-                    self.doc_versions_list.clear()
-                    for version in doc_versions:
-                        item = QListWidgetItem(f"Версия {version[3]} ({version[6]}) - {version[4]}")  # version[3] - version, version[6] - username, version[4] - date
-                        item.setData(Qt.ItemDataRole.UserRole, version[0])  # version[0] - id
-                        self.doc_versions_list.addItem(item)
-                    
-                    # Загружаем оценки документа
-                    self.load_document_ratings(self.current_doc_id)
-                    
-                    break
+            doc_id = index.data(Qt.ItemDataRole.UserRole)
+            # Текст читаем только для выбранного документа
+            content = self.db.get_document_content(doc_id)
+            if content is None:
+                QMessageBox.warning(self, 'Ошибка', 'Документ не найден')
+                return
+            self.current_doc_id = doc_id
+            self.doc_title.setText(index.data())
+            self.doc_content.setPlainText(content)
+            
+            # Версии и оценки документа загружаются в фоне
+            self.load_document_details(doc_id)
         except Exception as e:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при загрузке документа: {str(e)}')
 
+    def load_document_details(self, doc_id):
+        """Загружает в фоне версии и оценки документа."""
+        # Для списка тексты версий не нужны, поэтому не восстанавливаем их
+        self.models['doc_versions'].fetch = lambda after, limit: self.db.records.document_versions(
+            doc_id, columns=('id', 'version', 'username', 'created_at'), after=after, limit=limit
+        )
+        self.load_section('doc_versions')
+        self.load_document_ratings(doc_id)
+
     def load_document_ratings(self, doc_id):
         """Загружает оценки для выбранного документа."""
-        try:
-            ratings = self.db.get_document_ratings(doc_id)
-            self.ratings_list.clear()
-            
-            if not ratings:
-                self.ratings_list.addItem("Нет оценок")
-                return
-                
-            for rating in ratings:
-                # rating[2] - user_id, rating[3] - rating, rating[4] - comment, rating[6] - username
-                comment = f" - {rating[4]}" if rating[4] else ""
-                self.ratings_list.addItem(f"{rating[6]}: {rating[3]}/5{comment}")
-        except Exception as e:
-            QMessageBox.warning(self, 'Ошибка', f'Ошибка при загрузке оценок: {str(e)}')
+        self.show_placeholder(self.ratings_list, 'Загрузка...')
+        self.loader.load(
+            'ratings',
+            lambda: (
+                self.db.get_rating_summary([doc_id]).get(doc_id),
+                self.db.records.ratings(doc_id, columns=('username', 'rating', 'comment'))
+            ),
+            self.fill_ratings,
+            lambda error: self.show_placeholder(self.ratings_list, f'Ошибка загрузки: {error}')
+        )
 
     def create_glossary_tab(self):
         """Создает вкладку глоссария с поиском."""
@@ -826,8 +953,8 @@ class AdminWindow(QMainWindow):
         search_layout.addWidget(search_input)
         
         # Список терминов
-        self.glossary_list = QListWidget()
-        self.glossary_list.itemClicked.connect(self.show_glossary_term)
+        self.glossary_list = self.list_view('glossary')
+        self.glossary_list.clicked.connect(self.show_glossary_term)
         
         # Кнопки управления
         buttons_layout = QHBoxLayout()
@@ -859,9 +986,8 @@ class AdminWindow(QMainWindow):
 
     def filter_glossary(self, text):
         """Фильтрует термины в глоссарии."""
-        for i in range(self.glossary_list.count()):
-            item = self.glossary_list.item(i)
-            item.setHidden(text.lower() not in item.text().lower())
+        self.glossary_text = text
+        self.load_section('glossary')
 
     def insert_image(self):
         """Открывает диалог выбора изображения и вставляет его в документ."""
@@ -891,15 +1017,14 @@ class AdminWindow(QMainWindow):
             
             try:
                 self.db.add_user(username, password, is_admin)
-                self.load_users()
                 QMessageBox.information(self, 'Успех', 'Пользователь успешно добавлен')
             except Exception as e:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при добавлении пользователя: {str(e)}')
 
     def delete_user(self):
         """Удаляет выбранного пользователя."""
-        current_item = self.users_list.currentItem()
-        if not current_item:
+        current_index = self.users_list.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, 'Ошибка', 'Выберите пользователя для удаления')
             return
             
@@ -912,77 +1037,59 @@ class AdminWindow(QMainWindow):
         
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                user_id = current_item.data(Qt.ItemDataRole.UserRole)
+                user_id = current_index.data(Qt.ItemDataRole.UserRole)
                 self.db.delete_user(user_id)
-                self.load_users()
                 QMessageBox.information(self, 'Успех', 'Пользователь успешно удален')
             except Exception as e:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при удалении пользователя: {str(e)}')
 
-    def load_users(self):
-        """Загружает список пользователей."""
+    def show_version_details(self, index):
+        """Показывает детали выбранной версии; изменения загружаются в фоне."""
         try:
-            users = self.db.get_all_users()
-            self.users_list.clear()
-            for user in users:
-                # Проверяем, является ли пользователь админом
-                is_admin = bool(user[3])  # Преобразуем в булево значение
-                item = QListWidgetItem(f"{user[1]} ({'Админ' if is_admin else 'Пользователь'})")
-                item.setData(Qt.ItemDataRole.UserRole, user[0])  # Сохраняем ID пользователя
-                self.users_list.addItem(item)
-        except Exception as e:
-            QMessageBox.warning(self, 'Ошибка', f'Ошибка при загрузке пользователей: {str(e)}')
-
-    def show_version_details(self, item):
-        """Показывает детали выбранной версии."""
-        try:
-            version_id = item.data(Qt.ItemDataRole.UserRole)
-            versions = self.db.get_all_versions()
-            changes = self.db.get_version_changes(version_id)
+            version_id = index.data(Qt.ItemDataRole.UserRole)
+            version = self.db.records.system_version(
+                version_id, columns=('version_number', 'description', 'created_at', 'username')
+            )
             
-            for version in versions:
-                if version[0] == version_id:
-                    details = f"Версия: {version[1]}\n"
-                    details += f"Описание: {version[2]}\n"
-                    details += f"Дата создания: {version[4]}\n"
-                    details += f"Автор: {version[6]}\n\n"
-                    details += "Изменения:\n"
-                    
-                    for change in changes:
-                        details += f"- {change[5]}\n"  # change[5] - description
-                    
-                    self.version_details.setPlainText(details)
-                    break
+            if version:
+                details = f"Версия: {version.version_number}\n"
+                details += f"Описание: {version.description}\n"
+                details += f"Дата создания: {version.created_at}\n"
+                details += f"Автор: {version.username or 'пользователь удален'}\n\n"
+                details += "Изменения:\n"
+                self.version_details.setPlainText(details + 'Загрузка...')
+                
+                self.loader.load(
+                    'version_changes',
+                    lambda: self.db.get_version_changes(version_id),
+                    # change[5] - description
+                    lambda changes: self.version_details.setPlainText(
+                        details + ''.join(f"- {change[5]}\n" for change in changes)
+                    ),
+                    lambda error: self.version_details.setPlainText(
+                        details + f'Ошибка загрузки: {error}'
+                    )
+                )
         except Exception as e:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при загрузке деталей версии: {str(e)}')
 
-    def show_question_details(self, item):
+    def show_question_details(self, index):
         """Показывает детали выбранного вопроса."""
         try:
-            questions = self.db.get_user_questions_with_answers()
-            
-            # Получаем текст элемента и удаляем статус из начала строки
-            item_text = item.text()
-            if '[Отвечен]' in item_text:
-                item_text = item_text.replace('[Отвечен]', '').strip()
-            elif '[Новый]' in item_text:
-                item_text = item_text.replace('[Новый]', '').strip()
-                
-            for q in questions:
-                if f"От {q[5]}: {q[2]}" == item_text:  # q[5] - username, q[2] - question
-                    # Если есть ответ, показываем его
-                    if q[6]:  # q[6] - answer
-                        self.question_answer_input.setPlainText(q[6])
-                    else:
-                        self.question_answer_input.clear()
-                    break
+            q = self.db.records.question(index.data(Qt.ItemDataRole.UserRole), columns=('answer',))
+            if q:
+                # Если есть ответ, показываем его
+                if q.answer:
+                    self.question_answer_input.setPlainText(q.answer)
+                else:
+                    self.question_answer_input.clear()
         except Exception as e:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при загрузке деталей вопроса: {str(e)}')
 
     def answer_question(self):
         """Отвечает на выбранный вопрос."""
-        current_item = self.questions_list.currentItem()
-        if not current_item:
+        current_index = self.questions_list.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, 'Ошибка', 'Выберите вопрос для ответа')
             return
             
@@ -991,48 +1098,33 @@ class AdminWindow(QMainWindow):
             return
             
         try:
-            # Находим ID вопроса
-            questions = self.db.get_user_questions()
-            question_id = None
-            question_text = None
-            
-            # Получаем текст элемента и удаляем статус из начала строки
-            item_text = current_item.text()
-            if '[Отвечен]' in item_text:
-                item_text = item_text.replace('[Отвечен]', '').strip()
-            elif '[Новый]' in item_text:
-                item_text = item_text.replace('[Новый]', '').strip()
-                
-            for q in questions:
-                if f"От {q[5]}: {q[2]}" == item_text:  # q[5] - username, q[2] - question
-                    question_id = q[0]
-                    question_text = q[2]
-                    break
+            # ID вопроса хранится в элементе списка
+            q = self.db.records.question(
+                current_index.data(Qt.ItemDataRole.UserRole), columns=('id', 'question')
+            )
             
-            if question_id:
-                # Сохраняем ответ
-                if self.db.answer_user_question(
-                    question_id,
-                    self.question_answer_input.toPlainText(),
-                    self.user_id
-                ):
-                    # Создаем новую версию системы
-                    version_id = self.create_new_version(
-                        f"Ответ на вопрос пользователя",
-                        f"Добавлен ответ на вопрос пользователя и создан новый FAQ"
+            if q:
+                question_id, question_text = q.id, q.question
+                with self.db.transaction():
+                    # Сохраняем ответ
+                    answered = self.db.answer_user_question(
+                        question_id,
+                        self.question_answer_input.toPlainText(),
+                        self.user_id
                     )
-                    
-                    if version_id:
-                        self.db.add_version_change(
-                            version_id,
+                    if answered:
+                        # Создаем новую версию системы с записью об изменении
+                        self.record_change(
+                            f"Ответ на вопрос пользователя",
+                            f"Добавлен ответ на вопрос пользователя и создан новый FAQ",
                             'add',
                             'faq',
                             question_id,  # Используем ID вопроса как связанный ID
                             f"Ответ на вопрос '{question_text}'"
                         )
-                    
+                
+                if answered:
                     QMessageBox.information(self, 'Успех', 'Ответ сохранен и добавлен в FAQ')
-                    self.load_data()  # Обновляем списки
                     self.question_answer_input.clear()
                 else:
                     QMessageBox.warning(self, 'Ошибка', 'Не удалось сохранить ответ')
@@ -1042,47 +1134,36 @@ class AdminWindow(QMainWindow):
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при сохранении ответа: {str(e)}')
 
     def create_new_version(self, description, changes):
-        """Создает новую версию системы."""
-        try:
-            # Получаем последнюю версию
-            latest = self.db.get_latest_version()
-            if latest:
-                current_version = latest[1]  # version_number
-                # Увеличиваем номер версии
-                version_parts = current_version.split('.')
-                if len(version_parts) > 1:
-                    version_parts[-1] = str(int(version_parts[-1]) + 1)
-                else:
-                    version_parts.append('1')
-                new_version = '.'.join(version_parts)
-            else:
-                new_version = '1.0'
-            
-            # Создаем новую версию
-            version_id = self.db.create_new_version(
-                new_version,
-                description,
-                changes,
-                self.user_id
-            )
-            
-            # Обновляем список версий
-            self.load_data()
-            
-            return version_id
-        except Exception as e:
-            QMessageBox.warning(self, 'Ошибка', f'Ошибка при создании версии: {str(e)}')
-            return None
+        """Создает новую версию системы со следующим номером.
+
+        Ошибки не перехватываются: вызывающий код выполняет изменение и создание
+        версии в одной транзакции self.db.transaction() и откатывает их вместе.
+        """
+        # Номер выдает база в той же транзакции, что и вставка версии
+        return self.db.create_next_version(description, changes, self.user_id)
+
+    def record_change(self, description, changes, change_type, entity_type, entity_id,
+                      change_description):
+        """Создает версию системы с записью об одном изменении; вызывается внутри transaction()."""
+        version_id = self.create_new_version(description, changes)
+        self.db.add_version_change(
+            version_id,
+            change_type,
+            entity_type,
+            entity_id,
+            change_description
+        )
+        return version_id
 
     def view_doc_version(self):
         """Просматривает выбранную версию документа."""
-        current_item = self.doc_versions_list.currentItem()
-        if not current_item:
+        current_index = self.doc_versions_list.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, 'Ошибка', 'Выберите версию для просмотра')
             return
             
         try:
-            version_id = current_item.data(Qt.ItemDataRole.UserRole)
+            version_id = current_index.data(Qt.ItemDataRole.UserRole)
             version = self.db.get_document_version(version_id)
             if version:
                 # Создаем диалог для просмотра
@@ -1106,17 +1187,14 @@ class AdminWindow(QMainWindow):
         except Exception as e:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при просмотре версии: {str(e)}')
 
-    def restore_doc_version(self, item=None):
+    def restore_doc_version(self):
         """Восстанавливает выбранную версию документа."""
-        if not item:
-            item = self.doc_versions_list.currentItem()
-            
-        if not item:
+        version_id = current_id(self.doc_versions_list)
+        if version_id is None:
             QMessageBox.warning(self, 'Ошибка', 'Выберите версию для восстановления')
             return
             
         try:
-            version_id = item.data(Qt.ItemDataRole.UserRole)
             version = self.db.get_document_version(version_id)
             if version:
                 reply = QMessageBox.question(
@@ -1134,13 +1212,13 @@ class AdminWindow(QMainWindow):
 
     def delete_doc_version(self):
         """Удаляет выбранную версию документа."""
-        current_item = self.doc_versions_list.currentItem()
-        if not current_item:
+        current_index = self.doc_versions_list.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, 'Ошибка', 'Выберите версию для удаления')
             return
             
         # Проверяем, не последняя ли это версия
-        if self.doc_versions_list.count() <= 1:
+        if self.models['doc_versions'].rowCount() <= 1:
             QMessageBox.warning(self, 'Ошибка', 'Нельзя удалить единственную версию документа')
             return
             
@@ -1153,24 +1231,22 @@ class AdminWindow(QMainWindow):
         
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                version_id = current_item.data(Qt.ItemDataRole.UserRole)
+                version_id = current_index.data(Qt.ItemDataRole.UserRole)
                 # Удаляем версию из базы данных
                 self.db.delete_document_version(version_id)
-                # Удаляем из списка
-                self.doc_versions_list.takeItem(self.doc_versions_list.row(current_item))
                 QMessageBox.information(self, 'Успех', 'Версия документа удалена')
             except Exception as e:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при удалении версии: {str(e)}')
 
     def delete_system_version(self):
         """Удаляет выбранную версию системы."""
-        current_item = self.versions_list.currentItem()
-        if not current_item:
+        current_index = self.versions_list.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, 'Ошибка', 'Выберите версию для удаления')
             return
             
         # Проверяем, не последняя ли это версия
-        if self.versions_list.count() <= 1:
+        if self.models['versions'].rowCount() <= 1:
             QMessageBox.warning(self, 'Ошибка', 'Нельзя удалить единственную версию системы')
             return
             
@@ -1183,27 +1259,23 @@ class AdminWindow(QMainWindow):
         
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                version_id = current_item.data(Qt.ItemDataRole.UserRole)
+                version_id = current_index.data(Qt.ItemDataRole.UserRole)
                 # Удаляем версию из базы данных
                 self.db.delete_version(version_id)
-                # Удаляем из списка
-                self.versions_list.takeItem(self.versions_list.row(current_item))
                 # Очищаем детали версии
                 self.version_details.clear()
                 QMessageBox.information(self, 'Успех', 'Версия системы удалена')
             except Exception as e:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при удалении версии: {str(e)}')
 
-    def show_glossary_term(self, item):
+    def show_glossary_term(self, index):
         """Показывает выбранный термин для редактирования."""
         try:
-            terms = self.db.get_all_glossary_terms()
-            for term in terms:
-                if f"{term[1]}: {term[2]}" == item.text():  # term[1] - term name, term[2] - definition
-                    self.current_term_id = term[0]
-                    self.term_input.setText(term[1])
-                    self.definition_input.setPlainText(term[2])
-                    break
+            term = self.db.get_glossary_term(index.data(Qt.ItemDataRole.UserRole))
+            if term:
+                self.current_term_id = term[0]
+                self.term_input.setText(term[1])  # term[1] - term name
+                self.definition_input.setPlainText(term[2])  # term[2] - definition
         except Exception as e:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при загрузке термина: {str(e)}')
 
@@ -1218,21 +1290,17 @@ class AdminWindow(QMainWindow):
             return
             
         try:
-            self.db.update_glossary_term(
-                self.current_term_id,
-                self.term_input.text(),
-                self.definition_input.toPlainText()
-            )
-            
-            # Создаем новую версию системы
-            version_id = self.create_new_version(
-                f"Обновлен термин: {self.term_input.text()}",
-                f"Обновлено определение термина в глоссарии"
-            )
-            
-            if version_id:
-                self.db.add_version_change(
-                    version_id,
+            with self.db.transaction():
+                self.db.update_glossary_term(
+                    self.current_term_id,
+                    self.term_input.text(),
+                    self.definition_input.toPlainText()
+                )
+                
+                # Создаем новую версию системы с записью об изменении
+                self.record_change(
+                    f"Обновлен термин: {self.term_input.text()}",
+                    f"Обновлено определение термина в глоссарии",
                     'update',
                     'glossary',
                     self.current_term_id,
@@ -1240,17 +1308,16 @@ class AdminWindow(QMainWindow):
                 )
             
             QMessageBox.information(self, 'Успех', 'Термин обновлен')
-            self.load_data()
             self.term_input.clear()
             self.definition_input.clear()
             delattr(self, 'current_term_id')
         except Exception as e:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при обновлении термина: {str(e)}')
 
-    def show_faq(self, item):
+    def show_faq(self, index):
         """Показывает выбранный FAQ для редактирования."""
         try:
-            faq_id = item.data(Qt.ItemDataRole.UserRole)
+            faq_id = index.data(Qt.ItemDataRole.UserRole)
             faq = self.db.get_faq(faq_id)
             if faq:
                 self.current_faq_id = faq[0]
@@ -1270,21 +1337,17 @@ class AdminWindow(QMainWindow):
             return
             
         try:
-            self.db.update_faq(
-                self.current_faq_id,
-                self.question_input.text(),
-                self.answer_input.toPlainText()
-            )
-            
-            # Создаем новую версию системы
-            version_id = self.create_new_version(
-                f"Обновлен FAQ: {self.question_input.text()}",
-                f"Обновлен вопрос-ответ в FAQ"
-            )
-            
-            if version_id:
-                self.db.add_version_change(
-                    version_id,
+            with self.db.transaction():
+                self.db.update_faq(
+                    self.current_faq_id,
+                    self.question_input.text(),
+                    self.answer_input.toPlainText()
+                )
+                
+                # Создаем новую версию системы с записью об изменении
+                self.record_change(
+                    f"Обновлен FAQ: {self.question_input.text()}",
+                    f"Обновлен вопрос-ответ в FAQ",
                     'update',
                     'faq',
                     self.current_faq_id,
@@ -1292,7 +1355,6 @@ class AdminWindow(QMainWindow):
                 )
             
             QMessageBox.information(self, 'Успех', 'FAQ обновлен')
-            self.load_data()
             self.question_input.clear()
             self.answer_input.clear()
             delattr(self, 'current_faq_id')
@@ -1301,59 +1363,62 @@ class AdminWindow(QMainWindow):
 
     def restore_system_version(self):
         """Восстанавливает систему до выбранной версии."""
-        current_item = self.versions_list.currentItem()
-        if not current_item:
+        current_index = self.versions_list.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, 'Ошибка', 'Выберите версию для восстановления')
             return
+        
+        # Заранее показываем, какие документы изменит восстановление
+        message = 'Вы уверены, что хотите восстановить систему до этой версии? Это может привести к потере данных.'
+        changed = self.db.get_restore_preview(current_index.data(Qt.ItemDataRole.UserRole))
+        if changed is not None:
+            changed = [title for _, title in changed]
+            if changed:
+                titles = '\n'.join(changed[:10])
+                if len(changed) > 10:
+                    titles += f"\n... и еще {len(changed) - 10}"
+                message += f"\n\nБудут изменены документы ({len(changed)}):\n{titles}"
+            else:
+                message += "\n\nДокументы не изменятся."
             
         reply = QMessageBox.question(
             self, 'Подтверждение',
-            'Вы уверены, что хотите восстановить систему до этой версии? Это может привести к потере данных.',
+            message,
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
             QMessageBox.StandardButton.No
         )
         
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                version_id = current_item.data(Qt.ItemDataRole.UserRole)
+                version_id = current_index.data(Qt.ItemDataRole.UserRole)
                 if version_id is None:
                     QMessageBox.warning(self, 'Ошибка', 'Не удалось получить ID версии')
                     return
                     
                 # Получаем информацию о версии
-                versions = self.db.get_all_versions()
-                version_info = None
-                for v in versions:
-                    if v[0] == version_id:
-                        version_info = v
-                        break
+                version_info = self.db.get_version(version_id)
                         
                 if not version_info:
                     QMessageBox.warning(self, 'Ошибка', 'Не удалось найти информацию о версии')
                     return
                 
-                # Восстанавливаем систему до выбранной версии
-                if self.db.restore_system_to_version(version_id):
-                    # Создаем новую версию системы для записи о восстановлении
-                    version_number = version_info[1]  # Получаем номер версии
-                    
-                    new_version_id = self.create_new_version(
-                        f"Восстановление до версии {version_number}",
-                        f"Система восстановлена до версии {version_number}"
-                    )
-                    
-                    if new_version_id:
-                        self.db.add_version_change(
-                            new_version_id,
+                version_number = version_info[1]  # Получаем номер версии
+                
+                # Восстановление и запись о нем фиксируются одной транзакцией
+                with self.db.transaction():
+                    restored = self.db.restore_system_to_version(version_id)
+                    if restored:
+                        # Создаем новую версию системы для записи о восстановлении
+                        self.record_change(
+                            f"Восстановление до версии {version_number}",
+                            f"Система восстановлена до версии {version_number}",
                             'restore',
                             'system',
                             version_id,
                             f"Восстановление системы до версии {version_number}"
                         )
-                    
-                    # Обновляем данные
-                    self.load_data()
-                    
+                
+                if restored:
                     QMessageBox.information(self, 'Успех', f'Система успешно восстановлена до версии {version_number}')
                 else:
                     QMessageBox.warning(self, 'Ошибка', 'Не удалось восстановить систему до выбранной версии')
@@ -0,0 +1,124 @@
+"""Асинхронный доступ к Database для обработчиков окон.
+
+Методы Database выполняются в отдельном ограниченном пуле потоков, а окно
+дожидается результата через await и не блокирует цикл событий Qt. Каждый
+поток пула работает со своим соединением из пула Database.
+
+Пример:
+    adb = AsyncDatabase(db)
+    results = await adb.search_documents(query, timeout=5)
+
+Отмена задачи или истекший таймаут прерывают выполняющийся запрос через
+sqlite3.Connection.interrupt(), а вызов, еще ждущий свободного потока,
+просто снимается с очереди.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Методы, которые нельзя выполнять в чужом потоке по одному
+_SYNC_ONLY = {'transaction', 'close'}
+
+# Значение по умолчанию для timeout: взять таймаут AsyncDatabase
+_DEFAULT = object()
+
+
+class AsyncDatabase:
+    def __init__(self, db, max_workers=2, timeout=None):
+        """max_workers - число потоков пула; timeout - таймаут вызова по умолчанию, секунды."""
+        self.db = db
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='database'
+        )
+        # Соединения, на которых сейчас выполняются вызовы: ключ вызова -> соединение
+        self._running = {}
+        self._running_lock = threading.Lock()
+        # Последние задачи по ключу, см. latest()
+        self._latest = {}
+
+    def __getattr__(self, name):
+        """Возвращает асинхронную версию метода Database с тем же именем."""
+        if name.startswith('_') or name in _SYNC_ONLY:
+            raise AttributeError(name)
+        method = getattr(self.db, name)
+        if not callable(method):
+            raise AttributeError(name)
+
+        async def call(*args, timeout=_DEFAULT, **kwargs):
+            return await self.run(method, *args, timeout=timeout, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+
+    async def run(self, func, *args, timeout=_DEFAULT, **kwargs):
+        """Выполняет func(*args, **kwargs) в пуле и возвращает результат.
+
+        По истечении timeout секунд вызов прерывается и возникает asyncio.TimeoutError.
+        """
+        if timeout is _DEFAULT:
+            timeout = self.timeout
+        loop = asyncio.get_running_loop()
+        key = object()
+        future = loop.run_in_executor(self._executor, self._invoke, key, func, args, kwargs)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # wait_for уже снял вызов с очереди; начатый запрос останавливаем
+            self._interrupt(key)
+            raise
+
+    async def transaction(self, func, *args, timeout=_DEFAULT):
+        """Выполняет func(db, *args) внутри db.transaction() в одном потоке пула."""
+
+        def unit_of_work():
+            with self.db.transaction():
+                return func(self.db, *args)
+
+        return await self.run(unit_of_work, timeout=timeout)
+
+    def latest(self, key, coro):
+        """Запускает coro задачей, отменяя незавершенную задачу с тем же ключом.
+
+        Нужен для запросов, результат которых устаревает с новым вводом,
+        например поиска: показывается только ответ на последний запрос.
+        """
+        previous = self._latest.get(key)
+        if previous is not None and not previous.done():
+            previous.cancel()
+        task = asyncio.ensure_future(coro)
+        self._latest[key] = task
+
+        def forget(done):
+            if self._latest.get(key) is done:
+                del self._latest[key]
+
+        task.add_done_callback(forget)
+        return task
+
+    def close(self):
+        """Отменяет ждущие вызовы и дожидается завершения потоков пула."""
+        for task in list(self._latest.values()):
+            task.cancel()
+        with self._running_lock:
+            for conn in self._running.values():
+                conn.interrupt()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _invoke(self, key, func, args, kwargs):
+        conn = self.db._get_connection()
+        with self._running_lock:
+            self._running[key] = conn
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._running_lock:
+                del self._running[key]
+
+    def _interrupt(self, key):
+        # Под блокировкой: соединение не успеет перейти к следующему вызову
+        with self._running_lock:
+            conn = self._running.get(key)
+            if conn is not None:
+                conn.interrupt()
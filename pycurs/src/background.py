@@ -0,0 +1,119 @@
+"""Фоновая загрузка данных окон через QThreadPool.
+
+Запрос к базе выполняется в QRunnable, а результат возвращается в поток
+интерфейса сигналом. Каждая загрузка раздела получает номер: результат
+применяется, только если после нее не запрошена более новая загрузка того
+же раздела, иначе он отбрасывается.
+
+Пример:
+    loader = BackgroundLoader(self)
+    loader.load('glossary', db.get_all_glossary_terms, self.fill_glossary, self.show_error)
+"""
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+# Потоков загрузки; у каждого свое соединение из пула Database
+MAX_LOAD_THREADS = 2
+
+_pool = None
+
+
+def thread_pool():
+    """Возвращает общий пул потоков фоновой загрузки."""
+    global _pool
+    if _pool is None:
+        _pool = QThreadPool()
+        _pool.setMaxThreadCount(MAX_LOAD_THREADS)
+        # Потоки не завершаются по простою: иначе каждый новый поток
+        # открывал бы новое соединение с базой, а старые копились бы в пуле Database
+        _pool.setExpiryTimeout(-1)
+    return _pool
+
+
+class LoadSignals(QObject):
+    # Номер загрузки, раздел, результат запроса
+    loaded = pyqtSignal(int, str, object)
+    # Номер загрузки, раздел, текст ошибки
+    failed = pyqtSignal(int, str, str)
+
+
+class LoadTask(QRunnable):
+    """Выполняет запрос в потоке пула и сообщает результат сигналом."""
+
+    def __init__(self, signals, number, section, query):
+        super().__init__()
+        # Задачей владеет BackgroundLoader: пул не должен удалять ее сам,
+        # пока на нее ссылается tryTake
+        self.setAutoDelete(False)
+        self.signals = signals
+        self.number = number
+        self.section = section
+        self.query = query
+
+    def run(self):
+        try:
+            try:
+                result = self.query()
+            except Exception as e:
+                self.signals.failed.emit(self.number, self.section, str(e))
+            else:
+                self.signals.loaded.emit(self.number, self.section, result)
+        except RuntimeError:
+            # Окно закрыто и удалено, пока шел запрос: результат некому показать
+            pass
+
+
+class BackgroundLoader(QObject):
+    """Запускает загрузки разделов и передает окну только последние результаты."""
+
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        self.pool = pool or thread_pool()
+        # Сигналы живут в потоке интерфейса, поэтому слоты вызываются в нем же
+        self.signals = LoadSignals(self)
+        self.signals.loaded.connect(self._on_loaded)
+        self.signals.failed.connect(self._on_failed)
+        self._counter = 0
+        # Раздел -> (номер последней загрузки, apply, fail, задача)
+        self._pending = {}
+
+    def load(self, section, query, apply, fail):
+        """Выполняет query() в фоне и вызывает apply(result) или fail(error) в потоке интерфейса.
+
+        Результат более ранней незавершенной загрузки того же раздела
+        отбрасывается, а если она еще ждет потока, то и не выполняется.
+        """
+        previous = self._pending.get(section)
+        if previous is not None:
+            self.pool.tryTake(previous[3])
+        self._counter += 1
+        task = LoadTask(self.signals, self._counter, section, query)
+        self._pending[section] = (self._counter, apply, fail, task)
+        self.pool.start(task)
+
+    def cancel(self, section):
+        """Отменяет загрузку раздела: ее результат не будет применен."""
+        pending = self._pending.pop(section, None)
+        if pending is not None:
+            self.pool.tryTake(pending[3])
+
+    def is_loading(self, section=None):
+        """Идет ли загрузка раздела (или хотя бы одного раздела)."""
+        return section in self._pending if section is not None else bool(self._pending)
+
+    def _take(self, number, section):
+        pending = self._pending.get(section)
+        if pending is None or pending[0] != number:
+            # Устаревший результат: раздел уже загружается заново
+            return None
+        del self._pending[section]
+        return pending
+
+    def _on_loaded(self, number, section, result):
+        pending = self._take(number, section)
+        if pending is not None:
+            pending[1](result)
+
+    def _on_failed(self, number, section, error):
+        pending = self._take(number, section)
+        if pending is not None:
+            pending[2](error)
@@ -0,0 +1,503 @@
+"""Замеры производительности слоя работы с базой данных.
+
+Запуск: python src/benchmark.py [имя_замера ...]
+Каждый замер работает на временной копии базы и не трогает documentation.db.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import random
+
+from database import Database
+from manifests import CURRENT_VERSIONS_QUERY, LATEST_VERSIONS_QUERY
+
+
+def measure(func, repeat):
+    """Возвращает среднее время одного вызова в микросекундах."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1_000_000
+
+
+def report(name, before, after):
+    print(f"{name:<40} {before:>10.1f} мкс {after:>10.1f} мкс {before / after:>7.1f}x")
+
+
+def bench_connection_pool(db_path, repeat=2000):
+    """Сравнивает открытие соединения на каждый вызов с пулом соединений."""
+    # Без кэша запросов: get_all_faq иначе отдавал бы список из памяти,
+    # а попадания в кэш меряет bench_query_cache
+    db = Database(db_path, query_cache_size=0)
+    admin_id = db.add_user('bench', 'bench', True)
+    doc_id = db.add_document('Документ', 'Содержание ' * 100, admin_id)
+    db.add_faqs_bulk([(f'Вопрос {i}', 'Ответ ' * 20) for i in range(100)], admin_id)
+
+    def per_call(sql, params=()):
+        # Так работали методы Database до появления пула
+        with sqlite3.connect(db_path) as conn:
+            return conn.execute(sql, params).fetchall()
+
+    cases = [
+        ('get_document',
+         lambda: per_call('SELECT * FROM documents WHERE id = ?', (doc_id,)),
+         lambda: db.get_document(doc_id)),
+        ('get_all_faq',
+         lambda: per_call('SELECT * FROM faq ORDER BY question'),
+         db.get_all_faq),
+        ('get_document_ratings',
+         lambda: per_call(
+             '''SELECT r.*, u.username FROM ratings r
+                JOIN users u ON u.id = r.user_id
+                WHERE document_id = ? ORDER BY created_at DESC''', (doc_id,)),
+         lambda: db.get_document_ratings(doc_id)),
+    ]
+    print(f"{'Пул соединений':<40} {'до':>13} {'после':>13}")
+    for name, before, after in cases:
+        report(name, measure(before, repeat), measure(after, repeat))
+    db.close()
+
+
+def add_raters(db, count):
+    """Добавляет count пользователей и возвращает их id: оценка документа от пользователя одна."""
+    with db._connect() as conn:
+        first = conn.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0] + 1
+        conn.executemany(
+            '''INSERT INTO users (id, username, password, is_admin, created_at)
+               VALUES (?, ?, '', 0, datetime('now'))''',
+            [(first + i, f'Оценщик {first + i}') for i in range(count)]
+        )
+    return list(range(first, first + count))
+
+
+def bench_list_filter(db_path, documents=3000, words=800, terms=50000):
+    """Сравнивает фильтрацию списков при наборе текста перебором и запросом к базе.
+
+    До - перебор загруженного целиком списка, как в UserWindow до страничных
+    моделей; после - первая страница records.documents и records.glossary_terms
+    с подстрокой, которую окно читает на каждое нажатие.
+    """
+    db = Database(db_path)
+    admin_id = db.add_user('bench', 'bench', True)
+    vocabulary = ['установка', 'настройка', 'документ', 'версия', 'Глоссарий', 'экспорт',
+                  'Пользователь', 'администратор', 'раздел', 'поиск', 'оценка', 'вопрос']
+    rng = random.Random(0)
+    rows = [(f'Раздел {i}', ' '.join(rng.choice(vocabulary) for _ in range(words)) + f' метка{i}')
+            for i in range(documents)]
+    db.add_documents_bulk(rows, admin_id)
+    db.add_glossary_terms_bulk(
+        [(f'{rng.choice(vocabulary)} {i}', ' '.join(rng.choice(vocabulary) for _ in range(20)))
+         for i in range(terms)], admin_id)
+
+    # Списки загружались один раз при открытии окна
+    loaded_documents = db.get_all_documents()
+    loaded_terms = db.get_all_glossary_terms()
+
+    def linear(loaded, keystrokes):
+        def run():
+            for text in keystrokes:
+                text = text.lower()
+                [row for row in loaded if text in row[1].lower() or text in row[2].lower()]
+        return run
+
+    def in_database(read, keystrokes):
+        def run():
+            for text in keystrokes:
+                # Страница списка, как list_models.PAGE_SIZE
+                read(text=text, limit=200)
+        return run
+
+    print(f"{'Фильтрация списка при вводе':<40} {'до':>13} {'после':>13}")
+    for name, loaded, read, typed in [
+            (f'{documents} документов', loaded_documents, lambda **kw: db.records.documents(
+                columns=('id', 'title', 'doc_type'), **kw), 'МЕТКА42'),
+            (f'{terms} терминов, без совпадений', loaded_terms,
+             db.records.glossary_terms, 'zqxw'),
+            (f'{terms} терминов, короткий запрос', loaded_terms,
+             db.records.glossary_terms, 'ус')]:
+        keystrokes = [typed[:n] for n in range(1, len(typed) + 1)]
+        report(f'{len(keystrokes)} нажатий, {name}',
+               measure(linear(loaded, keystrokes), 3),
+               measure(in_database(read, keystrokes), 3))
+
+
+def bench_version_storage(db_path, edits=200, lines=4000):
+    """Сравнивает объем хранения версий целиком и опорными версиями с разницами."""
+    db = Database(db_path)
+    admin_id = db.add_user('bench', 'bench', True)
+    rng = random.Random(0)
+    text = [f'Строка {i}: ' + 'описание ' * 5 + '\n' for i in range(lines)]
+    doc_id = db.add_document('Руководство', ''.join(text), admin_id)
+    full_size = len(''.join(text).encode('utf-8'))
+    saved = [''.join(text)]
+    for edit in range(edits):
+        if edit % 10 == 9:
+            # Восстановление одной из прежних версий
+            content = rng.choice(saved)
+        elif edit % 10 == 4:
+            # Сохранение без правок
+            content = saved[-1]
+        else:
+            text[rng.randrange(len(text))] = f'Правка {edit}\n'
+            content = ''.join(text)
+        saved.append(content)
+        db.update_document(doc_id, content, admin_id)
+        full_size += len(content.encode('utf-8'))
+
+    conn = db._get_connection()
+    stored_size = conn.execute(
+        '''SELECT (SELECT SUM(LENGTH(CAST(content AS BLOB)) + COALESCE(LENGTH(delta), 0))
+                   FROM document_versions)
+                + (SELECT COALESCE(SUM(LENGTH(data)), 0) FROM content_blobs)'''
+    ).fetchone()[0]
+    version_ids = [row[0] for row in conn.execute('SELECT id FROM document_versions')]
+    read = measure(lambda: db.get_document_version_content(rng.choice(version_ids)), 200)
+    print(f"Версии документа {full_size // (edits + 1) // 1024} КБ, {edits} сохранений")
+    print(f"{'хранится целиком':<40} {full_size / 1024 / 1024:>10.1f} МБ")
+    print(f"{'хранилище текстов + разницы':<40} {stored_size / 1024 / 1024:>10.1f} МБ "
+          f"({full_size / stored_size:.0f}x меньше)")
+    print(f"{'чтение случайной версии':<40} {read:>10.1f} мкс")
+    db.close()
+
+
+def bench_manifest_capture(db_path, documents=200, history=(1, 10, 30), repeat=50):
+    """Сравнивает построение манифеста по истории версий документов и по текущим версиям."""
+    db = Database(db_path)
+    admin_id = db.add_user('bench', 'bench', True)
+    doc_ids = [db.add_document(f'Документ {i}', f'Строка {i}\n' * 200, admin_id)
+               for i in range(documents)]
+    conn = db._get_connection()
+    edits = 1
+    print(f"{'Манифест версии системы':<40} {'до':>13} {'после':>13}")
+    for target in history:
+        while edits < target:
+            edits += 1
+            for doc_id in doc_ids:
+                db.update_document(doc_id, f'Правка {edits}\n' + f'Строка {doc_id}\n' * 200,
+                                   admin_id)
+        as_of = conn.execute('SELECT MAX(created_at) FROM document_versions').fetchone()[0]
+        report(f'{documents * edits} версий документов',
+               measure(lambda: conn.execute(LATEST_VERSIONS_QUERY, (as_of,)).fetchall(), repeat),
+               measure(lambda: conn.execute(CURRENT_VERSIONS_QUERY).fetchall(), repeat))
+    db.close()
+
+
+def bench_restore(db_path, documents=500, edits=10):
+    """Сравнивает восстановление системы по документу за раз и по манифестам версий."""
+    db = Database(db_path)
+    admin_id = db.add_user('bench', 'bench', True)
+    doc_ids = [db.add_document(f'Документ {i}', f'Строка {i}\n' * 50, admin_id)
+               for i in range(documents)]
+    version_ids = []
+    for edit in range(edits):
+        # Между версиями системы меняется примерно каждый десятый документ
+        for doc_id in doc_ids[edit::edits]:
+            db.update_document(doc_id, f'Правка {edit}\n' + f'Строка {doc_id}\n' * 50, admin_id)
+        version_ids.append(db.create_next_version('Описание', 'Изменения', admin_id))
+    targets = version_ids[-2:]
+    conn = db._get_connection()
+    as_of = conn.execute('SELECT created_at FROM system_versions WHERE id = ?',
+                         (targets[0],)).fetchone()[0]
+
+    def per_document(version_id):
+        # Так restore_system_to_version работал до перехода на оконные функции
+        with db._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT created_at FROM system_versions WHERE id = ?', (version_id,))
+            timestamp = cursor.fetchone()[0]
+            for doc in db.get_all_documents():
+                cursor.execute(
+                    '''SELECT id FROM document_versions
+                       WHERE document_id = ? AND created_at <= ?
+                       ORDER BY version DESC LIMIT 1''',
+                    (doc[0], timestamp)
+                )
+                content = db._version_content(cursor, cursor.fetchone()[0])
+                cursor.execute(
+                    'UPDATE documents SET content = ?, updated_at = ? WHERE id = ?',
+                    (content, timestamp, doc[0])
+                )
+
+    def restore(func):
+        # Поочередно восстанавливаем две соседние версии системы
+        return lambda: [func(version_id) for version_id in targets]
+
+    print(f"{'Восстановление версии системы':<40} {'до':>13} {'после':>13}")
+    report(f'{documents} документов, {edits} версий',
+           measure(restore(per_document), 5), measure(restore(db.restore_system_to_version), 5))
+    # Снимок по времени (версии без манифеста, get_documents_as_of): оконная
+    # функция по всей истории и поиск версии каждого документа по индексу
+    report('снимок документов по времени',
+           measure(lambda: conn.execute(LATEST_VERSIONS_QUERY, (as_of,)).fetchall(), 20),
+           measure(lambda: conn.execute(Database.SNAPSHOT_QUERY, (as_of,)).fetchall(), 20))
+    entries = db._get_connection().execute('SELECT COUNT(*) FROM system_version_manifest').fetchone()[0]
+    print(f"{'записей в манифестах':<40} {entries:>10} (полные: {documents * edits})")
+    db.close()
+
+
+def bench_document_listing(db_path, documents=2000, size=20000):
+    """Сравнивает список документов с текстами и без них."""
+    db = Database(db_path)
+    admin_id = db.add_user('bench', 'bench', True)
+    rng = random.Random(0)
+    for i in range(documents):
+        text = ''.join(rng.choice('абвгдежзик \n') for _ in range(size))
+        db.add_document(f'Документ {i:05}', text, admin_id)
+
+    def retained(rows):
+        return sum(sys.getsizeof(value) for row in rows for value in row)
+
+    print(f"{'Список документов':<40} {'до':>13} {'после':>13}")
+    report(f'{documents} документов по {size // 1000} КБ',
+           measure(db.get_all_documents, 10), measure(db.get_document_list, 10))
+    print(f"{'в памяти окна':<40} {retained(db.get_all_documents()) / 1024 / 1024:>10.1f} МБ "
+          f"{retained(db.get_document_list()) / 1024:>10.1f} КБ")
+    db.close()
+
+
+def bench_records(db_path, ratings=50000):
+    """Сравнивает полные кортежи с записями, выбирающими только нужные поля."""
+    db = Database(db_path)
+    admin_id = db.add_user('bench', 'bench', True)
+    doc_id = db.add_document('Документ', 'Содержание', admin_id)
+    raters = add_raters(db, ratings)
+    with db._connect() as conn:
+        conn.executemany(
+            '''INSERT INTO ratings (document_id, user_id, rating, comment, created_at)
+               VALUES (?, ?, ?, ?, datetime('now'))''',
+            [(doc_id, user_id, i % 5 + 1, f'Комментарий {i}') for i, user_id in enumerate(raters)]
+        )
+    columns = ('username', 'rating', 'comment')
+
+    def allocated(func):
+        tracemalloc.start()
+        rows = func()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del rows
+        return size
+
+    tuples = lambda: db.get_document_ratings(doc_id)
+    records = lambda: db.records.ratings(doc_id, columns=columns)
+    print(f"{'Оценки документа':<40} {'до':>13} {'после':>13}")
+    report(f'{ratings} строк, поля {", ".join(columns)}', measure(tuples, 5), measure(records, 5))
+    print(f"{'память результата':<40} {allocated(tuples) / 1024 / 1024:>10.1f} МБ "
+          f"{allocated(records) / 1024 / 1024:>10.1f} МБ")
+    db.close()
+
+
+def bench_bulk_writes(db_path, rows=5000):
+    """Сравнивает вставку по одной строке за транзакцию с массовыми методами."""
+    db = Database(db_path)
+    admin_id = db.add_user('bench', 'bench', True)
+    doc_id = db.add_document('Документ', 'Содержание', admin_id)
+    terms = [(f'Термин {i}', f'Определение термина {i}') for i in range(rows)]
+    # Разные пользователи для вставки по одной и массовой: иначе вторая лишь обновит оценки
+    raters = add_raters(db, 2 * rows)
+    ratings = [(doc_id, user_id, i % 5 + 1, f'Комментарий {i}') for i, user_id in enumerate(raters)]
+    documents = [(f'Раздел {i}', f'Текст раздела {i}\n' * 20) for i in range(rows // 10)]
+
+    def timed(func):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+    cases = [
+        ('термины глоссария', len(terms),
+         lambda: [db.add_glossary_term(term, definition, admin_id) for term, definition in terms],
+         lambda: db.add_glossary_terms_bulk(terms, admin_id)),
+        ('оценки', rows,
+         lambda: [db.add_rating(*rating) for rating in ratings[:rows]],
+         lambda: db.add_ratings_bulk(ratings[rows:])),
+        ('документы с версиями', len(documents),
+         lambda: [db.add_document(title, content, admin_id) for title, content in documents],
+         lambda: db.add_documents_bulk(documents, admin_id)),
+    ]
+    print(f"{'Массовая вставка, строк/с':<40} {'до':>13} {'после':>13}")
+    for name, count, single, bulk in cases:
+        before, after = count / timed(single), count / timed(bulk)
+        print(f"{f'{count} - {name}':<40} {before:>13.0f} {after:>13.0f} {after / before:>7.1f}x")
+    db.close()
+
+
+def bench_query_cache(db_path, terms=2000, versions=300, repeat=200):
+    """Сравнивает повторные чтения списков без кэша запросов и с ним."""
+    db = Database(db_path)
+    admin_id = db.add_user('bench', 'bench', True)
+    db.add_glossary_terms_bulk(
+        [(f'Термин {i}', f'Определение термина {i}') for i in range(terms)], admin_id
+    )
+    db.add_faqs_bulk([(f'Вопрос {i}', f'Ответ {i}') for i in range(terms)], admin_id)
+    for i in range(versions):
+        version_id = db.create_next_version('Версия', '', admin_id)
+        db.add_version_change(version_id, 'add', 'glossary', i, f'Изменение {i}')
+    uncached = Database(db_path, query_cache_size=0)
+
+    cases = [
+        ('get_all_glossary_terms', uncached.get_all_glossary_terms, db.get_all_glossary_terms),
+        ('get_all_faq', uncached.get_all_faq, db.get_all_faq),
+        ('get_all_versions', uncached.get_all_versions, db.get_all_versions),
+        ('get_glossary_term', lambda: uncached.get_glossary_term(terms // 2),
+         lambda: db.get_glossary_term(terms // 2)),
+    ]
+    print(f"{'Кэш запросов':<40} {'до':>13} {'после':>13}")
+    for name, before, after in cases:
+        report(name, measure(before, repeat), measure(after, repeat))
+
+    # Изменение одного термина сбрасывает только записи глоссария
+    db.update_glossary_term(terms // 2, 'Термин', 'Новое определение')
+    db.get_all_glossary_terms()
+    db.get_all_faq()
+    stats = db.cache_stats()['queries']
+    print(f"попаданий {stats['hits']}, промахов {stats['misses']}, записей {stats['entries']}")
+    uncached.close()
+    db.close()
+
+
+def bench_version_history(db_path, versions=5000, changes=5, repeat=20):
+    """Сравнивает чтение всей истории версий системы с первой страницей заголовков."""
+    db = Database(db_path, query_cache_size=0)
+    admin_id = db.add_user('bench', 'bench', True)
+    with db._connect() as conn:
+        conn.executemany(
+            '''INSERT INTO system_versions
+               (version_number, description, changes, created_at, created_by)
+               VALUES (?, 'Версия', '', datetime('now'), ?)''',
+            [(f'1.{i}', admin_id) for i in range(1, versions + 1)]
+        )
+        version_ids = [row[0] for row in conn.execute('SELECT id FROM system_versions')]
+    db.add_version_changes_bulk(
+        (version_id, 'update', 'document', i, f'Изменение {i} версии {version_id}')
+        for version_id in version_ids for i in range(changes)
+    )
+    last_page = version_ids[len(version_ids) // 2]
+    print(f"{'История версий':<40} {'до':>13} {'после':>13}")
+    report(f'{len(version_ids)} версий, первая страница', measure(db.get_all_versions, repeat),
+           measure(db.get_versions_page, repeat))
+    report('страница из середины', measure(db.get_all_versions, repeat),
+           measure(lambda: db.get_versions_page(last_page), repeat))
+    db.close()
+
+
+def bench_change_polling(db_path, terms=2000, repeat=2000, writes=200):
+    """Сравнивает стоимость опроса изменений с перечитыванием всех списков окна."""
+    db = Database(db_path)
+    admin_id = db.add_user('bench', 'bench', True)
+    db.add_glossary_terms_bulk(
+        [(f'Термин {i}', f'Определение термина {i}') for i in range(terms)], admin_id
+    )
+    db.add_faqs_bulk([(f'Вопрос {i}', f'Ответ {i}') for i in range(terms)], admin_id)
+    # Второй объект Database на том же файле пишет как другое рабочее место
+    other = Database(db_path)
+    uncached = Database(db_path, query_cache_size=0)
+    db.sync_external_changes()
+
+    def reload_everything():
+        uncached.get_document_list()
+        uncached.get_all_glossary_terms()
+        uncached.get_all_faq()
+        uncached.records.questions(columns=('id', 'status', 'username', 'question'))
+        uncached.get_all_versions()
+        uncached.get_all_users()
+
+    idle = measure(db.sync_external_changes, repeat)
+    print(f"{'Опрос изменений':<40} {'до':>13} {'после':>13}")
+    report('опрос без изменений', measure(reload_everything, 50), idle)
+
+    # Опрос после записи другого процесса: чтение журнала и публикация события
+    spent = 0.0
+    for i in range(writes):
+        other.add_faq(f'Новый вопрос {i}', 'Ответ', admin_id)
+        start = time.perf_counter()
+        db.sync_external_changes()
+        spent += time.perf_counter() - start
+    print(f"{'опрос после записи':<40} {spent / writes * 1_000_000:>24.1f} мкс")
+    print(f"доля времени при опросе раз в секунду: {idle / 1_000_000 * 100:.4f}%")
+    uncached.close()
+    other.close()
+    db.close()
+
+
+def bench_version_numbering(db_path, clients=4, versions=200):
+    """Сохраняет версии из нескольких рабочих мест одновременно и проверяет номера."""
+    setup = Database(db_path)
+    admin_id = setup.add_user('bench', 'bench', True)
+    setup.close()
+
+    def client_number(db):
+        # Так номер вычислял AdminWindow: читал последнюю версию и записывал
+        # следующую отдельным запросом
+        parts = db.get_latest_version()[1].split('.')
+        parts[-1] = str(int(parts[-1]) + 1)
+        number = '.'.join(parts)
+        with db.transaction():
+            db.create_new_version(number, 'Версия', '', admin_id)
+
+    def counter_number(db):
+        with db.transaction():
+            db.create_next_version('Версия', '', admin_id)
+
+    schemes = [('номер клиента', client_number), ('счетчик в базе', counter_number)]
+    print(f"{'Нумерация версий':<40} {'мкс/версия':>13} {'конфликтов':>13}")
+    for name, create in schemes:
+        # У каждого рабочего места свой объект Database, как у отдельного процесса
+        databases = [Database(db_path) for _ in range(clients)]
+        conflicts = [0] * clients
+
+        def work(client):
+            for _ in range(versions):
+                try:
+                    create(databases[client])
+                except sqlite3.IntegrityError:
+                    conflicts[client] += 1
+
+        threads = [threading.Thread(target=work, args=(client,)) for client in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        spent = (time.perf_counter() - start) / (clients * versions) * 1_000_000
+        print(f"{name:<40} {spent:>13.1f} {sum(conflicts):>13}")
+        for db in databases:
+            db.close()
+
+    check = Database(db_path)
+    with check._connect() as conn:
+        total, distinct = conn.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT version_number) FROM system_versions'
+        ).fetchone()
+    print(f"версий: {total}, различных номеров: {distinct}")
+    check.close()
+
+
+BENCHMARKS = {
+    'pool': bench_connection_pool,
+    'filter': bench_list_filter,
+    'versions': bench_version_storage,
+    'restore': bench_restore,
+    'manifest': bench_manifest_capture,
+    'listing': bench_document_listing,
+    'records': bench_records,
+    'bulk': bench_bulk_writes,
+    'cache': bench_query_cache,
+    'watch': bench_change_polling,
+    'history': bench_version_history,
+    'numbering': bench_version_numbering,
+}
+
+
+def main(names):
+    for name in names or BENCHMARKS:
+        with tempfile.TemporaryDirectory() as tmp:
+            BENCHMARKS[name](os.path.join(tmp, 'bench.db'))
+        print()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,69 @@
+"""Ограниченный кэш с вытеснением давно не использованных записей."""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_entries):
+        """max_entries - сколько записей хранить; 0 отключает кэш."""
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Кэш общий для всех потоков, работающих с одним объектом Database
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Растет при каждом сбросе записей, см. put()
+        self.generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Возвращает значение и помечает запись как недавно использованную."""
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key, value, generation=None):
+        """Сохраняет значение.
+
+        generation - значение self.generation до чтения value из базы: если
+        с тех пор записи сбрасывались, value могло устареть и не сохраняется.
+        """
+        with self._lock:
+            if self.max_entries <= 0:
+                return
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """Возвращает размер кэша и счетчики попаданий и промахов."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -1,213 +1,413 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 import json
+import uuid
+from manifests import capture_manifest, drop_manifest, forget_document_version, resolve_manifest
+from migrations import migrate, split_version_number
+from records import RecordReader, contains_text
+from cache import LRUCache
+from events import (BulkInserted, ChangesLost, DocumentAdded, DocumentDeleted, DocumentsRestored,
+                    DocumentUpdated, DocumentVersionDeleted, EventBus, FaqAdded, FaqDeleted,
+                    FaqUpdated, GlossaryAdded, GlossaryDeleted, GlossaryUpdated, QuestionAnswered,
+                    QuestionAsked, QuestionDeleted, RatingAdded, SystemVersionChanged,
+                    SystemVersionCreated, SystemVersionDeleted, UserAdded, UserDeleted,
+                    decode_event, encode_event)
+from version_store import (KEYFRAME_INTERVAL, apply_delta, compress_blob, content_digest,
+                           decompress_blob, encode_version)
+
+# Таблицы меньше этого числа строк не анализируются при закрытии: по статистике
+# почти пустой таблицы планировщик выбирает полный проход вместо индекса
+ANALYZE_MIN_ROWS = 1000
+
+# Сколько последних записей хранит журнал изменений для других процессов;
+# чистится при каждой CHANGE_LOG_PRUNE_EVERY-й записи
+CHANGE_LOG_SIZE = 10000
+CHANGE_LOG_PRUNE_EVERY = 100
+
+# Профили хранения: PRAGMA-настройки, применяемые к каждому соединению.
+# cache_size в отрицательном виде задается в килобайтах, mmap_size - в байтах.
+STORAGE_PROFILES = {
+    # Одно рабочее место: читатели не ждут писателя, fsync только на checkpoint
+    'desktop': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+        'wal_autocheckpoint': 1000,
+        'checkpoint_on_close': 'TRUNCATE',
+    },
+    # Общий файл базы, много одновременных читателей и редкие записи администратора
+    'shared': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -32000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 15000,
+        # Реже запускаем checkpoint, чтобы не мешать читателям
+        'wal_autocheckpoint': 4000,
+        'checkpoint_on_close': 'PASSIVE',
+    },
+}
+
+# Порядок применения важен: journal_mode должен быть установлен первым
+STORAGE_PRAGMAS = ('journal_mode', 'synchronous', 'mmap_size', 'cache_size',
+                   'temp_store', 'busy_timeout', 'wal_autocheckpoint')
+
+# Сколько строк массовые методы передают в один executemany
+BULK_CHUNK_SIZE = 500
+
+# Версий системы в одной странице get_versions_page
+VERSIONS_PAGE_SIZE = 200
+
+# Отличает отсутствие записи в кэше от сохраненного None
+_MISSING = object()
+
+
+def _chunks(rows, size):
+    """Разбивает любой итерируемый набор строк на списки не длиннее size."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 
 class Database:
-    def __init__(self, db_name='documentation.db'):
+    def __init__(self, db_name='documentation.db', cached_statements=256,
+                 storage_profile='desktop', content_cache_size=64, query_cache_size=128,
+                 rating_history=True):
         self.db_name = db_name
+        # Размер кэша подготовленных выражений для каждого соединения
+        self.cached_statements = cached_statements
+        self.storage_profile = self._resolve_storage_profile(storage_profile)
+        # Пул соединений: по одному соединению на поток
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # Тексты недавно открытых документов; списки документов их не хранят
+        self._content_cache = LRUCache(content_cache_size)
+        # Результаты частых чтений по ключам сущностей, см. _cached;
+        # query_cache_size=0 отключает кэш
+        self._query_cache = LRUCache(query_cache_size)
+        # Сохранять ли замененные оценки в rating_history, см. _set_ratings
+        self.rating_history = rating_history
+        # События изменений, публикуемые после фиксации, см. events.py
+        self.events = EventBus()
+        # Метка этого объекта в журнале изменений: свои записи при опросе пропускаются
+        self.source_id = uuid.uuid4().hex
+        self._sync_lock = threading.Lock()
+        # Необязательный слой чтения записями с именованными полями, см. records.py
+        self.records = RecordReader(self)
         self.init_database()
+        # Последняя запись журнала, уже известная этому объекту
+        self._change_seq = self._fetch_one('SELECT COALESCE(MAX(seq), 0) FROM change_log')[0]
 
-    def init_database(self):
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            
-            # Создание таблицы пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password TEXT NOT NULL,
-                    is_admin BOOLEAN NOT NULL DEFAULT 0,
-                    created_at TIMESTAMP NOT NULL
-                )
-            ''')
-            
-            # Проверяем наличие колонки is_admin
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [column[1] for column in cursor.fetchall()]
-            
-            # Если колонки is_admin нет, добавляем её
-            if 'is_admin' not in columns:
-                # Создаем временную таблицу
-                cursor.execute('''
-                    CREATE TABLE users_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        username TEXT UNIQUE NOT NULL,
-                        password TEXT NOT NULL,
-                        is_admin BOOLEAN NOT NULL DEFAULT 0,
-                        created_at TIMESTAMP NOT NULL
-                    )
-                ''')
-                
-                # Определяем, какие колонки есть в текущей таблице
-                if 'created_at' in columns:
-                    # Копируем данные, устанавливая is_admin на основе role (если есть)
-                    if 'role' in columns:
-                        cursor.execute('''
-                            INSERT INTO users_temp (id, username, password, is_admin, created_at)
-                            SELECT id, username, password, 
-                                   CASE WHEN role = 'admin' THEN 1 ELSE 0 END,
-                                   created_at
-                            FROM users
-                        ''')
-                    else:
-                        cursor.execute('''
-                            INSERT INTO users_temp (id, username, password, is_admin, created_at)
-                            SELECT id, username, password, 0, created_at FROM users
-                        ''')
-                else:
-                    # Если нет created_at, добавляем текущее время
-                    now = datetime.now()
-                    if 'role' in columns:
-                        cursor.execute('''
-                            INSERT INTO users_temp (id, username, password, is_admin, created_at)
-                            SELECT id, username, password, 
-                                   CASE WHEN role = 'admin' THEN 1 ELSE 0 END,
-                                   ?
-                            FROM users
-                        ''', (now,))
-                    else:
-                        cursor.execute('''
-                            INSERT INTO users_temp (id, username, password, is_admin, created_at)
-                            SELECT id, username, password, 0, ? FROM users
-                        ''', (now,))
-                
-                # Удаляем старую таблицу и переименовываем временную
-                cursor.execute('DROP TABLE users')
-                cursor.execute('ALTER TABLE users_temp RENAME TO users')
-            
-            # Создание таблицы документов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS documents (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    version INTEGER NOT NULL DEFAULT 1,
-                    created_at TIMESTAMP NOT NULL,
-                    updated_at TIMESTAMP NOT NULL,
-                    created_by INTEGER NOT NULL,
-                    doc_type TEXT NOT NULL DEFAULT 'user',
-                    FOREIGN KEY (created_by) REFERENCES users (id)
-                )
-            ''')
-            
-            # Проверяем наличие колонки doc_type
-            cursor.execute("PRAGMA table_info(documents)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'doc_type' not in columns:
-                cursor.execute('ALTER TABLE documents ADD COLUMN doc_type TEXT NOT NULL DEFAULT "user"')
-            
-            # Создание таблицы версий документов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS document_versions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    document_id INTEGER NOT NULL,
-                    content TEXT NOT NULL,
-                    version INTEGER NOT NULL,
-                    created_at TIMESTAMP NOT NULL,
-                    created_by INTEGER NOT NULL,
-                    FOREIGN KEY (document_id) REFERENCES documents (id),
-                    FOREIGN KEY (created_by) REFERENCES users (id)
-                )
-            ''')
-            
-            # Создание таблицы глоссария
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS glossary (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    term TEXT NOT NULL,
-                    definition TEXT NOT NULL,
-                    created_at TIMESTAMP NOT NULL,
-                    created_by INTEGER NOT NULL,
-                    FOREIGN KEY (created_by) REFERENCES users (id)
-                )
-            ''')
-            
-            # Создание таблицы FAQ
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS faq (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    question TEXT NOT NULL,
-                    answer TEXT NOT NULL,
-                    created_at TIMESTAMP NOT NULL,
-                    created_by INTEGER NOT NULL,
-                    FOREIGN KEY (created_by) REFERENCES users (id)
-                )
-            ''')
-            
-            # Создание таблицы вопросов пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_questions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    question TEXT NOT NULL,
-                    status TEXT NOT NULL DEFAULT 'new',
-                    created_at TIMESTAMP NOT NULL,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Создание таблицы оценок разделов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS ratings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    document_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    rating INTEGER NOT NULL,
-                    comment TEXT,
-                    created_at TIMESTAMP NOT NULL,
-                    FOREIGN KEY (document_id) REFERENCES documents (id),
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Создание таблицы версий системы
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS system_versions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    version_number TEXT NOT NULL,
-                    description TEXT NOT NULL,
-                    changes TEXT NOT NULL,
-                    created_at TIMESTAMP NOT NULL,
-                    created_by INTEGER NOT NULL,
-                    FOREIGN KEY (created_by) REFERENCES users (id)
-                )
-            ''')
-            
-            # Создание таблицы изменений в версиях
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS version_changes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    version_id INTEGER NOT NULL,
-                    change_type TEXT NOT NULL,
-                    entity_type TEXT NOT NULL,
-                    entity_id INTEGER NOT NULL,
-                    description TEXT NOT NULL,
-                    created_at TIMESTAMP NOT NULL,
-                    FOREIGN KEY (version_id) REFERENCES system_versions (id)
-                )
-            ''')
-            
+    def _get_connection(self):
+        """Возвращает соединение текущего потока, открывая его при первом обращении."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # check_same_thread=False нужен только для close() из другого потока,
+            # само соединение используется лишь потоком-владельцем
+            conn = sqlite3.connect(
+                self.db_name,
+                check_same_thread=False,
+                cached_statements=self.cached_statements
+            )
+            self._apply_storage_profile(conn)
+            # Фильтр списков по подстроке, см. RecordReader
+            conn.create_function('contains_text', 2, contains_text, deterministic=True)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _resolve_storage_profile(profile):
+        """Возвращает словарь настроек по имени профиля или дополняет переданный словарь."""
+        if isinstance(profile, str):
+            if profile not in STORAGE_PROFILES:
+                raise ValueError(f"Неизвестный профиль хранения: {profile}")
+            return dict(STORAGE_PROFILES[profile])
+        settings = dict(STORAGE_PROFILES['desktop'])
+        settings.update(profile or {})
+        return settings
+
+    def _apply_storage_profile(self, conn):
+        """Применяет PRAGMA-настройки профиля хранения к соединению."""
+        for pragma in STORAGE_PRAGMAS:
+            value = self.storage_profile.get(pragma)
+            if value is not None:
+                conn.execute(f'PRAGMA {pragma} = {value}')
+
+    def get_storage_settings(self):
+        """Возвращает фактические значения настроек хранения для текущего соединения."""
+        with self._connect() as conn:
+            settings = {
+                pragma: conn.execute(f'PRAGMA {pragma}').fetchone()[0]
+                for pragma in STORAGE_PRAGMAS
+            }
+        settings['checkpoint_on_close'] = self.storage_profile.get('checkpoint_on_close')
+        return settings
+
+    def checkpoint(self, mode='PASSIVE'):
+        """Переносит журнал WAL в основной файл базы; возвращает (busy, log, checkpointed)."""
+        with self._connect() as conn:
+            return conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+
+    @contextmanager
+    def _connect(self, begin=None):
+        """Выдает соединение потока и фиксирует транзакцию (или откатывает при ошибке).
+
+        Внешний вызов владеет транзакцией: фиксирует ее и затем выполняет отложенные
+        действия из _after_commit. Вложенный вызов (например, метод внутри
+        transaction()) присоединяется к уже открытой транзакции через SAVEPOINT:
+        при ошибке откатывается только его часть, а фиксирует все внешний вызов.
+        begin - команда, открывающая транзакцию внешнего вызова (например, BEGIN IMMEDIATE).
+        """
+        conn = self._get_connection()
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            if not conn.in_transaction:
+                conn.execute('BEGIN')
+            savepoint = f'scope_{depth}'
+            conn.execute(f'SAVEPOINT {savepoint}')
+            self._local.depth = depth + 1
+            try:
+                yield conn
+            except BaseException:
+                conn.execute(f'ROLLBACK TO {savepoint}')
+                conn.execute(f'RELEASE {savepoint}')
+                raise
+            else:
+                conn.execute(f'RELEASE {savepoint}')
+            finally:
+                self._local.depth = depth
+            return
+
+        if begin and not conn.in_transaction:
+            conn.execute(begin)
+        self._local.depth = 1
+        self._local.after_commit = []
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            self._local.after_commit = []
+            raise
+        else:
             conn.commit()
-            
-            # Проверяем, есть ли уже версии системы
-            cursor.execute('SELECT COUNT(*) FROM system_versions')
-            count = cursor.fetchone()[0]
-            
-            # Если версий нет, создаем начальную версию
-            if count == 0:
-                now = datetime.now()
-                cursor.execute(
-                    '''INSERT INTO system_versions 
-                       (version_number, description, changes, created_at, created_by)
-                       VALUES (?, ?, ?, ?, ?)''',
-                    ('1.0', 'Начальная версия системы', 'Создание системы документации', now, 1)
-                )
-                conn.commit()
+        finally:
+            self._local.depth = 0
+        callbacks, self._local.after_commit = self._local.after_commit, []
+        for callback in callbacks:
+            callback()
+
+    @contextmanager
+    def transaction(self):
+        """Единица работы: все вызовы методов Database внутри блока - одна транзакция.
+
+        Транзакция фиксируется один раз при выходе из блока и целиком
+        откатывается, если в блоке возникло исключение. Транзакция привязана
+        к потоку; вложенный transaction() становится точкой сохранения.
+
+        Пример:
+            with db.transaction():
+                db.update_document(doc_id, content, user_id)
+                version_id = db.create_next_version(description, changes, user_id)
+                db.add_version_change(version_id, 'update', 'document', doc_id, text)
+        """
+        # BEGIN IMMEDIATE сразу берет блокировку записи: транзакция не упадет
+        # с SQLITE_BUSY посередине, когда первое чтение пришлось бы повышать до записи
+        with self._connect('BEGIN IMMEDIATE'):
+            yield self
+
+    def _after_commit(self, callback):
+        """Выполняет callback после фиксации текущей транзакции (или сразу, если ее нет)."""
+        if getattr(self._local, 'depth', 0):
+            self._local.after_commit.append(callback)
+        else:
+            callback()
+
+    def _forget_content(self, doc_id=None):
+        """Сбрасывает кэш текстов для документа (или весь) сейчас и после фиксации.
+
+        Повторный сброс после фиксации не дает другому потоку оставить в кэше
+        старый текст, прочитанный до фиксации.
+        """
+        forget = self._content_cache.clear if doc_id is None else (
+            lambda: self._content_cache.pop(doc_id)
+        )
+        forget()
+        self._after_commit(forget)
+
+    def _invalidate(self, *keys):
+        """Сбрасывает записи кэша запросов с указанными ключами сейчас и после фиксации.
+
+        Ключ - кортеж: (сущность,) для списка, (сущность, id) для одной записи.
+        """
+        def forget():
+            for key in keys:
+                self._query_cache.pop(key)
+
+        forget()
+        self._after_commit(forget)
+
+    def _publish(self, event):
+        """Публикует событие после фиксации текущей транзакции; при откате оно отбрасывается.
+
+        Событие записывается в журнал change_log, откуда его читают другие
+        процессы (см. sync_external_changes). Вызывать внутри _connect() того
+        изменения, о котором событие: тогда запись в журнал фиксируется вместе
+        с ним, а не отдельной транзакцией.
+        """
+        name, args = encode_event(event)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO change_log (source, event, args) VALUES (?, ?, ?)',
+                (self.source_id, name, args)
+            )
+            if cursor.lastrowid % CHANGE_LOG_PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM change_log WHERE seq <= ?',
+                             (cursor.lastrowid - CHANGE_LOG_SIZE,))
+        self._after_commit(lambda: self.events.publish(event))
+
+    def sync_external_changes(self):
+        """Применяет изменения, зафиксированные другими процессами, и возвращает их события.
+
+        Пока в базу никто не писал, проверка стоит одного PRAGMA data_version.
+        Иначе новые записи журнала других процессов превращаются в события:
+        кэши сбрасываются, а события публикуются в self.events так же, как
+        события собственных изменений. Если часть журнала уже удалена,
+        публикуется ChangesLost.
+        """
+        if getattr(self._local, 'depth', 0):
+            # Внутри транзакции события не публикуются, проверим в следующий раз
+            return []
+        conn = self._get_connection()
+        # data_version меняется, когда базу изменило другое соединение
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == getattr(self._local, 'data_version', None):
+            return []
+        self._local.data_version = version
+        with self._sync_lock:
+            rows = self._fetch_all(
+                'SELECT seq, source, event, args FROM change_log WHERE seq > ? ORDER BY seq',
+                (self._change_seq,)
+            )
+            if not rows:
+                return []
+            lost = rows[0][0] > self._change_seq + 1
+            self._change_seq = rows[-1][0]
+        events = []
+        for _, source, name, args in rows:
+            if source == self.source_id:
+                continue
+            event = decode_event(name, args)
+            if event is None:
+                lost = True
+                break
+            events.append(event)
+        if lost:
+            events = [ChangesLost()]
+        if not events:
+            return []
+        # Кэши ничего не знают о записях других процессов
+        self._query_cache.clear()
+        for event in events:
+            if isinstance(event, (DocumentUpdated, DocumentDeleted)):
+                self._content_cache.pop(event.id)
+            elif isinstance(event, (DocumentsRestored, ChangesLost)):
+                self._content_cache.clear()
+        for event in events:
+            self.events.publish(event)
+        return events
+
+    def _cached(self, key, load):
+        """Возвращает результат load() через кэш запросов.
+
+        Внутри транзакции результат в кэш не кладется: он может содержать
+        незафиксированные изменения, которых не должны видеть другие потоки.
+        """
+        value = self._query_cache.get(key, _MISSING)
+        if value is _MISSING:
+            generation = self._query_cache.generation
+            value = load()
+            if not getattr(self._local, 'depth', 0):
+                self._query_cache.put(key, value, generation)
+        # Списки копируем, чтобы вызывающий код не изменил запись кэша
+        return list(value) if isinstance(value, list) else value
+
+    def cache_stats(self):
+        """Возвращает размер и счетчики попаданий кэшей запросов и текстов документов."""
+        return {'queries': self._query_cache.stats(), 'content': self._content_cache.stats()}
+
+    def _fetch_all(self, sql, params=()):
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _fetch_one(self, sql, params=()):
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    @staticmethod
+    def _optimize(conn):
+        """Обновляет статистику планировщика по заполненным таблицам, как PRAGMA optimize.
+
+        PRAGMA optimize с отладочным флагом 0x01 только перечисляет таблицы,
+        которым по запросам соединения нужен ANALYZE; из них анализируются
+        те, где не меньше ANALYZE_MIN_ROWS строк.
+        """
+        for (statement,) in conn.execute('PRAGMA optimize(0x03)').fetchall():
+            # 'ANALYZE "main"."таблица"' -> '"таблица"'
+            table = statement.partition('.')[2]
+            rows = conn.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM {table} LIMIT ?)',
+                                (ANALYZE_MIN_ROWS,)).fetchone()[0]
+            if rows >= ANALYZE_MIN_ROWS:
+                conn.execute(f'ANALYZE {table}')
+
+    def close(self):
+        """Закрывает все соединения пула, обновив перед этим статистику планировщика."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            try:
+                self._optimize(conn)
+            except sqlite3.Error:
+                # Статистика не критична: ее обновит следующее закрытие
+                pass
+        mode = self.storage_profile.get('checkpoint_on_close')
+        if mode and connections:
+            try:
+                connections[0].execute(f'PRAGMA wal_checkpoint({mode})')
+            except sqlite3.Error:
+                # Checkpoint не критичен: его выполнит следующий писатель
+                pass
+        for conn in connections:
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def init_database(self):
+        """Приводит схему базы к актуальной версии, применяя недостающие миграции."""
+        with self._connect() as conn:
+            migrate(conn)
 
     def add_user(self, username, password, is_admin):
         """Добавляет нового пользователя."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             now = datetime.now()
             # Преобразуем is_admin в 1 или 0
@@ -218,11 +418,12 @@ class Database:
                    VALUES (?, ?, ?, ?)''',
                 (username, password, is_admin_int, now)
             )
-            conn.commit()
+            self._invalidate(('users',))
+            self._publish(UserAdded(cursor.lastrowid))
             return cursor.lastrowid
 
     def get_user(self, username, password):
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 'SELECT * FROM users WHERE username = ? AND password = ?',
@@ -232,11 +433,15 @@ class Database:
 
     def add_document(self, title, content, user_id, doc_type='user'):
         """Добавляет новый документ."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             now = datetime.now()
-            
-            # Создаем документ
+
+            # Создаем документ. Текущий текст хранится в documents.content, а не
+            # ссылкой на content_blobs: текущая версия обычно хранится разницей
+            # к опорной, и каждое открытие документа, фрагмент поиска (documents_fts
+            # читает внешнее содержимое из documents) и перепроверка фильтра
+            # восстанавливали бы текст по цепочке разниц
             cursor.execute(
                 '''INSERT INTO documents 
                    (title, content, created_at, updated_at, created_by, version, doc_type)
@@ -246,19 +451,19 @@ class Database:
             doc_id = cursor.lastrowid
             
             # Создаем первую версию
+            version_id = self._insert_document_version(cursor, doc_id, content, 1, now, user_id)
             cursor.execute(
-                '''INSERT INTO document_versions 
-                   (document_id, content, version, created_at, created_by)
-                   VALUES (?, ?, ?, ?, ?)''',
-                (doc_id, content, 1, now, user_id)
+                'UPDATE documents SET content_version_id = ? WHERE id = ?',
+                (version_id, doc_id)
             )
+            self._invalidate(('documents',))
+            self._publish(DocumentAdded(doc_id))
             
-            conn.commit()
             return doc_id
 
     def update_document(self, doc_id, content, user_id, title=None):
         """Обновляет документ и создает новую версию."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Получаем текущую версию
@@ -266,58 +471,169 @@ class Database:
             current_version = cursor.fetchone()[0]
             new_version = current_version + 1
             
-            # Обновляем документ
+            # Сохраняем новую версию
             now = datetime.now()
+            version_id = self._insert_document_version(
+                cursor, doc_id, content, new_version, now, user_id
+            )
+            
+            # Обновляем документ
             if title:
                 cursor.execute(
                     '''UPDATE documents 
-                       SET content = ?, version = ?, updated_at = ?, title = ?
+                       SET content = ?, version = ?, updated_at = ?, title = ?,
+                           content_version_id = ?
                        WHERE id = ?''',
-                    (content, new_version, now, title, doc_id)
+                    (content, new_version, now, title, version_id, doc_id)
                 )
             else:
                 cursor.execute(
                     '''UPDATE documents 
-                       SET content = ?, version = ?, updated_at = ?
+                       SET content = ?, version = ?, updated_at = ?, content_version_id = ?
                        WHERE id = ?''',
-                    (content, new_version, now, doc_id)
+                    (content, new_version, now, version_id, doc_id)
                 )
-            
-            # Сохраняем новую версию
+            self._forget_content(doc_id)
+            self._invalidate(('documents',))
+            self._publish(DocumentUpdated(doc_id, new_version))
+
+    def _store_blob(self, cursor, content):
+        """Кладет текст в хранилище content_blobs, если его там еще нет; возвращает хеш."""
+        digest = content_digest(content)
+        cursor.execute(
+            '''INSERT OR IGNORE INTO content_blobs (hash, data, size)
+               VALUES (?, ?, ?)''',
+            (digest, compress_blob(content), len(content))
+        )
+        return digest
+
+    def _insert_document_version(self, cursor, doc_id, content, version, created_at, user_id):
+        """Сохраняет версию документа ссылкой на хранилище текстов или разницей с предыдущей."""
+        digest = content_digest(content)
+        cursor.execute('SELECT 1 FROM content_blobs WHERE hash = ?', (digest,))
+        if cursor.fetchone():
+            # Такой текст уже хранится (сохранение без правок, восстановление версии):
+            # новая опорная версия стоит одной ссылки
+            stored, delta, depth, base_id = '', None, 0, None
+        else:
             cursor.execute(
-                '''INSERT INTO document_versions 
-                   (document_id, content, version, created_at, created_by)
-                   VALUES (?, ?, ?, ?, ?)''',
-                (doc_id, content, new_version, now, user_id)
+                '''SELECT id, delta_depth FROM document_versions
+                   WHERE document_id = ?
+                   ORDER BY version DESC, id DESC
+                   LIMIT 1''',
+                (doc_id,)
             )
-            conn.commit()
+            previous = cursor.fetchone()
+            base_id, base, base_depth = None, None, 0
+            # Если цепочка уже достигла предела, разницу не считаем вовсе
+            if previous and previous[1] + 1 < KEYFRAME_INTERVAL:
+                base_id, base_depth = previous
+                base = self._version_content(cursor, base_id)
+            stored, delta, depth = encode_version(base, base_depth, content)
+            if delta is None:
+                stored, base_id = '', None
+                self._store_blob(cursor, content)
+        cursor.execute(
+            '''INSERT INTO document_versions 
+               (document_id, content, version, created_at, created_by,
+                delta, base_id, delta_depth, content_hash)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (doc_id, stored, version, created_at, user_id,
+             delta, base_id, depth, digest if delta is None else None)
+        )
+        return cursor.lastrowid
+
+    def _version_content(self, cursor, version_id):
+        """Восстанавливает текст версии: опорная версия плюс не более KEYFRAME_INTERVAL - 1 разниц."""
+        cursor.execute(
+            '''WITH RECURSIVE chain (id, base_id, content, delta, content_hash, step) AS (
+                   SELECT id, base_id, content, delta, content_hash, 0
+                   FROM document_versions WHERE id = ?
+                   UNION ALL
+                   SELECT dv.id, dv.base_id, dv.content, dv.delta, dv.content_hash, chain.step + 1
+                   FROM document_versions dv
+                   JOIN chain ON dv.id = chain.base_id
+                   WHERE chain.delta IS NOT NULL
+               )
+               SELECT chain.content, chain.delta, cb.data
+               FROM chain
+               LEFT JOIN content_blobs cb ON cb.hash = chain.content_hash
+               ORDER BY chain.step DESC''',
+            (version_id,)
+        )
+        chain = cursor.fetchall()
+        if not chain:
+            return None
+        # Текст опорной версии лежит в хранилище, у старых строк - в самой версии
+        content, _, blob = chain[0]
+        if blob is not None:
+            content = decompress_blob(blob)
+        for _, delta, _ in chain[1:]:
+            content = apply_delta(content, delta)
+        return content
+
+    def collect_garbage(self):
+        """Удаляет из хранилища тексты, на которые не ссылается ни одна версия."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM content_blobs WHERE ref_count <= 0')
+            return cursor.rowcount
+
+    def get_document_version_content(self, version_id):
+        """Возвращает текст указанной версии документа."""
+        with self._connect() as conn:
+            return self._version_content(conn.cursor(), version_id)
 
     def get_document_versions(self, doc_id):
         """Возвращает все версии документа."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                '''SELECT dv.*, u.username 
+                '''SELECT dv.id, dv.document_id, dv.content, dv.version, dv.created_at,
+                          dv.created_by, u.username, dv.delta, dv.base_id, dv.content_hash, cb.data
                    FROM document_versions dv
                    JOIN users u ON u.id = dv.created_by
+                   -- Сжатые тексты опорных версий читаются тем же запросом
+                   LEFT JOIN content_blobs cb ON cb.hash = dv.content_hash
                    WHERE document_id = ?
                    ORDER BY version DESC''',
                 (doc_id,)
             )
-            return cursor.fetchall()
+            rows = cursor.fetchall()
+            # Разница всегда ссылается на более раннюю версию, поэтому
+            # восстанавливаем тексты по возрастанию id за один проход
+            contents = {}
+            # Одинаковые опорные версии разжимаем один раз
+            keyframes = {}
+            for row in sorted(rows, key=lambda row: row[0]):
+                version_id, delta, base_id, digest = row[0], row[7], row[8], row[9]
+                if delta is None:
+                    if digest is not None and digest not in keyframes:
+                        keyframes[digest] = decompress_blob(row[10])
+                    contents[version_id] = keyframes[digest] if digest is not None else row[2]
+                else:
+                    if base_id not in contents:
+                        # Базовая версия не попала в выборку (например, автор удален)
+                        contents[base_id] = self._version_content(cursor, base_id)
+                    contents[version_id] = apply_delta(contents[base_id], delta)
+            return [row[:2] + (contents[row[0]],) + row[3:7] for row in rows]
 
     def get_document_version(self, version_id):
         """Возвращает конкретную версию документа."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                '''SELECT * FROM document_versions WHERE id = ?''',
+                '''SELECT id, document_id, content, version, created_at, created_by
+                   FROM document_versions WHERE id = ?''',
                 (version_id,)
             )
-            return cursor.fetchone()
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return row[:2] + (self._version_content(cursor, version_id),) + row[3:]
 
     def add_glossary_term(self, term, definition, user_id):
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             now = datetime.now()
             cursor.execute(
@@ -326,11 +642,12 @@ class Database:
                    VALUES (?, ?, ?, ?, ?)''',
                 (term, definition, now, now, user_id)
             )
-            conn.commit()
+            self._invalidate(('glossary',))
+            self._publish(GlossaryAdded(cursor.lastrowid))
             return cursor.lastrowid
 
     def add_faq(self, question, answer, user_id):
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             now = datetime.now()
             cursor.execute(
@@ -339,11 +656,12 @@ class Database:
                    VALUES (?, ?, ?, ?, ?)''',
                 (question, answer, now, now, user_id)
             )
-            conn.commit()
+            self._invalidate(('faq',))
+            self._publish(FaqAdded(cursor.lastrowid))
             return cursor.lastrowid
 
     def add_user_question(self, user_id, question):
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             now = datetime.now()
             cursor.execute(
@@ -352,60 +670,276 @@ class Database:
                    VALUES (?, ?, 'new', ?)''',
                 (user_id, question, now)
             )
-            conn.commit()
+            self._publish(QuestionAsked(cursor.lastrowid, user_id))
             return cursor.lastrowid
 
     def add_rating(self, document_id, user_id, rating, comment=None):
-        with sqlite3.connect(self.db_name) as conn:
+        """Ставит оценку документу; повторная оценка пользователя заменяет прежнюю."""
+        with self._connect() as conn:
+            rating_id = self._set_ratings(
+                conn.cursor(), [(document_id, user_id, rating, comment, datetime.now())]
+            )[0]
+            self._publish(RatingAdded(rating_id, document_id))
+            return rating_id
+
+    def _set_ratings(self, cursor, rows):
+        """Записывает оценки (document_id, user_id, rating, comment, created_at) и возвращает их id.
+
+        Оценка пользователя для документа одна (idx_ratings_document_user):
+        повторная обновляет ее строку, а прежнее значение при rating_history
+        копируется в rating_history.
+        """
+        if self.rating_history:
+            cursor.executemany(
+                '''INSERT INTO rating_history
+                   (document_id, user_id, rating, comment, rated_at, replaced_at)
+                   SELECT document_id, user_id, rating, comment, created_at, ?
+                   FROM ratings
+                   WHERE document_id = ? AND user_id = ?''',
+                [(row[4], row[0], row[1]) for row in rows]
+            )
+        cursor.executemany(
+            '''INSERT INTO ratings 
+               (document_id, user_id, rating, comment, created_at)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (document_id, user_id) DO UPDATE SET
+                   rating = excluded.rating,
+                   comment = excluded.comment,
+                   created_at = excluded.created_at''',
+            rows
+        )
+        # При обновлении lastrowid не меняется, поэтому id читаем по уникальному индексу
+        ids = []
+        for row in rows:
+            cursor.execute('SELECT id FROM ratings WHERE document_id = ? AND user_id = ?',
+                           (row[0], row[1]))
+            ids.append(cursor.fetchone()[0])
+        return ids
+
+    @staticmethod
+    def _inserted_ids(cursor, count):
+        """Возвращает id строк, только что вставленных одним executemany.
+
+        Запись идет под блокировкой транзакции, поэтому AUTOINCREMENT выдает
+        строкам одного вызова подряд идущие id.
+        """
+        cursor.execute('SELECT last_insert_rowid()')
+        last = cursor.fetchone()[0]
+        return list(range(last - count + 1, last + 1))
+
+    def _insert_bulk(self, sql, rows, chunk_size):
+        """Вставляет строки частями в одной транзакции и возвращает их id."""
+        ids = []
+        with self._connect() as conn:
             cursor = conn.cursor()
-            now = datetime.now()
-            cursor.execute(
-                '''INSERT INTO ratings 
-                   (document_id, user_id, rating, comment, created_at)
+            for chunk in _chunks(rows, chunk_size):
+                cursor.executemany(sql, chunk)
+                ids.extend(self._inserted_ids(cursor, len(chunk)))
+        return ids
+
+    def add_documents_bulk(self, documents, user_id, chunk_size=BULK_CHUNK_SIZE):
+        """Добавляет документы с первыми версиями в одной транзакции.
+
+        documents - строки (title, content) или (title, content, doc_type).
+        Возвращает id документов в порядке строк.
+        """
+        ids = []
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            for chunk in _chunks(documents, chunk_size):
+                now = datetime.now()
+                cursor.executemany(
+                    '''INSERT INTO documents 
+                       (title, content, created_at, updated_at, created_by, version, doc_type)
+                       VALUES (?, ?, ?, ?, ?, 1, ?)''',
+                    [(doc[0], doc[1], now, now, user_id, doc[2] if len(doc) > 2 else 'user')
+                     for doc in chunk]
+                )
+                doc_ids = self._inserted_ids(cursor, len(chunk))
+
+                # Первая версия всегда опорная: текст кладем в хранилище по хешу
+                digests = [content_digest(doc[1]) for doc in chunk]
+                blobs = {digest: doc[1] for digest, doc in zip(digests, chunk)}
+                cursor.executemany(
+                    '''INSERT OR IGNORE INTO content_blobs (hash, data, size)
+                       VALUES (?, ?, ?)''',
+                    [(digest, compress_blob(content), len(content))
+                     for digest, content in blobs.items()]
+                )
+                cursor.executemany(
+                    '''INSERT INTO document_versions 
+                       (document_id, content, version, created_at, created_by, content_hash)
+                       VALUES (?, '', 1, ?, ?, ?)''',
+                    [(doc_id, now, user_id, digest) for doc_id, digest in zip(doc_ids, digests)]
+                )
+                version_ids = self._inserted_ids(cursor, len(chunk))
+                cursor.executemany(
+                    'UPDATE documents SET content_version_id = ? WHERE id = ?',
+                    zip(version_ids, doc_ids)
+                )
+                ids.extend(doc_ids)
+            self._invalidate(('documents',))
+            self._publish(BulkInserted('documents', tuple(ids)))
+        return ids
+
+    def add_glossary_terms_bulk(self, terms, user_id, chunk_size=BULK_CHUNK_SIZE):
+        """Добавляет термины (term, definition) в одной транзакции; возвращает их id."""
+        now = datetime.now()
+        # Событие пишется в change_log той же транзакцией, что и строки
+        with self._connect():
+            ids = self._insert_bulk(
+                '''INSERT INTO glossary 
+                   (term, definition, created_at, updated_at, created_by)
                    VALUES (?, ?, ?, ?, ?)''',
-                (document_id, user_id, rating, comment, now)
+                ((term, definition, now, now, user_id) for term, definition in terms),
+                chunk_size
             )
-            conn.commit()
-            return cursor.lastrowid
+            self._invalidate(('glossary',))
+            self._publish(BulkInserted('glossary', tuple(ids)))
+        return ids
+
+    def add_faqs_bulk(self, faqs, user_id, chunk_size=BULK_CHUNK_SIZE):
+        """Добавляет вопросы FAQ (question, answer) в одной транзакции; возвращает их id."""
+        now = datetime.now()
+        with self._connect():
+            ids = self._insert_bulk(
+                '''INSERT INTO faq 
+                   (question, answer, created_at, updated_at, created_by)
+                   VALUES (?, ?, ?, ?, ?)''',
+                ((question, answer, now, now, user_id) for question, answer in faqs),
+                chunk_size
+            )
+            self._invalidate(('faq',))
+            self._publish(BulkInserted('faq', tuple(ids)))
+        return ids
+
+    def add_ratings_bulk(self, ratings, chunk_size=BULK_CHUNK_SIZE):
+        """Ставит оценки (document_id, user_id, rating[, comment]) в одной транзакции.
+
+        Как и add_rating, заменяет прежние оценки тех же пользователей; из
+        нескольких оценок одной пары в наборе остается последняя.
+        """
+        now = datetime.now()
+        ids = []
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            for chunk in _chunks(
+                ((row[0], row[1], row[2], row[3] if len(row) > 3 else None, now)
+                 for row in ratings),
+                chunk_size
+            ):
+                ids.extend(self._set_ratings(cursor, chunk))
+            self._publish(BulkInserted('ratings', tuple(ids)))
+        return ids
+
+    def add_version_changes_bulk(self, changes, chunk_size=BULK_CHUNK_SIZE):
+        """Добавляет изменения (version_id, change_type, entity_type, entity_id, description)."""
+        now = datetime.now()
+        changes = list(changes)
+        with self._connect():
+            ids = self._insert_bulk(
+                '''INSERT INTO version_changes 
+                   (version_id, change_type, entity_type, entity_id, description, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                ((*change, now) for change in changes),
+                chunk_size
+            )
+            self._invalidate(('versions',),
+                             *{('version_changes', change[0]) for change in changes})
+            self._publish(BulkInserted('version_changes', tuple(ids)))
+        return ids
 
     def get_all_documents(self):
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM documents ORDER BY title')
             return cursor.fetchall()
 
+    def get_document_list(self):
+        """Возвращает документы для списков без текста: (id, title, doc_type, updated_at, version).
+
+        Запрос читается целиком из индекса idx_documents_listing и не касается
+        страниц с текстами документов.
+        """
+        def load():
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'SELECT id, title, doc_type, updated_at, version FROM documents ORDER BY title'
+                )
+                return cursor.fetchall()
+
+        return self._cached(('documents',), load)
+
     def get_document(self, doc_id):
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM documents WHERE id = ?', (doc_id,))
             return cursor.fetchone()
 
+    def get_document_content(self, doc_id):
+        """Возвращает текст документа или None; недавно открытые тексты берутся из кэша."""
+        content = self._content_cache.get(doc_id)
+        if content is None:
+            generation = self._content_cache.generation
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT content FROM documents WHERE id = ?', (doc_id,))
+                row = cursor.fetchone()
+            if row is None:
+                return None
+            content = row[0]
+            # Незафиксированный текст транзакции в общий кэш не попадает
+            if not getattr(self._local, 'depth', 0):
+                self._content_cache.put(doc_id, content, generation)
+        return content
+
     def get_all_glossary_terms(self):
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM glossary ORDER BY term')
-            return cursor.fetchall()
+        return self._cached(('glossary',), lambda: self._fetch_all(
+            'SELECT * FROM glossary ORDER BY term'
+        ))
 
     def get_all_faq(self):
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM faq ORDER BY question')
-            return cursor.fetchall()
+        return self._cached(('faq',), lambda: self._fetch_all(
+            'SELECT * FROM faq ORDER BY question'
+        ))
 
-    def search_documents(self, query):
-        with sqlite3.connect(self.db_name) as conn:
+    @staticmethod
+    def _fts_query(query):
+        """Преобразует пользовательский запрос в выражение FTS5: все слова, поиск по началу слова."""
+        terms = [term for term in query.split() if any(ch.isalnum() for ch in term)]
+        # Каждое слово берем в кавычки, чтобы операторы FTS5 в тексте не разбирались
+        return ' '.join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+    def search_documents(self, query, limit=None):
+        """Ищет документы через FTS5 и возвращает их по убыванию релевантности (BM25).
+
+        Колонки: id, title, content, version, created_at, updated_at, created_by, doc_type
+        и фрагмент текста, где совпадения выделены тегами <b>.
+        """
+        match = self._fts_query(query)
+        if not match:
+            return []
+        with self._connect() as conn:
             cursor = conn.cursor()
+            # Совпадение в заголовке весит в 10 раз больше, чем в тексте; по rank
+            # сортирует сам FTS5, до чтения строк documents
             cursor.execute(
-                '''SELECT * FROM documents 
-                   WHERE title LIKE ? OR content LIKE ?
-                   ORDER BY title''',
-                (f'%{query}%', f'%{query}%')
+                '''SELECT d.id, d.title, d.content, d.version, d.created_at, d.updated_at,
+                          d.created_by, d.doc_type,
+                          snippet(documents_fts, -1, '<b>', '</b>', '…', 16) AS snippet
+                   FROM documents_fts
+                   JOIN documents d ON d.id = documents_fts.rowid
+                   WHERE documents_fts MATCH ? AND rank MATCH 'bm25(10.0, 1.0)'
+                   ORDER BY rank
+                   LIMIT ?''',
+                (match, -1 if limit is None else limit)
             )
             return cursor.fetchall()
 
     def get_user_questions(self, status='new'):
         """Получает список вопросов пользователей с указанным статусом."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 '''SELECT user_questions.*, users.username 
@@ -418,7 +952,7 @@ class Database:
             return cursor.fetchall()
 
     def get_document_ratings(self, doc_id):
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 '''SELECT r.*, u.username 
@@ -430,38 +964,82 @@ class Database:
             )
             return cursor.fetchall()
 
+    def get_rating_summary(self, doc_ids):
+        """Возвращает сводки оценок документов doc_ids.
+
+        Словарь document_id -> (число оценок, сумма, средняя, (число оценок 1..5),
+        время последней оценки); сводки поддерживают триггеры на ratings, поэтому
+        оценки не перебираются. Документов, которых нет в базе, в словаре нет.
+        """
+        doc_ids = list(doc_ids)
+        summary = {}
+        with self._connect() as conn:
+            for start in range(0, len(doc_ids), BULK_CHUNK_SIZE):
+                chunk = doc_ids[start:start + BULK_CHUNK_SIZE]
+                rows = conn.execute(
+                    f'''SELECT document_id, rating_count, rating_sum, rating_average,
+                              stars_1, stars_2, stars_3, stars_4, stars_5, last_rated_at
+                       FROM document_rating_stats
+                       WHERE document_id IN ({', '.join('?' * len(chunk))})''',
+                    chunk
+                )
+                for row in rows:
+                    summary[row[0]] = (row[1], row[2], row[3], tuple(row[4:9]), row[9])
+        return summary
+
     def delete_document(self, doc_id):
         """Удаляет документ и все связанные с ним данные."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             # Удаляем связанные оценки
             cursor.execute('DELETE FROM ratings WHERE document_id = ?', (doc_id,))
-            # Удаляем версии документа
+            cursor.execute('DELETE FROM rating_history WHERE document_id = ?', (doc_id,))
+            # Удаляем документ из манифестов версий системы
+            cursor.execute(
+                '''DELETE FROM system_version_manifest
+                   WHERE document_version_id IN (
+                       SELECT id FROM document_versions WHERE document_id = ?
+                   )''',
+                (doc_id,)
+            )
+            # Удаляем версии документа и тексты, на которые больше никто не ссылается
             cursor.execute('DELETE FROM document_versions WHERE document_id = ?', (doc_id,))
+            cursor.execute('DELETE FROM content_blobs WHERE ref_count <= 0')
             # Удаляем сам документ
             cursor.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
-            conn.commit()
+            self._forget_content(doc_id)
+            self._invalidate(('documents',))
+            if cursor.rowcount:
+                self._publish(DocumentDeleted(doc_id))
 
     def delete_glossary_term(self, term_id):
         """Удаляет термин из глоссария."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM glossary WHERE id = ?', (term_id,))
-            conn.commit()
+            self._invalidate(('glossary',), ('glossary', term_id))
+            if cursor.rowcount:
+                self._publish(GlossaryDeleted(term_id))
 
     def delete_faq(self, faq_id):
         """Удаляет вопрос из FAQ."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM faq WHERE id = ?', (faq_id,))
-            conn.commit()
+            self._invalidate(('faq',), ('faq', faq_id))
+            if cursor.rowcount:
+                # Вопросы, на которые отвечала запись, остаются без ответа
+                cursor.execute('UPDATE user_questions SET faq_id = NULL WHERE faq_id = ?',
+                               (faq_id,))
+                self._publish(FaqDeleted(faq_id))
 
     def delete_user_question(self, question_id):
         """Удаляет вопрос пользователя."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM user_questions WHERE id = ?', (question_id,))
-            conn.commit()
+            if cursor.rowcount:
+                self._publish(QuestionDeleted(question_id))
 
     def add_example_data(self, admin_id):
         """Добавляет примеры документации, терминов и FAQ."""
@@ -516,8 +1094,7 @@ python src/main.py
             ("Версионирование", "Система учета и хранения изменений в документах."),
             ("Экспорт", "Процесс сохранения документа в другом формате.")
         ]
-        for term, definition in glossary_terms:
-            self.add_glossary_term(term, definition, admin_id)
+        self.add_glossary_terms_bulk(glossary_terms, admin_id)
 
         # Примеры FAQ
         faqs = [
@@ -528,26 +1105,25 @@ python src/main.py
             ("Как добавить термин в глоссарий?",
              "Перейдите на вкладку \"Глоссарий\", введите термин и его определение, затем нажмите \"Добавить термин\".")
         ]
-        for question, answer in faqs:
-            self.add_faq(question, answer, admin_id)
+        self.add_faqs_bulk(faqs, admin_id)
 
     def get_all_users(self):
         """Возвращает список всех пользователей."""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users')
-            return cursor.fetchall()
+        return self._cached(('users',), lambda: self._fetch_all('SELECT * FROM users'))
 
     def delete_user(self, user_id):
         """Удаляет пользователя."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
-            conn.commit()
+            # Списки версий показывают имя автора
+            self._invalidate(('users',), ('versions',), ('latest_version',))
+            if cursor.rowcount:
+                self._publish(UserDeleted(user_id))
 
     def answer_user_question(self, question_id, answer, admin_id):
         """Отвечает на вопрос пользователя и создает новый FAQ."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Получаем вопрос
@@ -569,30 +1145,34 @@ python src/main.py
                        VALUES (?, ?, ?, ?)''',
                     (question_text, answer, now, admin_id)
                 )
+                faq_id = cursor.lastrowid
                 
-                # Обновляем статус вопроса
+                # Обновляем статус вопроса и запоминаем запись FAQ с ответом
                 cursor.execute(
                     '''UPDATE user_questions 
-                       SET status = 'answered'
+                       SET status = 'answered', faq_id = ?
                        WHERE id = ?''',
-                    (question_id,)
+                    (faq_id, question_id)
                 )
+                self._invalidate(('faq',))
+                self._publish(FaqAdded(faq_id))
+                self._publish(QuestionAnswered(question_id, faq_id))
                 
-                conn.commit()
                 return True
             return False
 
     def get_user_questions_with_answers(self, user_id=None):
         """Получает список вопросов пользователей с ответами."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             if user_id:
                 # Получаем вопросы конкретного пользователя
                 cursor.execute(
-                    '''SELECT uq.*, u.username, 
-                       (SELECT answer FROM faq WHERE question = uq.question LIMIT 1) as answer
+                    '''SELECT uq.id, uq.user_id, uq.question, uq.status, uq.created_at,
+                       u.username, f.answer
                        FROM user_questions uq
                        JOIN users u ON u.id = uq.user_id
+                       LEFT JOIN faq f ON f.id = uq.faq_id
                        WHERE uq.user_id = ?
                        ORDER BY uq.created_at DESC''',
                     (user_id,)
@@ -600,35 +1180,74 @@ python src/main.py
             else:
                 # Получаем все вопросы
                 cursor.execute(
-                    '''SELECT uq.*, u.username, 
-                       (SELECT answer FROM faq WHERE question = uq.question LIMIT 1) as answer
+                    '''SELECT uq.id, uq.user_id, uq.question, uq.status, uq.created_at,
+                       u.username, f.answer
                        FROM user_questions uq
                        JOIN users u ON u.id = uq.user_id
+                       LEFT JOIN faq f ON f.id = uq.faq_id
                        ORDER BY uq.created_at DESC'''
                 )
             return cursor.fetchall()
 
     def create_new_version(self, version_number, description, changes, user_id):
-        """Создает новую версию системы."""
-        with sqlite3.connect(self.db_name) as conn:
+        """Создает новую версию системы с заданным номером.
+
+        Счетчик номеров продвигается до этого номера, чтобы create_next_version
+        его не повторил; занятый номер - sqlite3.IntegrityError.
+        """
+        with self._connect() as conn:
             cursor = conn.cursor()
-            now = datetime.now()
-            
-            # Создаем новую версию
-            cursor.execute(
-                '''INSERT INTO system_versions 
-                   (version_number, description, changes, created_at, created_by)
-                   VALUES (?, ?, ?, ?, ?)''',
-                (version_number, description, changes, now, user_id)
-            )
-            version_id = cursor.lastrowid
-            
-            conn.commit()
-            return version_id
+            parts = split_version_number(version_number)
+            if parts is not None:
+                cursor.execute(
+                    '''INSERT INTO system_version_counter (id, prefix, last) VALUES (1, ?, ?)
+                       ON CONFLICT (id) DO UPDATE SET last = MAX(last, excluded.last)
+                       WHERE prefix = excluded.prefix''',
+                    parts
+                )
+            return self._insert_version(cursor, version_number, description, changes, user_id)
+
+    def create_next_version(self, description, changes, user_id):
+        """Создает версию системы со следующим номером (после 1.17 - 1.18, первая - 1.0).
+
+        Номер выдает счетчик system_version_counter в той же транзакции, что и
+        вставка версии: BEGIN IMMEDIATE сразу берет блокировку записи, поэтому
+        одновременные сохранения из разных окон и процессов выполняются по
+        очереди и получают разные номера.
+        """
+        with self._connect('BEGIN IMMEDIATE') as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE system_version_counter SET last = last + 1 WHERE id = 1')
+            if cursor.rowcount == 0:
+                cursor.execute(
+                    "INSERT INTO system_version_counter (id, prefix, last) VALUES (1, '1', 0)"
+                )
+            cursor.execute('SELECT prefix, last FROM system_version_counter WHERE id = 1')
+            prefix, last = cursor.fetchone()
+            return self._insert_version(cursor, f'{prefix}.{last}', description, changes, user_id)
+
+    def _insert_version(self, cursor, version_number, description, changes, user_id):
+        now = datetime.now()
+
+        # Создаем новую версию
+        cursor.execute(
+            '''INSERT INTO system_versions
+               (version_number, description, changes, created_at, created_by)
+               VALUES (?, ?, ?, ?, ?)''',
+            (version_number, description, changes, now, user_id)
+        )
+        version_id = cursor.lastrowid
+
+        # Фиксируем, какие версии документов входят в версию системы
+        capture_manifest(cursor, version_id)
+        self._invalidate(('versions',), ('latest_version',))
+        self._publish(SystemVersionCreated(version_id))
+
+        return version_id
 
     def add_version_change(self, version_id, change_type, entity_type, entity_id, description):
         """Добавляет запись об изменении в версии."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             now = datetime.now()
             
@@ -638,117 +1257,375 @@ python src/main.py
                    VALUES (?, ?, ?, ?, ?, ?)''',
                 (version_id, change_type, entity_type, entity_id, description, now)
             )
-            conn.commit()
+            self._invalidate(('versions',), ('version_changes', version_id))
+            self._publish(SystemVersionChanged(version_id))
+
+    # Колонки версии системы в прежнем порядке: служебный manifest_checkpoint
+    # не должен сдвигать username
+    VERSION_COLUMNS = '''sv.id, sv.version_number, sv.description, sv.changes,
+                         sv.created_at, sv.created_by, u.username'''
 
     def get_latest_version(self):
         """Возвращает последнюю версию системы."""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                '''SELECT sv.*, u.username 
-                   FROM system_versions sv
-                   JOIN users u ON u.id = sv.created_by
-                   ORDER BY sv.id DESC
-                   LIMIT 1'''
-            )
-            return cursor.fetchone()
+        def load():
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f'''SELECT {self.VERSION_COLUMNS}
+                        FROM system_versions sv
+                        JOIN users u ON u.id = sv.created_by
+                        ORDER BY sv.id DESC
+                        LIMIT 1'''
+                )
+                return cursor.fetchone()
+
+        return self._cached(('latest_version',), load)
 
     def get_version_changes(self, version_id):
         """Возвращает все изменения для указанной версии."""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                '''SELECT * FROM version_changes 
-                   WHERE version_id = ?
-                   ORDER BY created_at''',
-                (version_id,)
-            )
-            return cursor.fetchall()
+        return self._cached(('version_changes', version_id), lambda: self._fetch_all(
+            '''SELECT * FROM version_changes 
+               WHERE version_id = ?
+               ORDER BY created_at''',
+            (version_id,)
+        ))
 
     def get_all_versions(self):
         """Возвращает список всех версий системы с изменениями."""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                '''SELECT sv.*, u.username,
-                   (SELECT GROUP_CONCAT(description, '; ')
-                    FROM version_changes
-                    WHERE version_id = sv.id) as changes
-                   FROM system_versions sv
-                   JOIN users u ON u.id = sv.created_by
-                   ORDER BY sv.id DESC'''
-            )
-            return cursor.fetchall()
+        return self._cached(('versions',), lambda: self._fetch_all(
+            f'''SELECT {self.VERSION_COLUMNS},
+                (SELECT GROUP_CONCAT(description, '; ')
+                 FROM version_changes
+                 WHERE version_id = sv.id) as changes
+                FROM system_versions sv
+                JOIN users u ON u.id = sv.created_by
+                ORDER BY sv.id DESC'''
+        ))
+
+    def get_versions_page(self, before_id=None, limit=VERSIONS_PAGE_SIZE):
+        """Возвращает страницу заголовков версий системы от новых к старым.
+
+        before_id - id последней версии предыдущей страницы (None - первая
+        страница). Строки: (id, version_number, description, created_at,
+        created_by, username, число изменений); сами изменения читает
+        get_version_changes. Страница читается по первичному ключу, а изменения
+        считаются по idx_version_changes_version, поэтому время не зависит от
+        длины истории. Имя автора читается подзапросом по первичному ключу:
+        версии удаленных пользователей не пропадают из истории и приходят
+        без имени автора.
+        """
+        return self._fetch_all(
+            f'''SELECT sv.id, sv.version_number, sv.description, sv.created_at,
+                      sv.created_by,
+                      (SELECT u.username FROM users u WHERE u.id = sv.created_by),
+                      (SELECT COUNT(*) FROM version_changes vc
+                       WHERE vc.version_id = sv.id) AS change_count
+               FROM system_versions sv
+               {'WHERE sv.id < ?' if before_id is not None else ''}
+               ORDER BY sv.id DESC
+               LIMIT ?''',
+            (before_id, limit) if before_id is not None else (limit,)
+        )
+
+    def get_version(self, version_id):
+        """Возвращает версию системы в формате строк get_all_versions или None."""
+        return self._fetch_one(
+            f'''SELECT {self.VERSION_COLUMNS},
+                (SELECT GROUP_CONCAT(description, '; ')
+                 FROM version_changes
+                 WHERE version_id = sv.id) as changes
+                FROM system_versions sv
+                JOIN users u ON u.id = sv.created_by
+                WHERE sv.id = ?''',
+            (version_id,)
+        )
 
     def delete_version(self, version_id):
         """Удаляет версию системы и связанные с ней изменения."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             # Удаляем связанные изменения
             cursor.execute('DELETE FROM version_changes WHERE version_id = ?', (version_id,))
+            drop_manifest(cursor, version_id)
             # Удаляем саму версию
             cursor.execute('DELETE FROM system_versions WHERE id = ?', (version_id,))
-            conn.commit()
+            self._invalidate(('versions',), ('latest_version',), ('version_changes', version_id))
+            if cursor.rowcount:
+                self._publish(SystemVersionDeleted(version_id))
 
-    def get_document_versions(self, doc_id):
-        """Возвращает все версии документа."""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                '''SELECT dv.*, u.username 
-                   FROM document_versions dv
-                   JOIN users u ON u.id = dv.created_by
-                   WHERE document_id = ?
-                   ORDER BY version DESC''',
-                (doc_id,)
-            )
-            return cursor.fetchall()
 
     def delete_document_version(self, version_id):
         """Удаляет версию документа."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
+            cursor.execute('SELECT document_id FROM document_versions WHERE id = ?', (version_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return
+            # Версии, хранящие разницу с удаляемой, переводим в опорные
+            cursor.execute('SELECT id FROM document_versions WHERE base_id = ?', (version_id,))
+            for (dependent_id,) in cursor.fetchall():
+                digest = self._store_blob(cursor, self._version_content(cursor, dependent_id))
+                cursor.execute(
+                    '''UPDATE document_versions
+                       SET content = '', delta = NULL, base_id = NULL, delta_depth = 0,
+                           content_hash = ?
+                       WHERE id = ?''',
+                    (digest, dependent_id)
+                )
+            forget_document_version(cursor, version_id)
+            cursor.execute(
+                'UPDATE documents SET content_version_id = NULL WHERE content_version_id = ?',
+                (version_id,)
+            )
             cursor.execute('DELETE FROM document_versions WHERE id = ?', (version_id,))
-            conn.commit()
+            cursor.execute('DELETE FROM content_blobs WHERE ref_count <= 0')
+            self._publish(DocumentVersionDeleted(row[0], version_id))
 
     def update_glossary_term(self, term_id, term, definition):
         """Обновляет термин глоссария."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 'UPDATE glossary SET term = ?, definition = ? WHERE id = ?',
                 (term, definition, term_id)
             )
-            conn.commit()
+            self._invalidate(('glossary',), ('glossary', term_id))
+            if cursor.rowcount:
+                self._publish(GlossaryUpdated(term_id))
             
     def update_faq(self, faq_id, question, answer):
         """Обновляет вопрос-ответ в FAQ."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 'UPDATE faq SET question = ?, answer = ? WHERE id = ?',
                 (question, answer, faq_id)
             )
-            conn.commit()
+            self._invalidate(('faq',), ('faq', faq_id))
+            if cursor.rowcount:
+                self._publish(FaqUpdated(faq_id))
             
     def get_glossary_term(self, term_id):
         """Возвращает термин глоссария по ID."""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM glossary WHERE id = ?', (term_id,))
-            return cursor.fetchone()
+        return self._cached(('glossary', term_id), lambda: self._fetch_one(
+            'SELECT * FROM glossary WHERE id = ?', (term_id,)
+        ))
             
     def get_faq(self, faq_id):
         """Возвращает вопрос-ответ из FAQ по ID."""
-        with sqlite3.connect(self.db_name) as conn:
+        return self._cached(('faq', faq_id), lambda: self._fetch_one(
+            'SELECT * FROM faq WHERE id = ?', (faq_id,)
+        ))
+
+    # Последняя версия каждого документа, созданная не позже момента времени.
+    # Версия документа ищется по idx_document_versions_document от старших
+    # номеров к младшим: читаются только версии, созданные после этого момента,
+    # а не вся история. Версии удаленных документов удаляются вместе с ними
+    SNAPSHOT_QUERY = '''
+        SELECT dv.id, dv.document_id, dv.version, dv.created_at, dv.created_by
+        FROM documents d
+        JOIN document_versions dv ON dv.id = (
+            SELECT v.id FROM document_versions v
+            WHERE v.document_id = d.id AND v.created_at <= ?
+            ORDER BY v.version DESC, v.created_at DESC, v.id DESC
+            LIMIT 1
+        )
+    '''
+
+    def _versions_content(self, cursor, version_ids):
+        """Восстанавливает тексты нескольких версий одним рекурсивным запросом.
+
+        Возвращает словарь {id версии: текст}.
+        """
+        if not version_ids:
+            return {}
+        cursor.execute(
+            '''WITH RECURSIVE chain (root, id, base_id, content, delta, content_hash, step) AS (
+                   SELECT id, id, base_id, content, delta, content_hash, 0
+                   FROM document_versions
+                   WHERE id IN (SELECT value FROM json_each(?))
+                   UNION ALL
+                   SELECT chain.root, dv.id, dv.base_id, dv.content, dv.delta, dv.content_hash,
+                          chain.step + 1
+                   FROM document_versions dv
+                   JOIN chain ON dv.id = chain.base_id
+                   WHERE chain.delta IS NOT NULL
+               )
+               SELECT chain.root, chain.content, chain.delta, cb.data
+               FROM chain
+               LEFT JOIN content_blobs cb ON cb.hash = chain.content_hash
+               ORDER BY chain.root, chain.step DESC''',
+            (json.dumps(list(version_ids)),)
+        )
+        contents = {}
+        for root, content, delta, blob in cursor.fetchall():
+            if root not in contents:
+                # Первая строка цепочки - опорная версия
+                contents[root] = decompress_blob(blob) if blob is not None else content
+            else:
+                contents[root] = apply_delta(contents[root], delta)
+        return contents
+
+    def _snapshot_as_of(self, cursor, timestamp):
+        """Возвращает состояние документов на момент timestamp за два запроса.
+
+        Строки: (document_id, version_id, version, created_at, created_by, content).
+        """
+        cursor.execute(self.SNAPSHOT_QUERY, (timestamp,))
+        snapshot = cursor.fetchall()
+        contents = self._versions_content(cursor, [row[0] for row in snapshot])
+        return [
+            (document_id, version_id, version, created_at, created_by, contents[version_id])
+            for version_id, document_id, version, created_at, created_by in snapshot
+        ]
+
+    def _manifest_rows(self, cursor, manifest):
+        """Дополняет записи манифеста данными версий и текстами.
+
+        Строки: (document_id, version_id, version, created_at, created_by, content).
+        """
+        contents = self._versions_content(cursor, manifest.values())
+        cursor.execute(
+            '''SELECT id, document_id, version, created_at, created_by
+               FROM document_versions
+               WHERE id IN (SELECT value FROM json_each(?))''',
+            (json.dumps(list(manifest.values())),)
+        )
+        return [
+            (document_id, version_id, version, created_at, created_by, contents[version_id])
+            for version_id, document_id, version, created_at, created_by in cursor.fetchall()
+        ]
+
+    def _as_documents(self, cursor, snapshot):
+        """Превращает строки снимка в строки вида documents, упорядоченные по заголовку."""
+        cursor.execute('SELECT id, title, created_at, doc_type FROM documents')
+        current = {row[0]: row[1:] for row in cursor.fetchall()}
+
+        documents = []
+        for doc_id, _, version, created_at, created_by, content in snapshot:
+            title, doc_created_at, doc_type = current.get(
+                doc_id, (f"Восстановленный документ {doc_id}", created_at, 'user')
+            )
+            documents.append(
+                (doc_id, title, content, version, doc_created_at, created_at, created_by, doc_type)
+            )
+        documents.sort(key=lambda doc: doc[1])
+        return documents
+
+    def get_documents_as_of(self, timestamp):
+        """Возвращает документы в том виде, в каком они были на момент timestamp.
+
+        Ничего не изменяет: позволяет посмотреть результат восстановления заранее.
+        Строки имеют те же колонки, что и documents; удаленные документы получают
+        те же заголовок и тип, что и при восстановлении.
+        """
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM faq WHERE id = ?', (faq_id,))
-            return cursor.fetchone()
+            return self._as_documents(cursor, self._snapshot_as_of(cursor, timestamp))
+
+    def get_documents_as_of_version(self, version_id):
+        """Возвращает документы на момент версии системы или None, если версии нет."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            manifest = resolve_manifest(cursor, version_id)
+            if manifest is not None:
+                return self._as_documents(cursor, self._manifest_rows(cursor, manifest))
+            cursor.execute('SELECT created_at FROM system_versions WHERE id = ?', (version_id,))
+            version = cursor.fetchone()
+            if not version:
+                return None
+            # Версия без манифеста: состояние вычисляем по времени
+            return self._as_documents(cursor, self._snapshot_as_of(cursor, version[0]))
+
+    def get_restore_preview(self, version_id):
+        """Возвращает (id, заголовок) документов, которые изменит restore_system_to_version.
+
+        Как и восстановление, сравнивает content_version_id документов с манифестом
+        версии; тексты читаются, только если content_version_id пуст. Удаленные
+        документы получают заголовок, с которым их восстановит
+        restore_system_to_version. Список упорядочен по заголовку; для
+        неизвестной версии - None.
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            manifest = resolve_manifest(cursor, version_id)
+            if manifest is None:
+                return None
+            # Совпадение ищется в индексе idx_documents_content_version: унарный плюс
+            # не дает искать документ по первичному ключу, при котором читалась бы
+            # запись с текстом. Заголовок лежит в записи до текста
+            cursor.execute(
+                '''SELECT CAST(manifest.key AS INTEGER),
+                          COALESCE(d.title, 'Восстановленный документ ' || manifest.key) AS title,
+                          d.id IS NOT NULL AND d.content_version_id IS NULL
+                   FROM json_each(?) AS manifest
+                   LEFT JOIN documents d ON d.id = CAST(manifest.key AS INTEGER)
+                   WHERE NOT EXISTS (
+                       SELECT 1 FROM documents c
+                       WHERE c.content_version_id = manifest.value
+                         AND +c.id = CAST(manifest.key AS INTEGER)
+                   )''',
+                (json.dumps(manifest),)
+            )
+            # Строк не больше, чем документов в манифесте: сортируем их здесь,
+            # а не временным B-деревом в запросе
+            changed = sorted(cursor.fetchall(), key=lambda row: row[1])
+            # Для документов, текст которых не сопоставлен ни одной версии (например,
+            # из баз до появления content_version_id), сравниваем тексты
+            unknown = [doc_id for doc_id, _, unmatched in changed if unmatched]
+            same = set()
+            if unknown:
+                contents = self._versions_content(cursor, [manifest[doc_id] for doc_id in unknown])
+                cursor.execute(
+                    'SELECT id, content FROM documents WHERE id IN (SELECT value FROM json_each(?))',
+                    (json.dumps(unknown),)
+                )
+                same = {doc_id for doc_id, content in cursor.fetchall()
+                        if contents[manifest[doc_id]] == content}
+            return [(doc_id, title) for doc_id, title, _ in changed if doc_id not in same]
+
+    def diff_system_versions(self, from_version_id, to_version_id):
+        """Возвращает документы, которые отличаются в двух версиях системы.
+
+        Строки: (document_id, id версии документа в from, id версии в to); отсутствие
+        документа в версии обозначается None. Если обе версии лежат в одной цепочке
+        манифестов, читаются только записи, изменившиеся между ними.
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''SELECT id, manifest_checkpoint FROM system_versions
+                   WHERE id IN (?, ?)''',
+                (from_version_id, to_version_id)
+            )
+            checkpoints = dict(cursor.fetchall())
+            document_ids = None
+            if (checkpoints.get(from_version_id) is not None
+                    and checkpoints.get(from_version_id) == checkpoints.get(to_version_id)):
+                low, high = sorted((from_version_id, to_version_id))
+                cursor.execute(
+                    '''SELECT DISTINCT document_id FROM system_version_manifest
+                       WHERE system_version_id > ? AND system_version_id <= ?''',
+                    (low, high)
+                )
+                document_ids = [row[0] for row in cursor.fetchall()]
+            before = resolve_manifest(cursor, from_version_id, document_ids)
+            after = resolve_manifest(cursor, to_version_id, document_ids)
+            if before is None or after is None:
+                return None
+
+        return [(doc_id, before.get(doc_id), after.get(doc_id))
+                for doc_id in sorted(before.keys() | after.keys())
+                if before.get(doc_id) != after.get(doc_id)]
 
     def restore_system_to_version(self, version_id):
-        """Восстанавливает систему до указанной версии."""
-        with sqlite3.connect(self.db_name) as conn:
+        """Приводит документы к состоянию версии системы; False, если версии нет."""
+        with self._connect() as conn:
             cursor = conn.cursor()
+            # Тексты могут измениться у многих документов сразу
+            self._forget_content()
+            self._invalidate(('documents',))
             
             # Получаем информацию о версии
             cursor.execute(
@@ -760,73 +1637,78 @@ python src/main.py
             if not version:
                 return False
             
-            # Получаем все документы
-            cursor.execute('SELECT id FROM documents')
-            all_documents = cursor.fetchall()
-            
-            # Для каждого документа находим его состояние на момент указанной версии
-            for doc in all_documents:
-                doc_id = doc[0]
-                
-                # Находим версию документа, которая была актуальна на момент указанной версии системы
+            manifest = resolve_manifest(cursor, version_id)
+            if manifest is None:
+                # Версия без манифеста: состояние вычисляем по времени
+                snapshot = self._snapshot_as_of(cursor, version[4])  # version[4] - created_at
+            else:
+                # Трогаем только документы, текст которых не совпадает с версией из манифеста
                 cursor.execute(
-                    '''SELECT * FROM document_versions 
-                       WHERE document_id = ? AND created_at <= ?
-                       ORDER BY version DESC 
-                       LIMIT 1''',
-                    (doc_id, version[4])  # version[4] - created_at
+                    '''SELECT manifest.key, manifest.value
+                       FROM json_each(?) AS manifest
+                       LEFT JOIN documents d ON d.id = CAST(manifest.key AS INTEGER)
+                       WHERE d.content_version_id IS NOT manifest.value''',
+                    (json.dumps(manifest),)
                 )
-                doc_version = cursor.fetchone()
-                
-                if doc_version:
-                    # Обновляем документ до этой версии
-                    cursor.execute(
-                        '''UPDATE documents 
-                           SET content = ?, updated_at = ? 
-                           WHERE id = ?''',
-                        (doc_version[2], datetime.now(), doc_id)
-                    )
+                snapshot = self._manifest_rows(
+                    cursor, {int(doc_id): doc_version for doc_id, doc_version in cursor.fetchall()}
+                )
+            if not snapshot:
+                return True
             
-            # Также можно восстановить удаленные документы, если у нас есть их версии
-            # Получаем все версии документов
+            # Снимок кладем во временную таблицу и применяем двумя запросами
             cursor.execute(
-                '''SELECT DISTINCT document_id FROM document_versions 
-                   WHERE created_at <= ?''',
-                (version[4],)
+                '''CREATE TEMP TABLE IF NOT EXISTS restore_snapshot (
+                       document_id INTEGER PRIMARY KEY,
+                       version_id INTEGER NOT NULL,
+                       content TEXT NOT NULL,
+                       version INTEGER NOT NULL,
+                       created_at TIMESTAMP,
+                       created_by INTEGER
+                   )'''
             )
-            all_versioned_docs = cursor.fetchall()
+            cursor.execute('DELETE FROM restore_snapshot')
+            cursor.executemany(
+                '''INSERT INTO restore_snapshot
+                   (document_id, version_id, content, version, created_at, created_by)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                [(doc_id, doc_version_id, content, doc_version, created_at, created_by)
+                 for doc_id, doc_version_id, doc_version, created_at, created_by, content in snapshot]
+            )
+            now = datetime.now()
             
-            # Проверяем, есть ли документы, которые были удалены
-            for doc in all_versioned_docs:
-                doc_id = doc[0]
-                
-                # Проверяем, существует ли документ сейчас
-                cursor.execute('SELECT id FROM documents WHERE id = ?', (doc_id,))
-                if not cursor.fetchone():
-                    # Если документа нет, восстанавливаем его из последней версии до указанной версии системы
-                    cursor.execute(
-                        '''SELECT * FROM document_versions 
-                           WHERE document_id = ? AND created_at <= ?
-                           ORDER BY version DESC 
-                           LIMIT 1''',
-                        (doc_id, version[4])
-                    )
-                    doc_version = cursor.fetchone()
-                    
-                    if doc_version:
-                        # Получаем информацию о документе из его версии
-                        # Так как документ удален, мы не можем получить его title и doc_type из таблицы documents
-                        # Поэтому используем информацию из версии
-                        now = datetime.now()
-                        
-                        # Восстанавливаем документ с базовой информацией
-                        cursor.execute(
-                            '''INSERT INTO documents 
-                               (id, title, content, version, created_at, updated_at, created_by, doc_type)
-                               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                            (doc_id, f"Восстановленный документ {doc_id}", doc_version[2], doc_version[3], 
-                             doc_version[4], now, doc_version[5], 'user')
-                        )
+            # Обновляем только документы, текст которых отличается от снимка
+            cursor.execute(
+                '''UPDATE documents
+                   SET content = (SELECT s.content FROM restore_snapshot s
+                                  WHERE s.document_id = documents.id),
+                       updated_at = ?
+                   WHERE EXISTS (SELECT 1 FROM restore_snapshot s
+                                 WHERE s.document_id = documents.id
+                                   AND s.content <> documents.content)''',
+                (now,)
+            )
+            # Запоминаем, какой версии теперь соответствует текст
+            cursor.execute(
+                '''UPDATE documents
+                   SET content_version_id = (SELECT s.version_id FROM restore_snapshot s
+                                             WHERE s.document_id = documents.id)
+                   WHERE id IN (SELECT document_id FROM restore_snapshot)'''
+            )
             
-            conn.commit()
-            return True 
\ No newline at end of file
+            # Восстанавливаем удаленные документы, у которых сохранились версии.
+            # Их заголовок и тип не сохранились, поэтому используем базовые значения
+            cursor.execute(
+                '''INSERT INTO documents 
+                   (id, title, content, version, created_at, updated_at, created_by, doc_type,
+                    content_version_id)
+                   SELECT s.document_id, 'Восстановленный документ ' || s.document_id, s.content,
+                          s.version, s.created_at, ?, s.created_by, 'user', s.version_id
+                   FROM restore_snapshot s
+                   WHERE NOT EXISTS (SELECT 1 FROM documents d WHERE d.id = s.document_id)''',
+                (now,)
+            )
+            cursor.execute('DELETE FROM restore_snapshot')
+            self._publish(DocumentsRestored(version_id))
+            
+            return True
@@ -0,0 +1,197 @@
+"""События изменения данных, которые публикует Database.
+
+Событие публикуется после фиксации транзакции, в которой произошло изменение,
+а при откате транзакции отбрасывается. Подписчики вызываются в потоке,
+выполнившем изменение; окна Qt получают события в своем потоке через
+QtEventBridge из qt_events.py.
+
+Событие также записывается в журнал change_log той же транзакцией, и другие
+процессы, работающие с файлом базы, получают его через
+Database.sync_external_changes() (см. watcher.py).
+
+Пример:
+    db.events.subscribe(on_glossary_change, GlossaryAdded, GlossaryDeleted)
+"""
+import json
+import logging
+import threading
+from dataclasses import astuple, dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Event:
+    pass
+
+
+@dataclass(frozen=True)
+class DocumentAdded(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class DocumentUpdated(Event):
+    id: int
+    version: int
+
+
+@dataclass(frozen=True)
+class DocumentDeleted(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class DocumentVersionDeleted(Event):
+    document_id: int
+    version_id: int
+
+
+@dataclass(frozen=True)
+class DocumentsRestored(Event):
+    """Документы приведены к версии системы; меняться могли любые из них."""
+    system_version_id: int
+
+
+@dataclass(frozen=True)
+class GlossaryAdded(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class GlossaryUpdated(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class GlossaryDeleted(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class FaqAdded(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class FaqUpdated(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class FaqDeleted(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class QuestionAsked(Event):
+    id: int
+    user_id: int
+
+
+@dataclass(frozen=True)
+class QuestionAnswered(Event):
+    id: int
+    faq_id: int
+
+
+@dataclass(frozen=True)
+class QuestionDeleted(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class RatingAdded(Event):
+    id: int
+    document_id: int
+
+
+@dataclass(frozen=True)
+class UserAdded(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class UserDeleted(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class SystemVersionCreated(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class SystemVersionChanged(Event):
+    """К версии системы добавлены записи об изменениях."""
+    id: int
+
+
+@dataclass(frozen=True)
+class SystemVersionDeleted(Event):
+    id: int
+
+
+@dataclass(frozen=True)
+class BulkInserted(Event):
+    """Массовая вставка: entity - 'documents', 'glossary', 'faq', 'ratings' или 'version_changes'."""
+    entity: str
+    ids: tuple
+
+
+@dataclass(frozen=True)
+class ChangesLost(Event):
+    """Изменения других процессов не удалось разобрать: данные нужно перечитать целиком."""
+
+
+def encode_event(event):
+    """Возвращает (имя типа, аргументы в JSON) для записи события в журнал изменений."""
+    return type(event).__name__, json.dumps(astuple(event), ensure_ascii=False)
+
+
+def decode_event(name, args):
+    """Восстанавливает событие из журнала; для неизвестного типа возвращает None."""
+    cls = _EVENT_TYPES.get(name)
+    if cls is None:
+        # Событие записано более новой версией программы
+        return None
+    # JSON возвращает кортежи (BulkInserted.ids) списками
+    return cls(*(tuple(arg) if isinstance(arg, list) else arg for arg in json.loads(args)))
+
+
+class EventBus:
+    def __init__(self):
+        # (типы событий или пустой кортеж для всех, callback)
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, *event_types):
+        """Подписывает callback на события указанных типов (без типов - на все).
+
+        Возвращает функцию, отменяющую подписку.
+        """
+        subscription = (event_types, callback)
+        with self._lock:
+            self._subscribers.append(subscription)
+
+        def unsubscribe():
+            with self._lock:
+                if subscription in self._subscribers:
+                    self._subscribers.remove(subscription)
+
+        return unsubscribe
+
+    def publish(self, event):
+        """Передает событие подписчикам; ошибка подписчика не мешает остальным."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for event_types, callback in subscribers:
+            if event_types and not isinstance(event, event_types):
+                continue
+            try:
+                callback(event)
+            except Exception:
+                logger.exception('Ошибка обработчика события %r', event)
+
+
+_EVENT_TYPES = {cls.__name__: cls for cls in Event.__subclasses__()}
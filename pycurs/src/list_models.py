@@ -0,0 +1,193 @@
+"""Модели списков окон, читающие строки из Database страницами.
+
+PagedListModel хранит только прочитанные страницы: при открытии вкладки
+читается первая страница, а следующие - когда представление прокручивается
+до конца (canFetchMore/fetchMore). Страницы читаются по ключу сортировки
+последней строки (см. RecordReader), поэтому время открытия и прокрутки не
+зависит от размера таблицы. Фильтр при вводе входит в запрос fetch: модель
+перечитывается с первой страницы, и фильтр охватывает всю таблицу, а не
+только прочитанные страницы.
+
+Пример:
+    model = PagedListModel(
+        lambda after, limit: db.records.faqs(columns=('id', 'question'), after=after, limit=limit),
+        lambda faq: ListRow(faq.id, faq.question, (faq.question, faq.id))
+    )
+    view.setModel(model)
+"""
+from bisect import bisect_right
+
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, Qt
+
+# Строк в одной странице
+PAGE_SIZE = 200
+
+
+class ListRow:
+    """Строка списка: ID записи, текст, ключ сортировки и подсказка."""
+    __slots__ = ('id', 'text', 'key', 'tooltip', 'data')
+
+    def __init__(self, item_id, text, key, tooltip=None, data=None):
+        self.id = item_id
+        self.text = text
+        # Ключ, по которому упорядочен список и читается следующая страница
+        self.key = key
+        self.tooltip = tooltip
+        # Данные строки, которые окну нужны помимо текста
+        self.data = data
+
+
+class _Descending:
+    """Обертка ключа для списков от новых к старым: сравнивается в обратном порядке."""
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+
+class PagedListModel(QAbstractListModel):
+    def __init__(self, fetch, describe, descending=False, page_size=PAGE_SIZE, parent=None):
+        """fetch(after, limit) читает страницу записей после ключа after (None - первую);
+        describe(record) возвращает ListRow; descending - список упорядочен по убыванию ключа.
+        """
+        super().__init__(parent)
+        self.fetch = fetch
+        self.describe = describe
+        self.descending = descending
+        self.page_size = page_size
+        self._rows = []
+        # Есть ли еще не прочитанные страницы
+        self._more = False
+        # Строка-заглушка вместо данных: «Загрузка...» или текст ошибки
+        self.placeholder = None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return 1 if self.placeholder is not None else len(self._rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if self.placeholder is not None:
+            return self.placeholder if role == Qt.ItemDataRole.DisplayRole else None
+        row = self._rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return row.text
+        if role == Qt.ItemDataRole.UserRole:
+            return row.id
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return row.tooltip
+        return None
+
+    def flags(self, index):
+        if self.placeholder is not None:
+            # Заглушку нельзя выбрать
+            return Qt.ItemFlag.NoItemFlags
+        return super().flags(index)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._more and self.placeholder is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        records = self.fetch(self._rows[-1].key if self._rows else None, self.page_size)
+        self._more = len(records) >= self.page_size
+        rows = [self.describe(record) for record in records]
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+
+    def reload(self):
+        """Читает заново первую страницу."""
+        self.set_first_page(self.fetch(None, self.page_size))
+
+    def set_first_page(self, records):
+        """Заменяет строки первой страницей, прочитанной fetch(None, page_size), например в фоне."""
+        self.beginResetModel()
+        self.placeholder = None
+        self._rows = [self.describe(record) for record in records]
+        self._more = len(records) >= self.page_size
+        self.endResetModel()
+
+    def set_rows(self, rows, complete=True):
+        """Заменяет строки готовым списком ListRow, например результатами поиска."""
+        self.beginResetModel()
+        self.placeholder = None
+        self._rows = list(rows)
+        self._more = not complete
+        self.endResetModel()
+
+    def show_placeholder(self, text):
+        """Показывает вместо строк заглушку, которую нельзя выбрать."""
+        self.beginResetModel()
+        self.placeholder = text
+        self._rows = []
+        self._more = False
+        self.endResetModel()
+
+    def row_at(self, row):
+        """Возвращает ListRow строки или None для заглушки."""
+        if self.placeholder is not None:
+            return None
+        return self._rows[row]
+
+    def find(self, item_id):
+        """Возвращает номер строки записи item_id или -1."""
+        for row, list_row in enumerate(self._rows):
+            if list_row.id == item_id:
+                return row
+        return -1
+
+    def _sort_key(self, key):
+        return _Descending(key) if self.descending else key
+
+    def put(self, record):
+        """Вставляет запись на место по ключу сортировки или обновляет ее строку.
+
+        Запись, место которой за последней прочитанной строкой, пока есть
+        непрочитанные страницы, не вставляется: она придет со своей страницей.
+        """
+        new = self.describe(record)
+        row = self.find(new.id)
+        others = self._rows if row < 0 else self._rows[:row] + self._rows[row + 1:]
+        position = bisect_right([self._sort_key(list_row.key) for list_row in others],
+                                self._sort_key(new.key))
+        if position == len(others) and self._more:
+            self.remove(new.id)
+            return
+        if row < 0:
+            self.beginInsertRows(QModelIndex(), position, position)
+            self._rows.insert(position, new)
+            self.endInsertRows()
+            return
+        if position != row:
+            # Строка переезжает, а не удаляется: выделение остается на ней
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(),
+                               position if position < row else position + 1)
+            del self._rows[row]
+            self._rows.insert(position, new)
+            self.endMoveRows()
+        else:
+            self._rows[row] = new
+        index = self.index(position)
+        self.dataChanged.emit(index, index)
+
+    def remove(self, item_id):
+        """Удаляет строку записи item_id, если она прочитана."""
+        row = self.find(item_id)
+        if row >= 0:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._rows[row]
+            self.endRemoveRows()
+
+
+def current_id(view):
+    """Возвращает ID записи выбранной строки представления или None."""
+    index = view.currentIndex()
+    return index.data(Qt.ItemDataRole.UserRole) if index.isValid() else None
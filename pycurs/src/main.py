@@ -3,14 +3,19 @@ from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                            QLabel, QLineEdit, QPushButton, QComboBox, QMessageBox)
 from PyQt6.QtCore import Qt
 from database import Database
+from async_database import AsyncDatabase
+from qt_async import install_event_loop, exec_event_loop
+from background import thread_pool
+from watcher import ChangeWatcher
 from admin_window import AdminWindow
 from user_window import UserWindow
 
 #Окно входа в систему
 class LoginWindow(QWidget):
-    def __init__(self, db): #Получение объекта базы данных дб
+    def __init__(self, db, async_db=None): #Получение объекта базы данных дб
         super().__init__() #Конструктор родительского класса
         self.db = db
+        self.async_db = async_db #Асинхронный доступ к базе для окна пользователя
         self.admin_window = None 
         self.user_window = None
         self.init_ui() #Вызов для создания
@@ -118,7 +123,7 @@ class LoginWindow(QWidget):
         if self.user_window:
             self.user_window.close()
             
-        self.user_window = UserWindow(self.db, user_id, self)
+        self.user_window = UserWindow(self.db, user_id, self, self.async_db)
         self.user_window.show()
         
     def logout(self):
@@ -250,8 +255,19 @@ class MainWindow(QMainWindow):
 #Запуск системы
 if __name__ == '__main__':
     app = QApplication(sys.argv)
+    loop = install_event_loop(app)
     db = Database()
+    # Запросы окон выполняются в отдельных потоках со своими соединениями
+    async_db = AsyncDatabase(db)
+    # Изменения, сделанные в базе другими рабочими местами
+    watcher = ChangeWatcher(db)
     check_admin_exists(db)
-    login_window = LoginWindow(db)
+    login_window = LoginWindow(db, async_db)
     login_window.show()
-    sys.exit(app.exec()) 
\ No newline at end of file
+    exit_code = exec_event_loop(app, loop)
+    # Останавливаем опрос и потоки запросов и закрываем соединения с базой данных
+    watcher.stop()
+    async_db.close()
+    thread_pool().waitForDone()
+    db.close()
+    sys.exit(exit_code)
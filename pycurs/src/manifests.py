@@ -0,0 +1,240 @@
+"""Манифесты версий системы.
+
+Манифест версии системы - это соответствие «документ -> строка document_versions»,
+зафиксированное в момент создания версии. По манифестам восстановление и
+сравнение версий затрагивают только документы, у которых отличаются записи,
+вместо пересчета состояния всех документов по времени.
+
+Чтобы манифесты оставались маленькими, целиком сохраняется только опорный
+манифест, а следующие версии хранят лишь изменившиеся записи относительно
+предыдущей версии. Новый опорный манифест записывается, когда цепочка
+становится длиннее MANIFEST_CHECKPOINT_INTERVAL версий или когда накопленные
+разницы достигают MAX_DELTA_SHARE от размера полного манифеста. Запись
+с пустой ссылкой означает, что документа в версии нет.
+
+Цепочка версии v - все версии с id от v.manifest_checkpoint до v включительно;
+актуальна для документа запись с наибольшим id версии.
+"""
+import json
+
+# Опорный манифест сохраняется не реже, чем раз в столько версий системы
+MANIFEST_CHECKPOINT_INTERVAL = 16
+
+# Разницы, занимающие не меньше этой доли полного манифеста, заменяются опорным
+MAX_DELTA_SHARE = 0.5
+
+# Строка document_versions, с которой совпадает текст каждого документа. Если
+# совпадение неизвестно (content_version_id пуст), берется последняя версия
+# документа по индексу idx_document_versions_document. Документы читаются из
+# индекса idx_documents_content_version, без страниц с текстами
+CURRENT_VERSIONS_QUERY = '''
+    SELECT d.id, COALESCE(d.content_version_id, (
+        SELECT dv.id FROM document_versions dv
+        WHERE dv.document_id = d.id
+        ORDER BY dv.version DESC, dv.created_at DESC, dv.id DESC
+        LIMIT 1
+    ))
+    FROM documents d
+'''
+
+# Последняя строка document_versions каждого документа на момент времени;
+# так строятся манифесты версий, созданных до появления манифестов
+LATEST_VERSIONS_QUERY = '''
+    SELECT document_id, id
+    FROM (
+        SELECT document_id, id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY document_id ORDER BY version DESC, id DESC
+               ) AS position
+        FROM document_versions
+        WHERE created_at <= ?
+    )
+    WHERE position = 1
+'''
+
+
+def resolve_manifest(cursor, system_version_id, document_ids=None):
+    """Возвращает манифест версии системы как {document_id: id строки document_versions}.
+
+    document_ids ограничивает результат указанными документами.
+    Для версии без манифеста возвращает None.
+    """
+    cursor.execute(
+        'SELECT manifest_checkpoint FROM system_versions WHERE id = ?',
+        (system_version_id,)
+    )
+    row = cursor.fetchone()
+    if not row or row[0] is None:
+        return None
+
+    query = '''
+        SELECT document_id, document_version_id
+        FROM (
+            SELECT document_id, document_version_id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY document_id ORDER BY system_version_id DESC
+                   ) AS position
+            FROM system_version_manifest
+            WHERE system_version_id BETWEEN ? AND ? {}
+        )
+        WHERE position = 1 AND document_version_id IS NOT NULL
+    '''
+    if document_ids is None:
+        cursor.execute(query.format(''), (row[0], system_version_id))
+    else:
+        cursor.execute(
+            query.format('AND document_id IN (SELECT value FROM json_each(?))'),
+            (row[0], system_version_id, json.dumps(list(document_ids)))
+        )
+    return dict(cursor.fetchall())
+
+
+def _write_entries(cursor, system_version_id, entries):
+    cursor.executemany(
+        '''INSERT OR REPLACE INTO system_version_manifest
+           (system_version_id, document_id, document_version_id)
+           VALUES (?, ?, ?)''',
+        [(system_version_id, document_id, version_id)
+         for document_id, version_id in entries.items()]
+    )
+
+
+def _write_checkpoint(cursor, system_version_id, manifest):
+    """Записывает полный манифест и делает версию началом новой цепочки."""
+    cursor.execute(
+        'DELETE FROM system_version_manifest WHERE system_version_id = ?',
+        (system_version_id,)
+    )
+    _write_entries(cursor, system_version_id, manifest)
+    cursor.execute(
+        'UPDATE system_versions SET manifest_checkpoint = ? WHERE id = ?',
+        (system_version_id, system_version_id)
+    )
+
+
+def capture_manifest(cursor, system_version_id, as_of=None):
+    """Фиксирует манифест только что созданной версии системы.
+
+    Манифест - версии документов, с которыми сейчас совпадают их тексты; он
+    сравнивается с манифестом предыдущей версии системы, и записываются только
+    отличия. Стоимость зависит от числа документов, а не от длины истории.
+    as_of - время, на которое манифест строится по истории версий документов
+    (для версий, созданных до появления манифестов).
+    """
+    if as_of is None:
+        cursor.execute(CURRENT_VERSIONS_QUERY)
+        current = {document_id: version_id for document_id, version_id in cursor.fetchall()
+                   if version_id is not None}
+    else:
+        cursor.execute(LATEST_VERSIONS_QUERY, (as_of,))
+        current = dict(cursor.fetchall())
+
+    cursor.execute(
+        '''SELECT id, manifest_checkpoint FROM system_versions
+           WHERE id < ? AND manifest_checkpoint IS NOT NULL
+           ORDER BY id DESC
+           LIMIT 1''',
+        (system_version_id,)
+    )
+    previous = cursor.fetchone()
+    if previous is None:
+        _write_checkpoint(cursor, system_version_id, current)
+        return
+
+    previous_id, checkpoint_id = previous
+    previous_manifest = resolve_manifest(cursor, previous_id)
+    changes = {document_id: version_id for document_id, version_id in current.items()
+               if previous_manifest.get(document_id) != version_id}
+    changes.update((document_id, None) for document_id in previous_manifest
+                   if document_id not in current)
+
+    # Политика уплотнения: длина цепочки и суммарный объем разниц
+    cursor.execute(
+        '''SELECT COUNT(*),
+                  (SELECT COUNT(*) FROM system_version_manifest
+                   WHERE system_version_id > ? AND system_version_id <= ?)
+           FROM system_versions WHERE manifest_checkpoint = ?''',
+        (checkpoint_id, previous_id, checkpoint_id)
+    )
+    chain_length, delta_entries = cursor.fetchone()
+    if (chain_length >= MANIFEST_CHECKPOINT_INTERVAL
+            or delta_entries + len(changes) >= len(current) * MAX_DELTA_SHARE):
+        _write_checkpoint(cursor, system_version_id, current)
+        return
+
+    _write_entries(cursor, system_version_id, changes)
+    cursor.execute(
+        'UPDATE system_versions SET manifest_checkpoint = ? WHERE id = ?',
+        (checkpoint_id, system_version_id)
+    )
+
+
+def drop_manifest(cursor, system_version_id):
+    """Удаляет манифест версии системы, не ломая манифесты следующих версий."""
+    cursor.execute(
+        'SELECT manifest_checkpoint FROM system_versions WHERE id = ?',
+        (system_version_id,)
+    )
+    row = cursor.fetchone()
+    if not row or row[0] is None:
+        return
+    checkpoint_id = row[0]
+
+    cursor.execute(
+        '''SELECT MIN(id) FROM system_versions
+           WHERE id > ? AND manifest_checkpoint = ?''',
+        (system_version_id, checkpoint_id)
+    )
+    next_id = cursor.fetchone()[0]
+    if next_id is not None:
+        if checkpoint_id == system_version_id:
+            # Удаляется опорный манифест: следующая версия становится опорной
+            manifest = resolve_manifest(cursor, next_id)
+            _write_checkpoint(cursor, next_id, manifest)
+            cursor.execute(
+                'UPDATE system_versions SET manifest_checkpoint = ? WHERE manifest_checkpoint = ?',
+                (next_id, system_version_id)
+            )
+        else:
+            # Разницы удаляемой версии переносим в следующую, если та их не перекрывает
+            cursor.execute(
+                '''INSERT OR IGNORE INTO system_version_manifest
+                   (system_version_id, document_id, document_version_id)
+                   SELECT ?, document_id, document_version_id
+                   FROM system_version_manifest
+                   WHERE system_version_id = ?''',
+                (next_id, system_version_id)
+            )
+    cursor.execute(
+        'DELETE FROM system_version_manifest WHERE system_version_id = ?',
+        (system_version_id,)
+    )
+
+
+def forget_document_version(cursor, document_version_id):
+    """Переводит записи манифестов с удаляемой версии документа на предыдущую.
+
+    Запись получает последнюю оставшуюся версию документа на момент версии
+    системы; если такой нет, запись удаляется.
+    """
+    remaining = '''
+        SELECT dv.id
+        FROM document_versions dv
+        JOIN system_versions sv ON sv.id = system_version_manifest.system_version_id
+        WHERE dv.document_id = system_version_manifest.document_id
+          AND dv.id <> ?
+          AND dv.created_at <= sv.created_at
+        ORDER BY dv.version DESC, dv.id DESC
+        LIMIT 1
+    '''
+    cursor.execute(
+        f'''DELETE FROM system_version_manifest
+            WHERE document_version_id = ? AND NOT EXISTS ({remaining})''',
+        (document_version_id, document_version_id)
+    )
+    cursor.execute(
+        f'''UPDATE system_version_manifest
+            SET document_version_id = ({remaining})
+            WHERE document_version_id = ?''',
+        (document_version_id, document_version_id)
+    )
@@ -0,0 +1,1067 @@
+"""Версионированные миграции схемы базы данных.
+
+Номер последней примененной миграции хранится в PRAGMA user_version.
+При запуске выполняются только недостающие миграции, все в одной транзакции,
+поэтому для актуальной базы проверка схемы стоит одного чтения PRAGMA.
+Новые миграции добавляются в конец списка MIGRATIONS со следующим номером.
+"""
+import difflib
+import hashlib
+import json
+import zlib
+from datetime import datetime
+
+
+def _table_columns(cursor, table):
+    """Возвращает имена колонок таблицы."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in cursor.fetchall()]
+
+
+def migration_001_base_schema(cursor):
+    """Базовая схема; на старых базах дополняет таблицы недостающими колонками."""
+    # Создание таблицы пользователей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            is_admin BOOLEAN NOT NULL DEFAULT 0,
+            created_at TIMESTAMP NOT NULL
+        )
+    ''')
+    
+    # Проверяем наличие колонки is_admin
+    columns = _table_columns(cursor, 'users')
+    
+    # Если колонки is_admin нет, добавляем её
+    if 'is_admin' not in columns:
+        # Создаем временную таблицу
+        cursor.execute('''
+            CREATE TABLE users_temp (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                is_admin BOOLEAN NOT NULL DEFAULT 0,
+                created_at TIMESTAMP NOT NULL
+            )
+        ''')
+        
+        # Определяем, какие колонки есть в текущей таблице
+        if 'created_at' in columns:
+            # Копируем данные, устанавливая is_admin на основе role (если есть)
+            if 'role' in columns:
+                cursor.execute('''
+                    INSERT INTO users_temp (id, username, password, is_admin, created_at)
+                    SELECT id, username, password, 
+                           CASE WHEN role = 'admin' THEN 1 ELSE 0 END,
+                           created_at
+                    FROM users
+                ''')
+            else:
+                cursor.execute('''
+                    INSERT INTO users_temp (id, username, password, is_admin, created_at)
+                    SELECT id, username, password, 0, created_at FROM users
+                ''')
+        else:
+            # Если нет created_at, добавляем текущее время
+            now = datetime.now()
+            if 'role' in columns:
+                cursor.execute('''
+                    INSERT INTO users_temp (id, username, password, is_admin, created_at)
+                    SELECT id, username, password, 
+                           CASE WHEN role = 'admin' THEN 1 ELSE 0 END,
+                           ?
+                    FROM users
+                ''', (now,))
+            else:
+                cursor.execute('''
+                    INSERT INTO users_temp (id, username, password, is_admin, created_at)
+                    SELECT id, username, password, 0, ? FROM users
+                ''', (now,))
+        
+        # Удаляем старую таблицу и переименовываем временную
+        cursor.execute('DROP TABLE users')
+        cursor.execute('ALTER TABLE users_temp RENAME TO users')
+    
+    # Создание таблицы документов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 1,
+            created_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP NOT NULL,
+            created_by INTEGER NOT NULL,
+            doc_type TEXT NOT NULL DEFAULT 'user',
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+    ''')
+    
+    # Проверяем наличие колонки doc_type
+    columns = _table_columns(cursor, 'documents')
+    if 'doc_type' not in columns:
+        cursor.execute('ALTER TABLE documents ADD COLUMN doc_type TEXT NOT NULL DEFAULT "user"')
+    
+    # Создание таблицы версий документов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_versions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_id INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            created_by INTEGER NOT NULL,
+            FOREIGN KEY (document_id) REFERENCES documents (id),
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+    ''')
+    
+    # Создание таблицы глоссария
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS glossary (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            term TEXT NOT NULL,
+            definition TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            created_by INTEGER NOT NULL,
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+    ''')
+    
+    # Создание таблицы FAQ
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS faq (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            created_by INTEGER NOT NULL,
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+    ''')
+    
+    # Создание таблицы вопросов пользователей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'new',
+            created_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Создание таблицы оценок разделов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ratings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            rating INTEGER NOT NULL,
+            comment TEXT,
+            created_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (document_id) REFERENCES documents (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Создание таблицы версий системы
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS system_versions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            version_number TEXT NOT NULL,
+            description TEXT NOT NULL,
+            changes TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            created_by INTEGER NOT NULL,
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+    ''')
+    
+    # Создание таблицы изменений в версиях
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS version_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            version_id INTEGER NOT NULL,
+            change_type TEXT NOT NULL,
+            entity_type TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            description TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (version_id) REFERENCES system_versions (id)
+        )
+    ''')
+    
+    # Проверяем, есть ли уже версии системы
+    cursor.execute('SELECT COUNT(*) FROM system_versions')
+    count = cursor.fetchone()[0]
+    
+    # Если версий нет, создаем начальную версию
+    if count == 0:
+        now = datetime.now()
+        cursor.execute(
+            '''INSERT INTO system_versions 
+               (version_number, description, changes, created_at, created_by)
+               VALUES (?, ?, ?, ?, ?)''',
+            ('1.0', 'Начальная версия системы', 'Создание системы документации', now, 1)
+        )
+
+
+def migration_002_updated_at(cursor):
+    """Добавляет updated_at в глоссарий и FAQ, которые ожидают add_glossary_term и add_faq."""
+    for table in ('glossary', 'faq'):
+        if 'updated_at' not in _table_columns(cursor, table):
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN updated_at TIMESTAMP')
+            cursor.execute(f'UPDATE {table} SET updated_at = created_at')
+
+
+
+def migration_003_hot_query_indexes(cursor):
+    """Индексы под горячие запросы: фильтр по родителю и сортировка берутся из индекса."""
+    # get_document_versions (ORDER BY version) и restore_system_to_version
+    # (created_at <= ? ORDER BY version DESC LIMIT 1) без обращения к таблице
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_document_versions_document
+        ON document_versions (document_id, version, created_at)
+    ''')
+    # get_document_ratings: WHERE document_id = ? ORDER BY created_at DESC
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ratings_document
+        ON ratings (document_id, created_at)
+    ''')
+    # get_user_questions: WHERE status = ? ORDER BY created_at DESC
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_questions_status
+        ON user_questions (status, created_at)
+    ''')
+    # get_user_questions_with_answers(user_id): WHERE user_id = ? ORDER BY created_at DESC
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_questions_user
+        ON user_questions (user_id, created_at)
+    ''')
+    # get_version_changes и подзапрос в get_all_versions: WHERE version_id = ?
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_version_changes_version
+        ON version_changes (version_id, created_at)
+    ''')
+    # Сортировка списков по заголовку без временного B-дерева
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_title ON documents (title)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_glossary_term ON glossary (term)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_faq_question ON faq (question)')
+
+
+
+def migration_004_documents_fts(cursor):
+    """Полнотекстовый индекс FTS5 по документам, синхронизируемый триггерами."""
+    # unicode61 приводит к нижнему регистру любые буквы Unicode, а не только ASCII;
+    # диакритику не снимаем, иначе «й» совпадало бы с «и»
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+            title,
+            content,
+            content='documents',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 0'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS documents_fts_insert AFTER INSERT ON documents BEGIN
+            INSERT INTO documents_fts (rowid, title, content)
+            VALUES (new.id, new.title, new.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS documents_fts_delete AFTER DELETE ON documents BEGIN
+            INSERT INTO documents_fts (documents_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS documents_fts_update AFTER UPDATE OF title, content ON documents BEGIN
+            INSERT INTO documents_fts (documents_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO documents_fts (rowid, title, content)
+            VALUES (new.id, new.title, new.content);
+        END
+    ''')
+    # Индексируем уже существующие документы
+    cursor.execute("INSERT INTO documents_fts (documents_fts) VALUES ('rebuild')")
+
+
+
+# Код, которым миграции 5-7 перекодируют версии и строят манифесты, скопирован
+# сюда в том виде, в каком он был при их написании: version_store и manifests
+# меняются вместе с приложением, а уже выпущенная миграция должна давать
+# тот же результат на любой старой базе.
+
+# version_store: каждая 16-я версия в цепочке хранится целиком, а разница,
+# которая не меньше половины полного текста, не дает выигрыша
+_KEYFRAME_INTERVAL = 16
+_MAX_DELTA_RATIO = 0.5
+
+# manifests: опорный манифест не реже раза в 16 версий системы и когда
+# разницы занимают половину полного манифеста
+_MANIFEST_CHECKPOINT_INTERVAL = 16
+_MAX_MANIFEST_DELTA_SHARE = 0.5
+
+# Последняя строка document_versions каждого документа на момент времени
+_LATEST_VERSIONS_QUERY = '''
+    SELECT document_id, id
+    FROM (
+        SELECT document_id, id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY document_id ORDER BY version DESC, id DESC
+               ) AS position
+        FROM document_versions
+        WHERE created_at <= ?
+    )
+    WHERE position = 1
+'''
+
+
+def _make_delta(base, content):
+    """Сжатая построчная разница, превращающая base в content (version_store.make_delta)."""
+    base_lines = base.splitlines(keepends=True)
+    new_lines = content.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j1 < j2:
+            ops.append(''.join(new_lines[j1:j2]))
+    return zlib.compress(json.dumps(ops, ensure_ascii=False).encode('utf-8'))
+
+
+def _encode_version(base, base_depth, content):
+    """Возвращает (content, delta, depth) новой версии после base (version_store.encode_version)."""
+    if base is None or base_depth + 1 >= _KEYFRAME_INTERVAL:
+        return content, None, 0
+    delta = _make_delta(base, content)
+    if len(delta) >= len(content.encode('utf-8')) * _MAX_DELTA_RATIO:
+        return content, None, 0
+    return '', delta, base_depth + 1
+
+
+def _content_digest(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _compress_blob(content):
+    return zlib.compress(content.encode('utf-8'))
+
+
+def _resolve_manifest(cursor, system_version_id):
+    """Манифест версии системы {document_id: id версии документа} (manifests.resolve_manifest)."""
+    cursor.execute(
+        'SELECT manifest_checkpoint FROM system_versions WHERE id = ?',
+        (system_version_id,)
+    )
+    checkpoint_id = cursor.fetchone()[0]
+    cursor.execute(
+        '''SELECT document_id, document_version_id
+           FROM (
+               SELECT document_id, document_version_id,
+                      ROW_NUMBER() OVER (
+                          PARTITION BY document_id ORDER BY system_version_id DESC
+                      ) AS position
+               FROM system_version_manifest
+               WHERE system_version_id BETWEEN ? AND ?
+           )
+           WHERE position = 1 AND document_version_id IS NOT NULL''',
+        (checkpoint_id, system_version_id)
+    )
+    return dict(cursor.fetchall())
+
+
+def _write_manifest_entries(cursor, system_version_id, entries):
+    cursor.executemany(
+        '''INSERT OR REPLACE INTO system_version_manifest
+           (system_version_id, document_id, document_version_id)
+           VALUES (?, ?, ?)''',
+        [(system_version_id, document_id, version_id)
+         for document_id, version_id in entries.items()]
+    )
+
+
+def _write_manifest_checkpoint(cursor, system_version_id, manifest):
+    cursor.execute(
+        'DELETE FROM system_version_manifest WHERE system_version_id = ?',
+        (system_version_id,)
+    )
+    _write_manifest_entries(cursor, system_version_id, manifest)
+    cursor.execute(
+        'UPDATE system_versions SET manifest_checkpoint = ? WHERE id = ?',
+        (system_version_id, system_version_id)
+    )
+
+
+def _capture_manifest_as_of(cursor, system_version_id, as_of):
+    """Манифест версии системы по истории версий документов на момент as_of.
+
+    manifests.capture_manifest с заданным as_of: полный манифест или отличия
+    от предыдущей версии по той же политике уплотнения.
+    """
+    cursor.execute(_LATEST_VERSIONS_QUERY, (as_of,))
+    current = dict(cursor.fetchall())
+
+    cursor.execute(
+        '''SELECT id, manifest_checkpoint FROM system_versions
+           WHERE id < ? AND manifest_checkpoint IS NOT NULL
+           ORDER BY id DESC
+           LIMIT 1''',
+        (system_version_id,)
+    )
+    previous = cursor.fetchone()
+    if previous is None:
+        _write_manifest_checkpoint(cursor, system_version_id, current)
+        return
+
+    previous_id, checkpoint_id = previous
+    previous_manifest = _resolve_manifest(cursor, previous_id)
+    changes = {document_id: version_id for document_id, version_id in current.items()
+               if previous_manifest.get(document_id) != version_id}
+    changes.update((document_id, None) for document_id in previous_manifest
+                   if document_id not in current)
+
+    cursor.execute(
+        '''SELECT COUNT(*),
+                  (SELECT COUNT(*) FROM system_version_manifest
+                   WHERE system_version_id > ? AND system_version_id <= ?)
+           FROM system_versions WHERE manifest_checkpoint = ?''',
+        (checkpoint_id, previous_id, checkpoint_id)
+    )
+    chain_length, delta_entries = cursor.fetchone()
+    if (chain_length >= _MANIFEST_CHECKPOINT_INTERVAL
+            or delta_entries + len(changes) >= len(current) * _MAX_MANIFEST_DELTA_SHARE):
+        _write_manifest_checkpoint(cursor, system_version_id, current)
+        return
+
+    _write_manifest_entries(cursor, system_version_id, changes)
+    cursor.execute(
+        'UPDATE system_versions SET manifest_checkpoint = ? WHERE id = ?',
+        (checkpoint_id, system_version_id)
+    )
+
+
+def migration_005_version_deltas(cursor):
+    """Переводит версии документов на хранение опорных версий и сжатых разниц."""
+    cursor.execute('ALTER TABLE document_versions ADD COLUMN delta BLOB')
+    cursor.execute('ALTER TABLE document_versions ADD COLUMN base_id INTEGER REFERENCES document_versions (id)')
+    cursor.execute('ALTER TABLE document_versions ADD COLUMN delta_depth INTEGER NOT NULL DEFAULT 0')
+    # Поиск версий, зависящих от удаляемой
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_document_versions_base
+        ON document_versions (base_id) WHERE base_id IS NOT NULL
+    ''')
+
+    # Перекодируем существующие версии, по одному документу за раз
+    cursor.execute('SELECT DISTINCT document_id FROM document_versions')
+    for (document_id,) in cursor.fetchall():
+        cursor.execute(
+            '''SELECT id, content FROM document_versions
+               WHERE document_id = ?
+               ORDER BY version, id''',
+            (document_id,)
+        )
+        base_id, base, base_depth = None, None, 0
+        for version_id, content in cursor.fetchall():
+            stored, delta, depth = _encode_version(base, base_depth, content)
+            if delta is not None:
+                cursor.execute(
+                    '''UPDATE document_versions
+                       SET content = ?, delta = ?, base_id = ?, delta_depth = ?
+                       WHERE id = ?''',
+                    (stored, delta, base_id, depth, version_id)
+                )
+            base_id, base, base_depth = version_id, content, depth
+
+
+
+def migration_006_content_blobs(cursor):
+    """Хранилище текстов по хешу: опорные версии ссылаются на него вместо копии текста."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS content_blobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hash TEXT UNIQUE NOT NULL,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Кандидаты на сборку мусора
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_content_blobs_unreferenced
+        ON content_blobs (ref_count) WHERE ref_count <= 0
+    ''')
+    cursor.execute('''
+        ALTER TABLE document_versions ADD COLUMN content_hash TEXT
+        REFERENCES content_blobs (hash)
+    ''')
+
+    # Счетчик ссылок ведут триггеры, чтобы его не мог рассинхронизировать ни один путь записи
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS content_blobs_ref_insert
+        AFTER INSERT ON document_versions WHEN new.content_hash IS NOT NULL BEGIN
+            UPDATE content_blobs SET ref_count = ref_count + 1 WHERE hash = new.content_hash;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS content_blobs_ref_delete
+        AFTER DELETE ON document_versions WHEN old.content_hash IS NOT NULL BEGIN
+            UPDATE content_blobs SET ref_count = ref_count - 1 WHERE hash = old.content_hash;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS content_blobs_ref_update
+        AFTER UPDATE OF content_hash ON document_versions BEGIN
+            UPDATE content_blobs SET ref_count = ref_count - 1 WHERE hash = old.content_hash;
+            UPDATE content_blobs SET ref_count = ref_count + 1 WHERE hash = new.content_hash;
+        END
+    ''')
+
+    # Переносим тексты опорных версий в хранилище
+    cursor.execute('SELECT id, content FROM document_versions WHERE delta IS NULL')
+    for version_id, content in cursor.fetchall():
+        digest = _content_digest(content)
+        cursor.execute(
+            '''INSERT OR IGNORE INTO content_blobs (hash, data, size)
+               VALUES (?, ?, ?)''',
+            (digest, _compress_blob(content), len(content))
+        )
+        cursor.execute(
+            "UPDATE document_versions SET content = '', content_hash = ? WHERE id = ?",
+            (digest, version_id)
+        )
+
+
+def migration_007_system_manifests(cursor):
+    """Манифесты версий системы и ссылка документа на версию, с которой совпадает его текст."""
+    cursor.execute('ALTER TABLE system_versions ADD COLUMN manifest_checkpoint INTEGER')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS system_version_manifest (
+            system_version_id INTEGER NOT NULL REFERENCES system_versions (id),
+            document_id INTEGER NOT NULL,
+            document_version_id INTEGER REFERENCES document_versions (id),
+            PRIMARY KEY (system_version_id, document_id)
+        ) WITHOUT ROWID
+    ''')
+    # Перенаправление записей при удалении версии документа
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_system_version_manifest_document_version
+        ON system_version_manifest (document_version_id)
+    ''')
+
+    # content_version_id пуст, если текст документа не соответствует известной версии
+    cursor.execute(
+        'ALTER TABLE documents ADD COLUMN content_version_id INTEGER REFERENCES document_versions (id)'
+    )
+    # add_document и update_document пишут документ и версию с одним и тем же временем,
+    # а восстановление системы меняет текст без новой версии и со своим временем
+    cursor.execute('''
+        UPDATE documents
+        SET content_version_id = (
+            SELECT dv.id FROM document_versions dv
+            WHERE dv.document_id = documents.id
+              AND dv.version = documents.version
+              AND dv.created_at = documents.updated_at
+            ORDER BY dv.id DESC
+            LIMIT 1
+        )
+    ''')
+
+    # Манифесты существующих версий строим по времени их создания
+    cursor.execute('SELECT id, created_at FROM system_versions ORDER BY id')
+    for system_version_id, created_at in cursor.fetchall():
+        _capture_manifest_as_of(cursor, system_version_id, created_at)
+
+
+def migration_008_documents_listing_index(cursor):
+    """Покрывающий индекс для списков документов без чтения текстов."""
+    # Колонки после content хранятся в записи за текстом, и без покрывающего
+    # индекса их чтение тянет за собой страницы переполнения с текстом
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_documents_listing
+        ON documents (title, doc_type, updated_at, version)
+    ''')
+    # Прежний индекс по заголовку стал префиксом нового
+    cursor.execute('DROP INDEX IF EXISTS idx_documents_title')
+
+
+def migration_009_change_log(cursor):
+    """Журнал изменений, по которому другие процессы узнают о записях в базу."""
+    # seq растет в порядке фиксации: писатель в SQLite всегда один
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            event TEXT NOT NULL,
+            args TEXT NOT NULL
+        )
+    ''')
+
+
+def migration_010_paging_indexes(cursor):
+    """Индексы, по которым списки окон читаются страницами без сортировки."""
+    # Ключ страниц списка документов - (title, id): id сразу за заголовком
+    # избавляет от сортировки документов с одинаковым заголовком
+    cursor.execute('DROP INDEX IF EXISTS idx_documents_listing')
+    cursor.execute('''
+        CREATE INDEX idx_documents_listing
+        ON documents (title, id, doc_type, updated_at, version)
+    ''')
+    # Все вопросы пользователей от новых к старым
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_questions_created
+        ON user_questions (created_at)
+    ''')
+
+
+def migration_011_question_faq_link(cursor):
+    """Ссылка отвеченного вопроса на созданную ответом запись FAQ."""
+    # Раньше ответ искался по совпадению текста вопроса с вопросом FAQ
+    # и терялся, если администратор правил формулировку в FAQ
+    cursor.execute('ALTER TABLE user_questions ADD COLUMN faq_id INTEGER REFERENCES faq (id)')
+    # Связываем уже отвеченные вопросы так же, как их связывал прежний запрос;
+    # поиск идет по idx_faq_question
+    cursor.execute('''
+        UPDATE user_questions
+        SET faq_id = (
+            SELECT f.id FROM faq f
+            WHERE f.question = user_questions.question
+            ORDER BY f.id
+            LIMIT 1
+        )
+        WHERE status = 'answered'
+    ''')
+    # Вопросы, ответ на которые - запись FAQ; нужен при ее удалении
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_questions_faq
+        ON user_questions (faq_id)
+    ''')
+
+
+def _rating_stats_delta(sign, row):
+    """SET-часть UPDATE document_rating_stats, прибавляющая (sign='+') или вычитающая оценку row."""
+    stars = ',\n               '.join(
+        f'stars_{n} = stars_{n} {sign} ({row}.rating = {n})' for n in range(1, 6)
+    )
+    return f'''rating_count = rating_count {sign} 1,
+               rating_sum = rating_sum {sign} {row}.rating,
+               rating_average = CASE WHEN rating_count {sign} 1 > 0
+                   THEN CAST(rating_sum {sign} {row}.rating AS REAL) / (rating_count {sign} 1)
+                   ELSE 0 END,
+               {stars}'''
+
+
+def _create_rating_stats_triggers(cursor):
+    """Триггеры на ratings, поддерживающие document_rating_stats."""
+    # Строку сводки создаем через NOT EXISTS, а не INSERT OR IGNORE: политика
+    # ON CONFLICT внешней команды (upsert оценки, см. Database._set_ratings)
+    # заменяет политику команд внутри триггера
+    create_stats = '''INSERT INTO document_rating_stats (document_id)
+            SELECT NEW.document_id WHERE NOT EXISTS (
+                SELECT 1 FROM document_rating_stats WHERE document_id = NEW.document_id
+            )'''
+    # Время последней оценки после удаления берется из idx_ratings_document
+    last_rated = '''last_rated_at = (
+                   SELECT MAX(created_at) FROM ratings WHERE document_id = OLD.document_id
+               )'''
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS ratings_stats_insert
+        AFTER INSERT ON ratings BEGIN
+            {create_stats};
+            UPDATE document_rating_stats
+            SET {_rating_stats_delta('+', 'NEW')},
+               last_rated_at = CASE WHEN last_rated_at IS NULL OR NEW.created_at > last_rated_at
+                   THEN NEW.created_at ELSE last_rated_at END
+            WHERE document_id = NEW.document_id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS ratings_stats_delete
+        AFTER DELETE ON ratings BEGIN
+            UPDATE document_rating_stats
+            SET {_rating_stats_delta('-', 'OLD')},
+               {last_rated}
+            WHERE document_id = OLD.document_id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS ratings_stats_update
+        AFTER UPDATE OF document_id, rating, created_at ON ratings BEGIN
+            UPDATE document_rating_stats
+            SET {_rating_stats_delta('-', 'OLD')},
+               {last_rated}
+            WHERE document_id = OLD.document_id;
+            {create_stats};
+            UPDATE document_rating_stats
+            SET {_rating_stats_delta('+', 'NEW')},
+               last_rated_at = (
+                   SELECT MAX(created_at) FROM ratings WHERE document_id = NEW.document_id
+               )
+            WHERE document_id = NEW.document_id;
+        END
+    ''')
+
+
+def migration_012_rating_stats(cursor):
+    """Сводка оценок каждого документа, которую поддерживают триггеры на ratings."""
+    # Строка есть у каждого документа: у неоцененных rating_average = 0, поэтому
+    # список по оценке читается страницами из idx_document_rating_stats_average
+    # без NULL в ключе. В UPDATE правые части видят значения до изменения строки
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_rating_stats (
+            document_id INTEGER PRIMARY KEY REFERENCES documents (id),
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            rating_average REAL NOT NULL DEFAULT 0,
+            stars_1 INTEGER NOT NULL DEFAULT 0,
+            stars_2 INTEGER NOT NULL DEFAULT 0,
+            stars_3 INTEGER NOT NULL DEFAULT 0,
+            stars_4 INTEGER NOT NULL DEFAULT 0,
+            stars_5 INTEGER NOT NULL DEFAULT 0,
+            last_rated_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO document_rating_stats
+            (document_id, rating_count, rating_sum, rating_average,
+             stars_1, stars_2, stars_3, stars_4, stars_5, last_rated_at)
+        SELECT d.id, COUNT(r.id), COALESCE(SUM(r.rating), 0), COALESCE(AVG(r.rating), 0),
+               COUNT(CASE WHEN r.rating = 1 THEN 1 END),
+               COUNT(CASE WHEN r.rating = 2 THEN 1 END),
+               COUNT(CASE WHEN r.rating = 3 THEN 1 END),
+               COUNT(CASE WHEN r.rating = 4 THEN 1 END),
+               COUNT(CASE WHEN r.rating = 5 THEN 1 END),
+               MAX(r.created_at)
+        FROM documents d
+        LEFT JOIN ratings r ON r.document_id = d.id
+        GROUP BY d.id
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_document_rating_stats_average
+        ON document_rating_stats (rating_average, document_id)
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS documents_rating_stats_insert
+        AFTER INSERT ON documents BEGIN
+            INSERT OR IGNORE INTO document_rating_stats (document_id) VALUES (NEW.id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS documents_rating_stats_delete
+        AFTER DELETE ON documents BEGIN
+            DELETE FROM document_rating_stats WHERE document_id = OLD.id;
+        END
+    ''')
+    _create_rating_stats_triggers(cursor)
+
+
+def migration_013_unique_ratings(cursor):
+    """Одна оценка документа от пользователя; замененные оценки - в истории."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rating_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            rating INTEGER NOT NULL,
+            comment TEXT,
+            rated_at TIMESTAMP NOT NULL,
+            replaced_at TIMESTAMP NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_rating_history_document
+        ON rating_history (document_id, user_id)
+    ''')
+    # Повторные оценки раньше добавлялись строками: оставляем последнюю
+    # по (created_at, id), а прежние переносим в историю. Временем замены
+    # считается время следующей оценки того же пользователя
+    superseded = '''
+        FROM ratings r
+        JOIN ratings n ON n.document_id = r.document_id AND n.user_id = r.user_id
+            AND (n.created_at, n.id) > (r.created_at, r.id)
+        GROUP BY r.id
+    '''
+    cursor.execute(f'''
+        INSERT INTO rating_history
+            (document_id, user_id, rating, comment, rated_at, replaced_at)
+        SELECT r.document_id, r.user_id, r.rating, r.comment, r.created_at, MIN(n.created_at)
+        {superseded}
+        ORDER BY r.id
+    ''')
+    # Триггеры на ratings вычитают удаленные оценки из document_rating_stats
+    cursor.execute(f'DELETE FROM ratings WHERE id IN (SELECT r.id {superseded})')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_ratings_document_user
+        ON ratings (document_id, user_id)
+    ''')
+    # Триггеры миграции 12 создавали строку сводки через INSERT OR IGNORE,
+    # который при upsert оценки нарушает уникальность document_rating_stats
+    for trigger in ('ratings_stats_insert', 'ratings_stats_delete', 'ratings_stats_update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    _create_rating_stats_triggers(cursor)
+
+
+def migration_014_version_history_index(cursor):
+    """Индекс, по которому читаются страницы истории версий системы."""
+    # Диапазон по первичному ключу планировщик выбирает только при подходящей
+    # статистике: после ANALYZE почти пустой таблицы он читает ее полным
+    # проходом. Запросы страниц указывают этот индекс в INDEXED BY, и их план
+    # от статистики не зависит
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_system_versions_page
+        ON system_versions (id)
+    ''')
+
+
+def split_version_number(version_number):
+    """Делит номер версии системы на префикс и последнюю числовую часть: '1.17' -> ('1', 17).
+
+    Номер без точки считается префиксом перед нулевой частью: следующий за 'X' - 'X.1'.
+    Для номера с нечисловой последней частью возвращает None.
+    """
+    prefix, dot, last = version_number.rpartition('.')
+    if not dot:
+        return version_number, 0
+    if not last.isdigit():
+        return None
+    return prefix, int(last)
+
+
+def migration_015_version_counter(cursor):
+    """Счетчик номеров версий системы и уникальность номера."""
+    # Номер следующей версии раньше вычислял клиент по последней версии, и два
+    # администратора, сохранявшие одновременно, получали одинаковые номера.
+    # Повторы делаем различимыми, добавляя ID версии, иначе индекс не создать
+    cursor.execute('''
+        UPDATE system_versions
+        SET version_number = version_number || '-' || id
+        WHERE EXISTS (SELECT 1 FROM system_versions p
+                      WHERE p.version_number = system_versions.version_number
+                        AND p.id < system_versions.id)
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_system_versions_number
+        ON system_versions (version_number)
+    ''')
+    # Одна строка: префикс номеров и последняя выданная числовая часть
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS system_version_counter (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            prefix TEXT NOT NULL,
+            last INTEGER NOT NULL
+        )
+    ''')
+    # Продолжаем нумерацию последней версии, как это делал клиент, но не ниже
+    # уже занятых номеров с тем же префиксом
+    cursor.execute('SELECT version_number FROM system_versions ORDER BY id DESC LIMIT 1')
+    row = cursor.fetchone()
+    parts = split_version_number(row[0]) if row else None
+    if parts is None:
+        return
+    prefix, last = parts
+    cursor.execute(
+        'SELECT version_number FROM system_versions WHERE version_number LIKE ? ESCAPE ?',
+        (prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '.%', '\\')
+    )
+    for (version_number,) in cursor.fetchall():
+        taken = split_version_number(version_number)
+        if taken is not None and taken[0] == prefix:
+            last = max(last, taken[1])
+    cursor.execute(
+        'INSERT OR REPLACE INTO system_version_counter (id, prefix, last) VALUES (1, ?, ?)',
+        (prefix, last)
+    )
+
+
+def migration_016_documents_content_version_index(cursor):
+    """Индекс documents по content_version_id для манифестов версий системы."""
+    # capture_manifest при каждом сохранении версии читает content_version_id
+    # всех документов: колонка лежит в записи за текстом, и без индекса
+    # читались бы страницы с текстами. delete_document_version находит по
+    # индексу документы, ссылающиеся на удаляемую версию
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_documents_content_version
+        ON documents (content_version_id)
+    ''')
+
+
+def migration_017_documents_trigram(cursor):
+    """Триграммный индекс FTS5 по документам для фильтра списка по подстроке.
+
+    Индекс сужает выборку до документов, содержащих все триграммы запроса
+    без учета регистра; точное совпадение подстроки проверяет RecordReader.
+    """
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS documents_trigram USING fts5(
+            title,
+            content,
+            content='documents',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS documents_trigram_insert AFTER INSERT ON documents BEGIN
+            INSERT INTO documents_trigram (rowid, title, content)
+            VALUES (new.id, new.title, new.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS documents_trigram_delete AFTER DELETE ON documents BEGIN
+            INSERT INTO documents_trigram (documents_trigram, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS documents_trigram_update
+        AFTER UPDATE OF title, content ON documents BEGIN
+            INSERT INTO documents_trigram (documents_trigram, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO documents_trigram (rowid, title, content)
+            VALUES (new.id, new.title, new.content);
+        END
+    ''')
+    # Индексируем уже существующие документы
+    cursor.execute("INSERT INTO documents_trigram (documents_trigram) VALUES ('rebuild')")
+
+
+def migration_018_drop_stale_statistics(cursor):
+    """Удаляет статистику планировщика, собранную прежними миграциями.
+
+    Миграции 3, 8 и 10 запускали ANALYZE, обычно на пустой или новой базе,
+    и оставляли в sqlite_stat1 оценки почти пустых таблиц: по ним планировщик
+    выбирает полный проход вместо индекса. Без статистики он выбирает индексы
+    по их форме; статистику заполненных таблиц обновляет Database.close.
+    """
+    cursor.execute('DROP TABLE IF EXISTS sqlite_stat1')
+
+
+def migration_019_drop_version_history_index(cursor):
+    """Удаляет индекс idx_system_versions_page из миграции 14.
+
+    Индекс по id повторял первичный ключ (rowid) и лишь обходил статистику
+    почти пустых таблиц, которую удалила миграция 18; страницы истории
+    читаются диапазоном по первичному ключу.
+    """
+    cursor.execute('DROP INDEX IF EXISTS idx_system_versions_page')
+
+
+def _create_trigram_index(cursor, table, columns):
+    """Создает триграммный индекс {table}_trigram по колонкам таблицы и словарь его триграмм.
+
+    Индекс не хранит ни копии текста (content=''), ни позиций (detail='none'):
+    триграммы запроса ищутся по отдельности, а точное совпадение подстроки
+    проверяет RecordReader. К каждому значению дописываются два символа
+    char(1): тогда любая подстрока из одного-двух символов - начало какой-то
+    триграммы, и короткий запрос ищется по словарю {table}_trigram_terms.
+    """
+    index = f'{table}_trigram'
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column} || char(1, 1)' for column in columns)
+    old = ', '.join(f'old.{column} || char(1, 1)' for column in columns)
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE {index} USING fts5(
+            {names}, content='', tokenize='trigram', detail='none'
+        )
+    ''')
+    cursor.execute(f"CREATE VIRTUAL TABLE {index}_terms USING fts5vocab({index}, 'row')")
+    cursor.execute(f'''
+        CREATE TRIGGER {index}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {index} (rowid, {names}) VALUES (new.id, {new});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER {index}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', old.id, {old});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER {index}_update AFTER UPDATE OF {names} ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', old.id, {old});
+            INSERT INTO {index} (rowid, {names}) VALUES (new.id, {new});
+        END
+    ''')
+    # Индексируем уже существующие строки
+    values = ', '.join(f'{column} || char(1, 1)' for column in columns)
+    cursor.execute(f'INSERT INTO {index} (rowid, {names}) SELECT id, {values} FROM {table}')
+
+
+def migration_020_trigram_indexes(cursor):
+    """Триграммные индексы документов, глоссария и FAQ для фильтра списков по подстроке.
+
+    Индекс документов из миграции 17 хранил позиции триграмм и не находил
+    запросы короче трех символов; он заменяется индексом того же вида, что
+    у глоссария и FAQ.
+    """
+    for trigger in ('insert', 'delete', 'update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS documents_trigram_{trigger}')
+    cursor.execute('DROP TABLE IF EXISTS documents_trigram')
+    _create_trigram_index(cursor, 'documents', ('title', 'content'))
+    _create_trigram_index(cursor, 'glossary', ('term', 'definition'))
+    _create_trigram_index(cursor, 'faq', ('question', 'answer'))
+
+
+# (номер, описание, функция); номера идут подряд, начиная с 1
+MIGRATIONS = [
+    (1, 'Базовая схема', migration_001_base_schema),
+    (2, 'Колонка updated_at в глоссарии и FAQ', migration_002_updated_at),
+    (3, 'Индексы для горячих запросов', migration_003_hot_query_indexes),
+    (4, 'Полнотекстовый поиск по документам', migration_004_documents_fts),
+    (5, 'Дельта-сжатие версий документов', migration_005_version_deltas),
+    (6, 'Хранилище текстов по хешу', migration_006_content_blobs),
+    (7, 'Манифесты версий системы', migration_007_system_manifests),
+    (8, 'Покрывающий индекс списка документов', migration_008_documents_listing_index),
+    (9, 'Журнал изменений для других процессов', migration_009_change_log),
+    (10, 'Индексы для постраничного чтения списков', migration_010_paging_indexes),
+    (11, 'Связь вопросов пользователей с FAQ', migration_011_question_faq_link),
+    (12, 'Сводка оценок документов', migration_012_rating_stats),
+    (13, 'Одна оценка документа от пользователя', migration_013_unique_ratings),
+    (14, 'Индекс страниц истории версий системы', migration_014_version_history_index),
+    (15, 'Счетчик номеров версий системы', migration_015_version_counter),
+    (16, 'Индекс документов по версии текста', migration_016_documents_content_version_index),
+    (17, 'Триграммный индекс документов для фильтра списка', migration_017_documents_trigram),
+    (18, 'Удаление статистики почти пустых таблиц', migration_018_drop_stale_statistics),
+    (19, 'Удаление индекса, повторявшего первичный ключ версий', migration_019_drop_version_history_index),
+    (20, 'Триграммные индексы документов, глоссария и FAQ', migration_020_trigram_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """Возвращает номер последней примененной миграции."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Применяет недостающие миграции в одной транзакции; возвращает итоговую версию схемы."""
+    if get_schema_version(conn) >= LATEST_VERSION:
+        return LATEST_VERSION
+
+    # BEGIN IMMEDIATE сразу берет блокировку записи, чтобы два процесса
+    # не начали применять одни и те же миграции одновременно
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Версию перечитываем под блокировкой: ее мог обновить другой процесс
+        version = get_schema_version(conn)
+        cursor = conn.cursor()
+        for number, description, migration in MIGRATIONS:
+            if number > version:
+                migration(cursor)
+                version = number
+        # PRAGMA не поддерживает параметры, version - всегда целое число
+        conn.execute(f'PRAGMA user_version = {int(version)}')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return version
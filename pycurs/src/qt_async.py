@@ -0,0 +1,73 @@
+"""Совместная работа asyncio и цикла событий Qt.
+
+Если установлен qasync, asyncio работает поверх его QEventLoop. Без него
+цикл asyncio прокручивается таймером Qt: на каждом срабатывании выполняются
+готовые обратные вызовы, в том числе завершения вызовов AsyncDatabase.
+
+Пример:
+    loop = install_event_loop(app)
+    ...
+    sys.exit(exec_event_loop(app, loop))
+
+Обработчик окна запускает корутину через spawn() или AsyncDatabase.latest().
+"""
+import asyncio
+
+from PyQt6.QtCore import QObject, QTimer
+
+# Период прокрутки asyncio без qasync, мс
+STEP_INTERVAL = 10
+
+
+class _TimerDriver(QObject):
+    """Прокручивает цикл asyncio по таймеру Qt."""
+
+    def __init__(self, loop, interval=STEP_INTERVAL):
+        super().__init__()
+        self.loop = loop
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.step)
+        self.timer.start(interval)
+
+    def step(self):
+        # Вложенный цикл Qt (модальный диалог из корутины) снова вызывает таймер,
+        # а запустить уже работающий цикл asyncio повторно нельзя
+        if self.loop.is_running() or self.loop.is_closed():
+            return
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+
+def install_event_loop(app):
+    """Связывает asyncio с циклом событий Qt приложения и возвращает цикл asyncio."""
+    try:
+        import qasync
+    except ImportError:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        # Ссылку храним в приложении, чтобы таймер жил столько же, сколько оно
+        app.asyncio_driver = _TimerDriver(loop)
+        return loop
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def exec_event_loop(app, loop):
+    """Выполняет цикл событий приложения до выхода и возвращает код завершения."""
+    driver = getattr(app, 'asyncio_driver', None)
+    if driver is None:
+        # QEventLoop из qasync сам запускает app.exec()
+        with loop:
+            return loop.run_forever()
+    try:
+        return app.exec()
+    finally:
+        driver.timer.stop()
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def spawn(coro):
+    """Запускает корутину из обработчика сигнала Qt и возвращает задачу."""
+    return asyncio.ensure_future(coro)
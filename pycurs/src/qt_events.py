@@ -0,0 +1,35 @@
+"""Доставка событий Database в поток интерфейса Qt.
+
+EventBus вызывает подписчиков в потоке, выполнившем изменение, например в
+потоке AsyncDatabase. QtEventBridge пересылает событие сигналом: если
+изменение сделано в другом потоке, слот окна вызовется в потоке интерфейса
+через очередь событий Qt.
+
+Пример:
+    self.events = QtEventBridge(db.events, self)
+    self.events.received.connect(self.on_db_event)
+"""
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+class QtEventBridge(QObject):
+    received = pyqtSignal(object)
+
+    def __init__(self, bus, parent=None, *event_types):
+        """Подписывается на события bus указанных типов (без типов - на все)."""
+        super().__init__(parent)
+        self._unsubscribe = bus.subscribe(self._forward, *event_types)
+
+    def _forward(self, event):
+        try:
+            self.received.emit(event)
+        except RuntimeError:
+            # Объект Qt уже удален вместе с окном
+            self.close()
+
+    def close(self):
+        """Отменяет подписку; вызывается при закрытии окна."""
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+
@@ -0,0 +1,474 @@
+"""Записи с именованными полями вместо кортежей из Database.
+
+Записи используют __slots__ и не имеют __dict__. Чтение идет через row
+factory курсора, а выборку можно сузить до нужных колонок: для каждого набора
+колонок создается подкласс, слоты которого - ровно выбранные поля, так что
+запись занимает не больше памяти, чем кортеж той же ширины. Обращение
+к невыбранному полю дает AttributeError, а не молчаливое None.
+
+Пример:
+    for doc in db.records.documents(columns=('id', 'title')):
+        print(doc.id, doc.title)
+"""
+
+
+class Record:
+    __slots__ = ()
+    # Все поля записи по порядку
+    _fields = ()
+    # Поле -> SQL-выражение в запросах RecordReader
+    _columns = {}
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={value!r}' for name, value in self.as_dict().items())
+        return f'{type(self).__name__}({values})'
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def as_dict(self):
+        """Возвращает заполненные поля записи."""
+        return {name: getattr(self, name) for name in self._fields if hasattr(self, name)}
+
+    @classmethod
+    def select_list(cls, columns=None):
+        """Возвращает SQL-список выбираемых колонок; неизвестное поле - ValueError."""
+        columns = cls._fields if columns is None else columns
+        unknown = [name for name in columns if name not in cls._columns]
+        if unknown:
+            raise ValueError(f"{cls.__name__}: неизвестные поля {', '.join(unknown)}")
+        return ', '.join(f'{cls._columns[name]} AS {name}' for name in columns)
+
+
+class Document(Record):
+    __slots__ = ()
+    _fields = ('id', 'title', 'content', 'version', 'created_at', 'updated_at',
+               'created_by', 'doc_type', 'rating_count', 'rating_average')
+    _columns = {name: f'd.{name}' for name in _fields[:8]}
+    # Сводка оценок из document_rating_stats; у неоцененного документа средняя - 0
+    _columns.update(rating_count='s.rating_count', rating_average='s.rating_average')
+
+
+class DocumentVersion(Record):
+    __slots__ = ()
+    _fields = ('id', 'document_id', 'version', 'created_at', 'created_by', 'username',
+               'content')
+    _columns = {
+        'id': 'dv.id',
+        'document_id': 'dv.document_id',
+        'version': 'dv.version',
+        'created_at': 'dv.created_at',
+        'created_by': 'dv.created_by',
+        'username': 'u.username',
+        # Текст восстанавливается из разниц после выборки, см. RecordReader
+        'content': 'NULL',
+    }
+
+
+class GlossaryTerm(Record):
+    __slots__ = ()
+    _fields = ('id', 'term', 'definition', 'created_at', 'created_by', 'updated_at')
+    _columns = {name: f'g.{name}' for name in _fields}
+
+
+class Faq(Record):
+    __slots__ = ()
+    _fields = ('id', 'question', 'answer', 'created_at', 'created_by', 'updated_at')
+    _columns = {name: f'f.{name}' for name in _fields}
+
+
+class Question(Record):
+    __slots__ = ()
+    _fields = ('id', 'user_id', 'question', 'status', 'created_at', 'username', 'faq_id',
+               'answer')
+    _columns = {
+        'id': 'uq.id',
+        'user_id': 'uq.user_id',
+        'question': 'uq.question',
+        'status': 'uq.status',
+        'created_at': 'uq.created_at',
+        'username': 'u.username',
+        'faq_id': 'uq.faq_id',
+        'answer': 'f.answer',
+    }
+
+
+class Rating(Record):
+    __slots__ = ()
+    _fields = ('id', 'document_id', 'user_id', 'rating', 'comment', 'created_at', 'username')
+    _columns = {
+        'id': 'r.id',
+        'document_id': 'r.document_id',
+        'user_id': 'r.user_id',
+        'rating': 'r.rating',
+        'comment': 'r.comment',
+        'created_at': 'r.created_at',
+        'username': 'u.username',
+    }
+
+
+class User(Record):
+    __slots__ = ()
+    # Пароль через записи не читается
+    _fields = ('id', 'username', 'is_admin', 'created_at')
+    _columns = {name: f'us.{name}' for name in _fields}
+
+
+class SystemVersion(Record):
+    __slots__ = ()
+    _fields = ('id', 'version_number', 'description', 'changes', 'created_at',
+               'created_by', 'username', 'change_count')
+    _columns = {
+        'id': 'sv.id',
+        'version_number': 'sv.version_number',
+        'description': 'sv.description',
+        'changes': 'sv.changes',
+        'created_at': 'sv.created_at',
+        'created_by': 'sv.created_by',
+        # Подзапрос по первичному ключу вместо JOIN: версии удаленных
+        # пользователей остаются в истории
+        'username': '(SELECT u.username FROM users u WHERE u.id = sv.created_by)',
+        # Число записей version_changes; считается по idx_version_changes_version
+        'change_count': '(SELECT COUNT(*) FROM version_changes vc WHERE vc.version_id = sv.id)',
+    }
+
+
+def record_factory(cls):
+    """Возвращает row factory, собирающую записи cls по именам колонок курсора.
+
+    Для каждого набора колонок один раз создается подкласс cls с этими слотами
+    и компилируется функция, которая раскладывает строку по слотам одним присваиванием.
+    """
+    builders = {}
+    # (description, builder) последнего курсора; пара читается и заменяется
+    # целиком, потому что фабрикой пользуются курсоры разных потоков
+    last = [(None, None)]
+
+    def factory(cursor, row):
+        description = cursor.description
+        seen, builder = last[0]
+        if description is not seen:
+            names = tuple(column[0] for column in description)
+            builder = builders.get(names)
+            if builder is None:
+                builder = builders[names] = _compile_builder(cls, names)
+            last[0] = (description, builder)
+        return builder(row)
+
+    return factory
+
+
+def _compile_builder(cls, names):
+    unknown = [name for name in names if name not in cls._fields]
+    if unknown:
+        raise ValueError(f"{cls.__name__}: неизвестные колонки {', '.join(unknown)}")
+    # Подкласс хранит только выбранные поля и остается экземпляром cls
+    projection = type(cls.__name__, (cls,), {'__slots__': names, '__module__': cls.__module__})
+    targets = ', '.join(f'record.{name}' for name in names)
+    source = (
+        'def build(row):\n'
+        '    record = new(cls)\n'
+        f'    {targets}, = row\n'
+        '    return record\n'
+    )
+    namespace = {'new': object.__new__, 'cls': projection}
+    exec(source, namespace)
+    return namespace['build']
+
+
+def _page(keys, after, limit, descending=False):
+    """Возвращает (условие или None, ORDER BY ... [LIMIT ?], параметры) для чтения страницами.
+
+    keys - SQL-выражения ключа сортировки, последнее из них уникально;
+    after - значения ключа последней прочитанной строки или None для первой
+    страницы. Условие по ключу использует индекс сортировки, поэтому страница
+    читается за одно и то же время, как бы далеко от начала она ни была.
+    Параметры условия идут перед параметром LIMIT: условие должно быть
+    последним в WHERE.
+    """
+    condition, params = None, []
+    if after is not None:
+        marks = ', '.join('?' * len(keys))
+        condition = f"({', '.join(keys)}) {'<' if descending else '>'} ({marks})"
+        params.extend(after)
+    direction = ' DESC' if descending else ''
+    tail = ' ORDER BY ' + ', '.join(key + direction for key in keys)
+    if limit is not None:
+        tail += ' LIMIT ?'
+        params.append(limit)
+    return condition, tail, params
+
+
+def contains_text(text, query):
+    """SQL-функция contains_text(поле, запрос): запрос встречается в поле как подстрока.
+
+    Запрос передается уже в нижнем регистре; регистр поля приводится так же,
+    как str.lower(), то есть и для кириллицы, в отличие от LIKE в SQLite.
+    Регистрируется для каждого соединения Database.
+    """
+    return text is not None and query in text.lower()
+
+
+# Запрос короче трех символов ищется по словарю триграммного индекса - среди
+# триграмм, которые с него начинаются. Если таких больше, запрос встречается
+# во многих строках, и страница заполняется проходом по индексу сортировки
+# быстрее, чем объединяются списки строк стольких триграмм
+SHORT_QUERY_MAX_TERMS = 200
+
+# Если индекс дает меньше строк, они читаются по id и сортируются; иначе
+# страница читается по индексу сортировки, а строки из индекса только отбирают
+FILTER_LOOKUP_ROWS = 500
+
+
+def _fts_string(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _where(conditions):
+    conditions = [condition for condition in conditions if condition]
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+
+class RecordReader:
+    """Чтение таблиц Database в виде записей; доступно как db.records.
+
+    Списки читаются целиком или страницами: limit - размер страницы, after -
+    ключ сортировки последней строки предыдущей страницы (кортеж значений
+    полей, перечисленных в описании метода).
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._factories = {}
+
+    def _fetch(self, cls, columns, sql, params=()):
+        factory = self._factories.get(cls)
+        if factory is None:
+            factory = self._factories[cls] = record_factory(cls)
+        with self.db._connect() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = factory
+            cursor.execute(sql.format(columns=cls.select_list(columns)), params)
+            return cursor.fetchall()
+
+    def _one(self, cls, columns, sql, params):
+        rows = self._fetch(cls, columns, sql, params)
+        return rows[0] if rows else None
+
+    def _contains(self, index, key, fields, text):
+        """Возвращает (условие или None, параметры): text встречается хотя бы в одном из полей.
+
+        index - триграммный индекс таблицы (миграция 20), key - id строки в
+        запросе. Для запроса из одного-трех символов совпадение в индексе
+        точное. Для более длинного индекс оставляет строки, где есть все
+        триграммы запроса, но не обязательно подряд, и точное совпадение
+        проверяет contains_text; поля проверяются по порядку, и следующее
+        читается, только если не подошло предыдущее.
+        Если строк в индексе не меньше FILTER_LOOKUP_ROWS, унарный плюс не дает
+        читать строки по списку из индекса: порядок страниц остается за индексом
+        сортировки, и чтение останавливается на limit строк.
+        """
+        if not text:
+            return None, []
+        query = text.lower()
+        check = ' OR '.join(f'contains_text({field}, ?)' for field in fields)
+        params = [query] * len(fields)
+        if len(query) > 3:
+            match = ' AND '.join(_fts_string(query[i:i + 3]) for i in range(len(query) - 2))
+        elif len(query) == 3:
+            match, check = _fts_string(query), None
+        else:
+            # Индекс дописывает к значениям два служебных символа, поэтому каждое
+            # вхождение короткого запроса - начало какой-то триграммы словаря
+            terms = [term for term, in self.db._fetch_all(
+                f'SELECT term FROM {index}_terms WHERE term >= ? AND term <= ? LIMIT ?',
+                (query, query + '\U0010ffff', SHORT_QUERY_MAX_TERMS + 1)
+            )]
+            if not terms:
+                return '0', []
+            if len(terms) > SHORT_QUERY_MAX_TERMS:
+                return f'({check})', params
+            match, check = ' OR '.join(_fts_string(term) for term in terms), None
+        found = self.db._fetch_one(
+            f'SELECT COUNT(*) FROM (SELECT 1 FROM {index} WHERE {index} MATCH ? LIMIT ?)',
+            (match, FILTER_LOOKUP_ROWS)
+        )[0]
+        if not found:
+            return '0', []
+        plus = '+' if found >= FILTER_LOOKUP_ROWS else ''
+        condition = f'{plus}{key} IN (SELECT rowid FROM {index} WHERE {index} MATCH ?)'
+        if check is None:
+            return condition, [match]
+        return f'{condition} AND ({check})', [match] + params
+
+    def documents(self, columns=None, doc_type=None, text=None, after=None, limit=None,
+                  by_rating=False):
+        """Документы по заголовку, ключ (title, id); без content список читается из индекса.
+
+        text - подстрока заголовка или текста документа без учета регистра.
+        by_rating=True - от лучшей средней оценки к худшей, ключ (rating_average, id);
+        порядок берется из индекса сводок оценок.
+        """
+        if by_rating:
+            condition, tail, page_params = _page(('s.rating_average', 's.document_id'), after,
+                                                 limit, descending=True)
+            # CROSS JOIN закрепляет порядок соединения: сводки идут внешним циклом по индексу
+            source = 'document_rating_stats s CROSS JOIN documents d ON d.id = s.document_id'
+        else:
+            condition, tail, page_params = _page(('d.title', 'd.id'), after, limit)
+            # Без полей сводки LEFT JOIN по ее первичному ключу SQLite не выполняет
+            source = 'documents d LEFT JOIN document_rating_stats s ON s.document_id = d.id'
+        params = []
+        conditions = []
+        if doc_type is not None:
+            conditions.append('d.doc_type = ?')
+            params.append(doc_type)
+        # Заголовок проверяется первым: текст документа читается, только если он не подошел
+        text_condition, text_params = self._contains(
+            'documents_trigram', 'd.id', ('d.title', 'd.content'), text)
+        conditions.append(text_condition)
+        params.extend(text_params)
+        conditions.append(condition)
+        return self._fetch(
+            Document, columns,
+            f'SELECT {{columns}} FROM {source} {_where(conditions)}{tail}',
+            params + page_params
+        )
+
+    def document(self, doc_id, columns=None):
+        return self._one(
+            Document, columns,
+            '''SELECT {columns}
+               FROM documents d
+               LEFT JOIN document_rating_stats s ON s.document_id = d.id
+               WHERE d.id = ?''',
+            (doc_id,)
+        )
+
+    def document_versions(self, doc_id, columns=None, after=None, limit=None):
+        """Версии документа от новых к старым, ключ (version,); текст восстанавливается, только если выбран."""
+        columns = DocumentVersion._fields if columns is None else tuple(columns)
+        with_content = 'content' in columns
+        if with_content and 'id' not in columns:
+            columns += ('id',)
+        condition, tail, page_params = _page(('dv.version',), after, limit, descending=True)
+        versions = self._fetch(
+            DocumentVersion, columns,
+            f'''SELECT {{columns}}
+                FROM document_versions dv
+                JOIN users u ON u.id = dv.created_by
+                {_where(['dv.document_id = ?', condition])}{tail}''',
+            [doc_id] + page_params
+        )
+        if with_content and versions:
+            with self.db._connect() as conn:
+                contents = self.db._versions_content(
+                    conn.cursor(), [version.id for version in versions]
+                )
+            for version in versions:
+                version.content = contents[version.id]
+        return versions
+
+    def glossary_terms(self, columns=None, text=None, after=None, limit=None):
+        """Термины по алфавиту, ключ (term, id); text - подстрока термина или определения."""
+        text_condition, params = self._contains(
+            'glossary_trigram', 'g.id', ('g.term', 'g.definition'), text)
+        condition, tail, page_params = _page(('g.term', 'g.id'), after, limit)
+        return self._fetch(
+            GlossaryTerm, columns,
+            f'SELECT {{columns}} FROM glossary g {_where([text_condition, condition])}{tail}',
+            params + page_params
+        )
+
+    def glossary_term(self, term_id, columns=None):
+        return self._one(GlossaryTerm, columns, 'SELECT {columns} FROM glossary g WHERE g.id = ?',
+                         (term_id,))
+
+    def faqs(self, columns=None, text=None, after=None, limit=None):
+        """Вопросы FAQ по алфавиту, ключ (question, id); text - подстрока вопроса или ответа."""
+        text_condition, params = self._contains(
+            'faq_trigram', 'f.id', ('f.question', 'f.answer'), text)
+        condition, tail, page_params = _page(('f.question', 'f.id'), after, limit)
+        return self._fetch(
+            Faq, columns,
+            f'SELECT {{columns}} FROM faq f {_where([text_condition, condition])}{tail}',
+            params + page_params
+        )
+
+    def faq(self, faq_id, columns=None):
+        return self._one(Faq, columns, 'SELECT {columns} FROM faq f WHERE f.id = ?', (faq_id,))
+
+    def questions(self, status=None, user_id=None, columns=None, after=None, limit=None):
+        """Вопросы пользователей от новых к старым с именем автора и ответом из FAQ.
+
+        Ключ страниц - (created_at, id).
+        """
+        conditions, params = [], []
+        if status is not None:
+            conditions.append('uq.status = ?')
+            params.append(status)
+        if user_id is not None:
+            conditions.append('uq.user_id = ?')
+            params.append(user_id)
+        condition, tail, page_params = _page(('uq.created_at', 'uq.id'), after, limit,
+                                             descending=True)
+        conditions.append(condition)
+        return self._fetch(
+            Question, columns,
+            f'''SELECT {{columns}}
+                FROM user_questions uq
+                JOIN users u ON u.id = uq.user_id
+                LEFT JOIN faq f ON f.id = uq.faq_id
+                {_where(conditions)}{tail}''',
+            params + page_params
+        )
+
+    def question(self, question_id, columns=None):
+        return self._one(
+            Question, columns,
+            '''SELECT {columns}
+               FROM user_questions uq
+               JOIN users u ON u.id = uq.user_id
+               LEFT JOIN faq f ON f.id = uq.faq_id
+               WHERE uq.id = ?''',
+            (question_id,)
+        )
+
+    def ratings(self, doc_id, columns=None):
+        return self._fetch(
+            Rating, columns,
+            '''SELECT {columns}
+               FROM ratings r
+               JOIN users u ON u.id = r.user_id
+               WHERE r.document_id = ?
+               ORDER BY r.created_at DESC''',
+            (doc_id,)
+        )
+
+    def users(self, columns=None, after=None, limit=None):
+        """Пользователи в порядке добавления, ключ (id,)."""
+        condition, tail, params = _page(('us.id',), after, limit)
+        return self._fetch(User, columns,
+                           f'SELECT {{columns}} FROM users us {_where([condition])}{tail}', params)
+
+    def user(self, user_id, columns=None):
+        return self._one(User, columns, 'SELECT {columns} FROM users us WHERE us.id = ?',
+                         (user_id,))
+
+    def system_versions(self, columns=None, after=None, limit=None):
+        """Версии системы от новых к старым, ключ (id,)."""
+        condition, tail, params = _page(('sv.id',), after, limit, descending=True)
+        return self._fetch(
+            SystemVersion, columns,
+            f'SELECT {{columns}} FROM system_versions sv {_where([condition])}{tail}',
+            params
+        )
+
+    def system_version(self, version_id, columns=None):
+        return self._one(
+            SystemVersion, columns,
+            '''SELECT {columns}
+               FROM system_versions sv
+               WHERE sv.id = ?''',
+            (version_id,)
+        )
@@ -1,18 +1,50 @@
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                           QLabel, QTextBrowser, QPushButton, QListWidget,
+                           QLabel, QTextBrowser, QPushButton, QListView,
                            QTabWidget, QLineEdit, QMessageBox, QSpinBox,
                            QFileDialog, QComboBox, QGroupBox, QTextEdit)
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
+import asyncio
 import markdown
 from utils import export_to_pdf, export_to_html, export_to_markdown
+from events import (BulkInserted, ChangesLost, DocumentAdded, DocumentDeleted,
+                    DocumentsRestored, DocumentUpdated, FaqAdded, FaqDeleted, FaqUpdated,
+                    GlossaryAdded, GlossaryDeleted, GlossaryUpdated, QuestionAnswered,
+                    QuestionAsked, QuestionDeleted, RatingAdded)
+from background import BackgroundLoader
+from qt_events import QtEventBridge
+from list_models import ListRow, PagedListModel
+
+# Сколько секунд ждать результатов поиска и загрузки документа
+SEARCH_TIMEOUT = 10
+# Сколько миллисекунд ввод в поле фильтра должен затихнуть, чтобы список перечитался
+FILTER_DELAY = 250
 
 class UserWindow(QMainWindow):
-    def __init__(self, db, user_id, main_window=None):
+    def __init__(self, db, user_id, main_window=None, async_db=None):
         super().__init__()
         self.db = db
+        # AsyncDatabase: поиск и загрузка документа не блокируют окно
+        self.async_db = async_db
         self.user_id = user_id
         self.main_window = main_window
+        self.searched_query = None
+        # Строки результатов поиска в порядке релевантности
+        self.search_results = []
+        # Список документов по средней оценке, а не по заголовку
+        self.by_rating = False
+        # Фильтры, с которыми читаются страницы списков: страницы читаются
+        # в фоновых потоках, поэтому поля ввода там не читаем
+        self.doc_type = None
+        self.documents_text = ''
+        self.glossary_text = ''
+        self.faq_text = ''
+        # Первые страницы списков читаются в фоне, окно не ждет базу
+        self.loader = BackgroundLoader(self)
+        self.create_models()
         self.init_ui()
+        # Изменения в базе обновляют только затронутые разделы окна
+        self.events = QtEventBridge(db.events, self)
+        self.events.received.connect(self.on_db_event)
 
     def init_ui(self):
         central_widget = QWidget()
@@ -26,7 +58,8 @@ class UserWindow(QMainWindow):
         search_layout = QHBoxLayout()
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText('Поиск...')
-        self.search_input.textChanged.connect(self.filter_documents)  # Добавляем фильтрацию при вводе
+        # Фильтрация при вводе: список перечитывается, когда ввод затих
+        self.search_input.textChanged.connect(self.filter_timer(self.filter_documents))
         search_btn = QPushButton('Найти')
         search_btn.clicked.connect(self.search_documents)
         search_layout.addWidget(self.search_input)
@@ -41,9 +74,18 @@ class UserWindow(QMainWindow):
         filter_layout.addWidget(filter_label)
         filter_layout.addWidget(self.filter_combo)
         
+        # Порядок списка разделов
+        sort_layout = QHBoxLayout()
+        sort_label = QLabel('Сортировка:')
+        self.sort_combo = QComboBox()
+        self.sort_combo.addItems(['По названию', 'По оценке'])
+        self.sort_combo.currentIndexChanged.connect(self.change_sort)
+        sort_layout.addWidget(sort_label)
+        sort_layout.addWidget(self.sort_combo)
+        
         sections_label = QLabel('Разделы документации')
-        self.sections_list = QListWidget()
-        self.sections_list.itemClicked.connect(self.load_document)
+        self.sections_list = self.list_view(self.documents_model)
+        self.sections_list.clicked.connect(self.load_document)
         
         # Добавляем кнопку выхода
         logout_btn = QPushButton('Выйти из системы')
@@ -52,6 +94,7 @@ class UserWindow(QMainWindow):
         
         left_layout.addLayout(search_layout)
         left_layout.addLayout(filter_layout)
+        left_layout.addLayout(sort_layout)
         left_layout.addWidget(sections_label)
         left_layout.addWidget(self.sections_list)
         left_layout.addStretch()
@@ -102,10 +145,10 @@ class UserWindow(QMainWindow):
         glossary_search_layout = QHBoxLayout()
         self.glossary_search_input = QLineEdit()
         self.glossary_search_input.setPlaceholderText('Поиск в глоссарии...')
-        self.glossary_search_input.textChanged.connect(self.filter_glossary)
+        self.glossary_search_input.textChanged.connect(self.filter_timer(self.filter_glossary))
         glossary_search_layout.addWidget(self.glossary_search_input)
         
-        self.glossary_list = QListWidget()
+        self.glossary_list = self.list_view(self.glossary_model)
         
         glossary_layout.addLayout(glossary_search_layout)
         glossary_layout.addWidget(self.glossary_list)
@@ -119,10 +162,10 @@ class UserWindow(QMainWindow):
         faq_search_layout = QHBoxLayout()
         self.faq_search_input = QLineEdit()
         self.faq_search_input.setPlaceholderText('Поиск в FAQ...')
-        self.faq_search_input.textChanged.connect(self.filter_faq)
+        self.faq_search_input.textChanged.connect(self.filter_timer(self.filter_faq))
         faq_search_layout.addWidget(self.faq_search_input)
         
-        self.faq_list = QListWidget()
+        self.faq_list = self.list_view(self.faq_model)
         
         faq_layout.addLayout(faq_search_layout)
         faq_layout.addWidget(self.faq_list)
@@ -135,7 +178,7 @@ class UserWindow(QMainWindow):
         # Список моих вопросов
         my_questions_group = QGroupBox('Мои вопросы')
         my_questions_layout = QVBoxLayout()
-        self.questions_list = QListWidget()
+        self.questions_list = self.list_view(self.questions_model)
         
         # Поле для нового вопроса
         new_question_group = QGroupBox('Задать вопрос')
@@ -177,81 +220,303 @@ class UserWindow(QMainWindow):
         self.load_data()
         self.current_doc_id = None
 
+    def create_models(self):
+        """Создает модели списков; строки читаются из базы страницами, см. list_models.py.
+
+        Фильтры при вводе входят в запросы страниц: подстрока ищется в базе
+        по всей таблице без учета регистра: в заголовке или тексте документа,
+        в термине или определении, в вопросе или ответе FAQ.
+        """
+        records = self.db.records
+        self.documents_model = PagedListModel(
+            lambda after, limit: records.documents(
+                columns=self.DOCUMENT_COLUMNS, doc_type=self.doc_type,
+                text=self.documents_text, after=after, limit=limit, by_rating=self.by_rating),
+            self.describe_document, parent=self
+        )
+        self.glossary_model = PagedListModel(
+            lambda after, limit: records.glossary_terms(
+                columns=('id', 'term', 'definition'), text=self.glossary_text,
+                after=after, limit=limit),
+            lambda term: ListRow(term.id, f"{term.term}: {term.definition}", (term.term, term.id)),
+            parent=self
+        )
+        self.faq_model = PagedListModel(
+            lambda after, limit: records.faqs(
+                columns=('id', 'question', 'answer'), text=self.faq_text,
+                after=after, limit=limit),
+            lambda faq: ListRow(faq.id, f"Q: {faq.question}\nA: {faq.answer}",
+                                (faq.question, faq.id)),
+            parent=self
+        )
+        # Вопросы пользователя от новых к старым
+        self.questions_model = PagedListModel(
+            lambda after, limit: records.questions(
+                user_id=self.user_id, columns=self.QUESTION_COLUMNS, after=after, limit=limit),
+            self.describe_question, descending=True, parent=self
+        )
+        self.models = {'documents': self.documents_model, 'glossary': self.glossary_model,
+                       'faq': self.faq_model, 'questions': self.questions_model}
+
+    # Колонки строки списка документов: заголовок, тип для фильтра и сводка оценок
+    DOCUMENT_COLUMNS = ('id', 'title', 'doc_type', 'rating_count', 'rating_average')
+
+    def describe_document(self, doc):
+        key = (doc.rating_average, doc.id) if self.by_rating else (doc.title, doc.id)
+        tooltip = None
+        if doc.rating_count:
+            tooltip = f"Средняя оценка {doc.rating_average:.1f} из {doc.rating_count}"
+        return ListRow(doc.id, doc.title, key, tooltip=tooltip, data=doc.doc_type)
+
+    # Колонки строки списка вопросов, включая ключ сортировки
+    QUESTION_COLUMNS = ('id', 'status', 'question', 'faq_id', 'answer', 'created_at')
+
+    @staticmethod
+    def describe_question(q):
+        status = '[Отвечен]' if q.status == 'answered' else '[Ожидает ответа]'
+        question_text = f"{status} Вопрос: {q.question}"
+        if q.status == 'answered' and q.answer:  # Если вопрос отвечен и есть ответ
+            question_text += f"\nОтвет: {q.answer}"
+        # В данных строки - запись FAQ с ответом: ее правка меняет текст строки
+        return ListRow(q.id, question_text, (q.created_at, q.id), data=q.faq_id)
+
+    @staticmethod
+    def list_view(model):
+        view = QListView()
+        view.setModel(model)
+        return view
+
+    def filter_timer(self, slot):
+        """Возвращает слот для textChanged, который вызывает slot через FILTER_DELAY мс.
+
+        Каждое нажатие перезапускает таймер, поэтому при быстром вводе список
+        перечитывается один раз, по последнему тексту.
+        """
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.setInterval(FILTER_DELAY)
+        timer.timeout.connect(slot)
+        return lambda text: timer.start()
+
     def load_data(self):
-        # Загружаем документы
-        self.all_documents = self.db.get_all_documents()
-        self.sections_list.clear()
-        for doc in self.all_documents:
-            self.sections_list.addItem(doc[1])  # doc[1] - title
-            
-        # Загружаем термины глоссария
-        self.all_terms = self.db.get_all_glossary_terms()
-        self.glossary_list.clear()
-        for term in self.all_terms:
-            self.glossary_list.addItem(f"{term[1]}: {term[2]}")  # term[1] - term name, term[2] - definition
-        
-        # Загружаем FAQ
-        self.all_faqs = self.db.get_all_faq()
-        self.faq_list.clear()
-        for faq in self.all_faqs:
-            self.faq_list.addItem(f"Q: {faq[1]}\nA: {faq[2]}")  # faq[1] - question, faq[2] - answer
-        
-        # Загружаем вопросы пользователя с ответами
-        questions = self.db.get_user_questions_with_answers(self.user_id)
-        self.questions_list.clear()
-        for q in questions:
-            status = '[Отвечен]' if q[3] == 'answered' else '[Ожидает ответа]'
-            question_text = f"{status} Вопрос: {q[2]}"
-            if q[3] == 'answered' and q[6]:  # Если вопрос отвечен и есть ответ
-                question_text += f"\nОтвет: {q[6]}"
-            self.questions_list.addItem(question_text)
+        """Читает первые страницы списков; остальные дочитываются при прокрутке."""
+        self.load_documents()
+        for section in ('glossary', 'faq', 'questions'):
+            self.load_section(section)
+
+    def load_section(self, section):
+        """Показывает заглушку в списке раздела и читает в фоне его первую страницу."""
+        model = self.models[section]
+        model.show_placeholder('Загрузка...')
+        fetch = model.fetch
+        self.loader.load(
+            section, lambda: fetch(None, model.page_size), model.set_first_page,
+            lambda error: model.show_placeholder(f'Ошибка загрузки: {error}')
+        )
+
+    def can_patch(self, section):
+        """Можно ли менять строки раздела по событию, не загружая его заново.
+
+        Пока раздел загружается или в нем показана ошибка, строки менять нельзя:
+        вместо этого раздел загружается заново и получит изменение из базы.
+        """
+        if self.loader.is_loading(section) or self.models[section].placeholder is not None:
+            self.load_section(section)
+            return False
+        return True
+
+    def load_documents(self):
+        # Загружаем список документов без текстов
+        self.searched_query = None
+        self.filter_documents()
+
+    def change_sort(self, index):
+        """Переключает порядок списка документов; результаты поиска сменяются списком."""
+        self.by_rating = index == 1
+        # По оценке список идет от лучших документов к худшим
+        self.documents_model.descending = self.by_rating
+        self.load_documents()
+
+    def on_db_event(self, event):
+        """Обновляет строки списков, затронутые изменением в базе."""
+        if isinstance(event, (DocumentAdded, DocumentUpdated, DocumentDeleted)):
+            # Результаты поиска не подменяем списком всех документов
+            if self.searched_query is None:
+                self.put_document(event.id)
+            if isinstance(event, DocumentUpdated) and event.id == self.current_doc_id:
+                # Открытый документ показываем в новой версии
+                doc = self.db.records.document(event.id, columns=('title',))
+                self.show_document(event.id, doc.title, self.db.get_document_content(event.id))
+        elif isinstance(event, (GlossaryAdded, GlossaryUpdated, GlossaryDeleted)):
+            if self.glossary_text:
+                self.load_section('glossary')
+            else:
+                term = self.db.records.glossary_term(event.id, columns=('id', 'term', 'definition'))
+                self.put_row('glossary', term, event.id)
+        elif isinstance(event, (FaqAdded, FaqUpdated, FaqDeleted)):
+            if self.faq_text:
+                self.load_section('faq')
+            else:
+                faq = self.db.records.faq(event.id, columns=('id', 'question', 'answer'))
+                self.put_row('faq', faq, event.id)
+            if not isinstance(event, FaqAdded):
+                self.update_answers(event.id)
+        elif isinstance(event, (QuestionAsked, QuestionAnswered, QuestionDeleted)):
+            q = self.db.records.question(event.id, columns=('user_id',) + self.QUESTION_COLUMNS)
+            if q is None or q.user_id == self.user_id:
+                self.put_row('questions', q, event.id)
+        elif isinstance(event, RatingAdded):
+            # Сводка оценок документа изменилась: строка обновляется или переезжает
+            if self.searched_query is None:
+                self.put_document(event.document_id)
+        elif isinstance(event, ChangesLost):
+            self.load_data()
+        elif isinstance(event, (DocumentsRestored, BulkInserted)):
+            entity = getattr(event, 'entity', 'documents')
+            if entity in ('documents', 'ratings') and self.searched_query is None:
+                self.load_documents()
+            elif entity in ('glossary', 'faq'):
+                self.load_section(entity)
+
+    def update_answers(self, faq_id):
+        """Перечитывает прочитанные вопросы, ответом на которые служит запись FAQ faq_id."""
+        model = self.questions_model
+        for row in range(model.rowCount()):
+            list_row = model.row_at(row)
+            if list_row is not None and list_row.data == faq_id:
+                model.put(self.db.records.question(list_row.id, columns=self.QUESTION_COLUMNS))
+
+    def put_document(self, doc_id):
+        """Обновляет строку документа doc_id в списке с учетом фильтров.
+
+        Подходит ли документ под подстроку, проверяет запрос к базе по его
+        тексту, поэтому при заданной подстроке список перечитывается.
+        """
+        if self.documents_text:
+            self.load_section('documents')
+            return
+        doc = self.db.records.document(doc_id, columns=self.DOCUMENT_COLUMNS)
+        if doc is not None and self.doc_type is not None and doc.doc_type != self.doc_type:
+            doc = None
+        self.put_row('documents', doc, doc_id)
+
+    def put_row(self, section, record, item_id):
+        """Обновляет по событию строку записи item_id; record=None - запись удалена."""
+        if not self.can_patch(section):
+            return
+        if record is None:
+            self.models[section].remove(item_id)
+        else:
+            self.models[section].put(record)
+
+    def closeEvent(self, event):
+        self.events.close()
+        super().closeEvent(event)
+
+    def set_search_results(self, documents, searched_query):
+        """Показывает в списке разделов результаты поиска.
+
+        documents - строки (id, title, doc_type, updated_at, version, фрагмент
+        с подсвеченными совпадениями) в порядке релевантности.
+        """
+        # Запрос, по которому получены результаты поиска: они уже ему соответствуют
+        self.searched_query = searched_query
+        self.search_results = [
+            ListRow(doc[0], doc[1], None, tooltip=doc[5], data=doc[2]) for doc in documents
+        ]
+        self.filter_documents()
+
+    def selected_doc_type(self):
+        """Возвращает тип документов, выбранный в фильтре, или None для всех."""
+        filter_type = self.filter_combo.currentText()
+        if filter_type == 'Все':
+            return None
+        return 'admin' if filter_type == 'Руководство администратора' else 'user'
 
     def filter_documents(self):
         """Фильтрует документы по типу и поисковому запросу."""
-        search_text = self.search_input.text().lower()
-        filter_type = self.filter_combo.currentText()
-        
-        self.sections_list.clear()
-        
-        for doc in self.all_documents:
-            # Фильтрация по типу
-            doc_type = 'Руководство администратора' if doc[7] == 'admin' else 'Руководство пользователя'
-            if filter_type != 'Все' and doc_type != filter_type:
-                continue
-                
-            # Фильтрация по поисковому запросу
-            if search_text and search_text not in doc[1].lower() and search_text not in doc[2].lower():
-                continue
-                
-            # Добавляем документ, если он прошел фильтрацию
-            self.sections_list.addItem(doc[1])  # doc[1] - title
+        self.doc_type = doc_type = self.selected_doc_type()
+        self.documents_text = self.search_input.text()
+        if self.searched_query is not None and self.documents_text == self.searched_query:
+            # Результаты поиска уже соответствуют запросу, остается фильтр по типу;
+            # список, который еще читается в фоне, их не заменит
+            self.loader.cancel('documents')
+            self.documents_model.set_rows(
+                row for row in self.search_results if doc_type is None or row.data == doc_type
+            )
+            return
+        # Новый текст в поле поиска сменяет результаты поиска списком документов,
+        # отфильтрованным в базе по подстроке в заголовке или тексте
+        self.searched_query = None
+        self.search_results = []
+        self.load_section('documents')
 
     def search_documents(self):
         """Выполняет поиск документов по запросу."""
         query = self.search_input.text()
         if not query:
-            self.load_data()
+            self.load_documents()
+            return
+            
+        if self.async_db is not None:
+            # Новый запрос отменяет поиск, результаты которого уже не нужны
+            self.async_db.latest('search', self.search_documents_async(query))
             return
             
         try:
-            documents = self.db.search_documents(query)
-            self.all_documents = documents  # Обновляем список всех документов
-            self.filter_documents()  # Применяем фильтрацию
+            self.show_search_results(query, self.db.search_documents(query))
         except Exception as e:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при поиске: {str(e)}')
 
-    def load_document(self, item):
+    async def search_documents_async(self, query):
+        """Ищет документы в пуле AsyncDatabase и показывает результаты."""
         try:
-            documents = self.db.get_all_documents()
-            for doc in documents:
-                if doc[1] == item.text():  # doc[1] - title
-                    self.current_doc_id = doc[0]
-                    self.doc_title.setText(doc[1])
-                    self.doc_content.setMarkdown(doc[2])  # doc[2] - content
-                    break
+            results = await self.async_db.search_documents(query, timeout=SEARCH_TIMEOUT)
+        except asyncio.TimeoutError:
+            QMessageBox.warning(self, 'Ошибка', 'Поиск занял слишком много времени, уточните запрос')
+        except Exception as e:
+            QMessageBox.warning(self, 'Ошибка', f'Ошибка при поиске: {str(e)}')
+        else:
+            self.show_search_results(query, results)
+
+    def show_search_results(self, query, results):
+        # Результаты приходят в порядке релевантности; тексты в списке не храним
+        self.set_search_results(
+            [(doc[0], doc[1], doc[7], doc[5], doc[3], doc[8]) for doc in results], query
+        )
+
+    def load_document(self, index):
+        doc_id = index.data(Qt.ItemDataRole.UserRole)
+        if self.async_db is not None:
+            # Открыт будет последний выбранный документ
+            self.async_db.latest('document', self.load_document_async(doc_id, index.data()))
+            return
+            
+        try:
+            # Текст читаем только для выбранного документа
+            self.show_document(doc_id, index.data(), self.db.get_document_content(doc_id))
         except Exception as e:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при загрузке документа: {str(e)}')
 
+    async def load_document_async(self, doc_id, title):
+        """Читает текст документа в пуле AsyncDatabase и показывает его."""
+        try:
+            content = await self.async_db.get_document_content(doc_id, timeout=SEARCH_TIMEOUT)
+        except asyncio.TimeoutError:
+            QMessageBox.warning(self, 'Ошибка', 'Документ загружается слишком долго')
+        except Exception as e:
+            QMessageBox.warning(self, 'Ошибка', f'Ошибка при загрузке документа: {str(e)}')
+        else:
+            self.show_document(doc_id, title, content)
+
+    def show_document(self, doc_id, title, content):
+        if content is None:
+            QMessageBox.warning(self, 'Ошибка', 'Документ не найден')
+            return
+        self.current_doc_id = doc_id
+        self.doc_title.setText(title)
+        self.doc_content.setMarkdown(content)
+
     def rate_document(self):
         if not self.current_doc_id:
             QMessageBox.warning(self, 'Ошибка', 'Сначала выберите документ')
@@ -282,7 +547,6 @@ class UserWindow(QMainWindow):
             )
             QMessageBox.information(self, 'Успех', 'Ваш вопрос отправлен')
             self.question_input.clear()
-            self.load_data()  # Обновляем список вопросов
         except Exception as e:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при отправке вопроса: {str(e)}')
 
@@ -324,22 +588,12 @@ class UserWindow(QMainWindow):
 
     def filter_glossary(self):
         """Фильтрует термины глоссария по поисковому запросу."""
-        search_text = self.glossary_search_input.text().lower()
-        
-        self.glossary_list.clear()
-        
-        for term in self.all_terms:
-            # Если поисковый запрос пустой или найден в термине или определении
-            if not search_text or search_text in term[1].lower() or search_text in term[2].lower():
-                self.glossary_list.addItem(f"{term[1]}: {term[2]}")  # term[1] - term name, term[2] - definition 
+        # Если поисковый запрос пустой или найден в термине или определении
+        self.glossary_text = self.glossary_search_input.text()
+        self.load_section('glossary')
 
     def filter_faq(self):
         """Фильтрует FAQ по поисковому запросу."""
-        search_text = self.faq_search_input.text().lower()
-        
-        self.faq_list.clear()
-        
-        for faq in self.all_faqs:
-            # Если поисковый запрос пустой или найден в вопросе или ответе
-            if not search_text or search_text in faq[1].lower() or search_text in faq[2].lower():
-                self.faq_list.addItem(f"Q: {faq[1]}\nA: {faq[2]}")  # faq[1] - question, faq[2] - answer 
\ No newline at end of file
+        # Если поисковый запрос пустой или найден в вопросе или ответе
+        self.faq_text = self.faq_search_input.text()
+        self.load_section('faq')
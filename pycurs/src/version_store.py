@@ -0,0 +1,74 @@
+"""Дельта-сжатие версий документов.
+
+Версии документа образуют цепочку: периодически сохраняется полный текст
+(опорная версия), а между ними - сжатая построчная разница с предыдущей
+версией. Чтобы восстановить любую версию, нужно применить не больше
+KEYFRAME_INTERVAL - 1 разниц к ближайшей опорной версии.
+
+Полные тексты опорных версий лежат в таблице content_blobs под своим
+SHA-256 и хранятся один раз, сколько бы версий на них ни ссылалось.
+"""
+import difflib
+import hashlib
+import json
+import zlib
+
+# Каждая KEYFRAME_INTERVAL-я версия в цепочке хранится целиком
+KEYFRAME_INTERVAL = 16
+
+# Разница, которая не меньше этой доли от полного текста, не дает выигрыша
+MAX_DELTA_RATIO = 0.5
+
+
+def make_delta(base, content):
+    """Возвращает сжатую построчную разницу, превращающую base в content."""
+    base_lines = base.splitlines(keepends=True)
+    new_lines = content.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+    # Операции: [начало, конец) - скопировать строки base, строка - вставить текст
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j1 < j2:
+            ops.append(''.join(new_lines[j1:j2]))
+    return zlib.compress(json.dumps(ops, ensure_ascii=False).encode('utf-8'))
+
+
+def apply_delta(base, delta):
+    """Восстанавливает текст по базовой версии и разнице из make_delta."""
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(zlib.decompress(delta).decode('utf-8')):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_lines[op[0]:op[1]])
+    return ''.join(parts)
+
+
+def encode_version(base, base_depth, content):
+    """Решает, как сохранить новую версию после base.
+
+    Возвращает (content, delta, depth): для опорной версии delta равна None,
+    а content - полный текст; иначе content пуст, а delta - разница с base.
+    """
+    if base is None or base_depth + 1 >= KEYFRAME_INTERVAL:
+        return content, None, 0
+    delta = make_delta(base, content)
+    if len(delta) >= len(content.encode('utf-8')) * MAX_DELTA_RATIO:
+        return content, None, 0
+    return '', delta, base_depth + 1
+
+
+def content_digest(content):
+    """Возвращает ключ текста в хранилище content_blobs."""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def compress_blob(content):
+    return zlib.compress(content.encode('utf-8'))
+
+
+def decompress_blob(data):
+    return zlib.decompress(data).decode('utf-8')
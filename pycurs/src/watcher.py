@@ -0,0 +1,41 @@
+"""Обнаружение изменений базы, сделанных другими процессами.
+
+С одним файлом documentation.db могут работать несколько рабочих мест.
+ChangeWatcher по таймеру Qt вызывает Database.sync_external_changes(): пока
+база не менялась, опрос стоит одного PRAGMA data_version, а изменения
+других процессов приходят окнам теми же событиями db.events, что и свои,
+и обновляют только затронутые строки. Стоимость опроса: python src/benchmark.py watch
+
+Пример:
+    watcher = ChangeWatcher(db)
+    ...
+    watcher.stop()
+"""
+import logging
+import sqlite3
+
+from PyQt6.QtCore import QObject, QTimer
+
+logger = logging.getLogger(__name__)
+
+# Период опроса базы, мс
+POLL_INTERVAL = 1000
+
+
+class ChangeWatcher(QObject):
+    def __init__(self, db, interval=POLL_INTERVAL, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.poll)
+        self.timer.start(interval)
+
+    def poll(self):
+        try:
+            self.db.sync_external_changes()
+        except sqlite3.Error:
+            # База занята или недоступна: проверим на следующем срабатывании
+            logger.warning('Не удалось проверить изменения базы', exc_info=True)
+
+    def stop(self):
+        self.timer.stop()
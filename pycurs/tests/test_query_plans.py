@@ -0,0 +1,202 @@
+"""Проверка планов горячих запросов: они должны идти по индексам.
+
+Каждый тест выполняет метод Database, собирает отправленные им SELECT-запросы
+и проверяет их EXPLAIN QUERY PLAN. Полный проход по таблице (SCAN) или
+сортировка во временном B-дереве (TEMP B-TREE) означают, что запрос замедлится
+вместе с ростом базы, и тест падает.
+
+Запуск: python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from database import Database  # noqa: E402
+
+# Таблицы истории и их псевдонимы в запросах: проход по ним растет вместе с историей
+HISTORY_TABLES = {'document_versions', 'dv', 'v', 'system_versions', 'sv',
+                  'system_version_manifest'}
+
+
+def scans_or_sorts(step):
+    """Шаг плана без индекса: полный проход или сортировка во временном B-дереве."""
+    return step.startswith('SCAN') or 'TEMP B-TREE' in step
+
+
+def scans_history(step):
+    """Полный проход по таблице истории.
+
+    Для запросов, которые по смыслу обходят все документы (восстановление,
+    снимок по времени): проход по documents и по списку из параметра допустим,
+    а версии должны искаться по индексу.
+    """
+    return step.startswith('SCAN ') and step.split()[1] in HISTORY_TABLES
+
+
+def scans_table(step):
+    """Полный проход по обычной таблице.
+
+    Для фильтра по подстроке и полнотекстового поиска: кандидаты читаются
+    из виртуальной таблицы FTS5, а сортировка во временном B-дереве допустима -
+    в нее попадает не больше records.FILTER_LOOKUP_ROWS строк.
+    """
+    return (step.startswith('SCAN ') and 'VIRTUAL TABLE' not in step
+            and not step.split()[1].startswith('('))
+
+
+def scans_outside_fts(step):
+    """Шаг плана без индекса, кроме чтения виртуальной таблицы FTS5."""
+    return scans_or_sorts(step) and 'VIRTUAL TABLE' not in step
+
+
+class QueryPlanTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.db = db = Database(os.path.join(cls.tmp.name, 'plans.db'))
+        cls.admin_id = db.add_user('admin', 'admin', True)
+        users = [db.add_user(f'user{i}', 'user', False) for i in range(5)]
+        cls.doc_ids = [db.add_document(f'Документ {i}', f'Содержание {i}', cls.admin_id)
+                       for i in range(30)]
+        cls.doc_id = cls.doc_ids[0]
+        for i in range(20):
+            db.update_document(cls.doc_id, f'Содержание {i}', cls.admin_id)
+            db.add_user_question(users[i % len(users)], f'Вопрос {i}')
+        for user_id in users:
+            db.add_rating(cls.doc_id, user_id, 5)
+        for i in range(30):
+            db.add_glossary_term(f'Термин {i}', f'Определение {i}', cls.admin_id)
+            db.add_faq(f'Вопрос {i}', f'Ответ {i}', cls.admin_id)
+        cls.version_id = db.create_new_version('1.1', 'Описание', 'Изменения', cls.admin_id)
+        db.add_version_change(cls.version_id, 'update', 'document', cls.doc_id, 'Изменение')
+        db.update_document(cls.doc_ids[1], 'Новое содержание', cls.admin_id)
+        db.create_new_version('1.2', 'Описание', 'Изменения', cls.admin_id)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.close()
+        cls.tmp.cleanup()
+
+    def plans(self, func):
+        """Выполняет func и возвращает планы отправленных ею SELECT-запросов."""
+        conn = self.db._get_connection()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            func()
+        finally:
+            conn.set_trace_callback(None)
+        return [(sql, [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)])
+                for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+
+    def assertIndexed(self, func, is_bad=scans_or_sorts):
+        plans = self.plans(func)
+        self.assertTrue(plans, 'метод не отправил ни одного SELECT')
+        for sql, plan in plans:
+            bad = [step for step in plan if is_bad(step)]
+            self.assertFalse(bad, f"запрос без индекса: {'; '.join(plan)}\n{sql}")
+
+    # Страницы списков окон (list_models.py): чтение по ключу без сортировки
+
+    def test_documents_page(self):
+        self.assertIndexed(lambda: self.db.records.documents(
+            columns=('id', 'title'), after=('Документ', self.doc_id), limit=200))
+
+    def test_documents_page_by_rating(self):
+        self.assertIndexed(lambda: self.db.records.documents(
+            columns=('id', 'title', 'rating_average'), after=(5.0, self.doc_id), limit=200,
+            by_rating=True))
+
+    def test_document_versions_page(self):
+        self.assertIndexed(lambda: self.db.records.document_versions(
+            self.doc_id, columns=('id', 'version'), after=(10,), limit=200))
+
+    def test_glossary_page(self):
+        self.assertIndexed(lambda: self.db.records.glossary_terms(
+            after=('Термин', 1), limit=200))
+
+    def test_faq_page(self):
+        self.assertIndexed(lambda: self.db.records.faqs(after=('Вопрос', 1), limit=200))
+
+    def test_questions_page(self):
+        self.assertIndexed(lambda: self.db.records.questions(
+            columns=('id', 'question', 'created_at'), after=('2100-01-01', 0), limit=200))
+
+    def test_users_page(self):
+        self.assertIndexed(lambda: self.db.records.users(after=(1,), limit=200))
+
+    def test_system_versions_page(self):
+        self.assertIndexed(lambda: self.db.records.system_versions(
+            columns=('id', 'version_number', 'username', 'change_count'),
+            after=(self.version_id + 2,), limit=200))
+
+    def test_versions_page(self):
+        self.assertIndexed(lambda: self.db.get_versions_page(self.version_id + 2))
+
+    # Фильтр при вводе берет кандидатов из триграммных индексов
+
+    def test_documents_filter(self):
+        self.assertIndexed(lambda: self.db.records.documents(
+            columns=('id', 'title'), text='документ', after=('Документ', self.doc_id),
+            limit=200), scans_table)
+
+    def test_documents_short_filter(self):
+        self.assertIndexed(lambda: self.db.records.documents(
+            columns=('id', 'title'), text='д', after=('Документ', self.doc_id), limit=200),
+            scans_table)
+
+    def test_glossary_filter(self):
+        self.assertIndexed(lambda: self.db.records.glossary_terms(
+            text='мин', after=('Термин', 1), limit=200), scans_table)
+
+    def test_faq_filter(self):
+        self.assertIndexed(lambda: self.db.records.faqs(
+            text='вет', after=('Вопрос', 1), limit=200), scans_table)
+
+    def test_search(self):
+        self.assertIndexed(lambda: self.db.search_documents('содержание', limit=20),
+                           scans_outside_fts)
+
+    # Оценки и вопросы
+
+    def test_document_ratings(self):
+        self.assertIndexed(lambda: self.db.get_document_ratings(self.doc_id))
+
+    def test_rating_summary(self):
+        self.assertIndexed(lambda: self.db.get_rating_summary(self.doc_ids))
+
+    def test_user_questions(self):
+        self.assertIndexed(self.db.get_user_questions)
+
+    def test_user_questions_with_answers(self):
+        self.assertIndexed(lambda: self.db.get_user_questions_with_answers(self.admin_id))
+
+    # История версий
+
+    def test_document_versions(self):
+        self.assertIndexed(lambda: self.db.get_document_versions(self.doc_id))
+        # Тексты опорных версий читаются тем же запросом, а не по одному на версию
+        self.assertEqual(len(self.plans(lambda: self.db.get_document_versions(self.doc_id))), 1)
+
+    def test_version_changes(self):
+        self.assertIndexed(lambda: self.db.get_version_changes(self.version_id))
+
+    # Восстановление и снимок по времени проходят по документам, но не по истории
+
+    def test_documents_as_of(self):
+        self.assertIndexed(lambda: self.db.get_documents_as_of(datetime.now()), scans_history)
+
+    def test_restore_preview(self):
+        self.assertIndexed(lambda: self.db.get_restore_preview(self.version_id), scans_history)
+
+    def test_restore(self):
+        self.assertIndexed(lambda: self.db.restore_system_to_version(self.version_id),
+                           scans_history)
+
+
+if __name__ == '__main__':
+    unittest.main()